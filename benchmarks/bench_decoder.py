@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+MIoTMediaDecoder throughput on synthetic streams, no camera or cloud login needed.
+Frames are pushed from a feeder thread like the native raw data callback, at line rate (as fast as
+possible, the ring buffer drops what the decoder cannot keep up with) or paced by their timestamps.
+Latency is measured from the push of a video frame to its decoded output reaching the event loop.
+
+    python benchmarks/bench_decoder.py --codec hevc --width 1920 --height 1080 --duration 10 --output jpeg
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import psutil
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from synthetic import AUDIO_CODECS, VIDEO_CODECS, gen_audio_frames, gen_video_frames, interleave
+
+from miloco_sdk.utils.decoder import MIoTMediaDecoder, MIoTMediaEncodePool
+from miloco_sdk.utils.dispatcher import MIoTCallbackDispatcher
+from miloco_sdk.utils.types import (
+    MIoTCameraDecodePolicy,
+    MIoTCameraImageFormat,
+    MIoTCameraPixelFormat,
+    MIoTCameraVariant,
+)
+
+OUTPUTS = ["none"] + [item.value for item in MIoTCameraImageFormat] + [item.value for item in MIoTCameraPixelFormat]
+
+
+class ResourceSampler(threading.Thread):
+    """Sample the process RSS, the CPU time is taken from the start and stop snapshots."""
+
+    def __init__(self, interval: float = 0.1) -> None:
+        super().__init__(daemon=True)
+        self._process = psutil.Process()
+        self._interval = interval
+        self._running = True
+        self.peak_rss = 0
+        self._cpu_start = self._process.cpu_times()
+        self.cpu_time = 0.0
+
+    def run(self) -> None:
+        while self._running:
+            self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+            time.sleep(self._interval)
+
+    def stop(self) -> None:
+        self._running = False
+        self.join()
+        cpu_end = self._process.cpu_times()
+        self.cpu_time = (cpu_end.user - self._cpu_start.user) + (cpu_end.system - self._cpu_start.system)
+
+
+async def run(stream, args, realtime: bool) -> Dict:
+    loop = asyncio.get_running_loop()
+    dispatcher = MIoTCallbackDispatcher(main_loop=loop)
+    dispatcher.start()
+    pool: Optional[MIoTMediaEncodePool] = None
+    if args.encode_workers > 0:
+        pool = MIoTMediaEncodePool(worker_count=args.encode_workers)
+        pool.start()
+
+    # key: video timestamp, value: push time
+    push_ts: Dict[int, float] = {}
+    latencies: List[float] = []
+    pcm_chunks: List[int] = [0]
+
+    async def on_output(variant, data, ts, channel):
+        pushed = push_ts.get(ts)
+        if pushed is not None:
+            latencies.append(time.perf_counter() - pushed)
+
+    async def on_pcm(data, ts, channel):
+        pcm_chunks[0] += 1
+
+    decoder = MIoTMediaDecoder(
+        frame_interval=args.frame_interval,
+        video_callback=on_output,
+        audio_callback=on_pcm,
+        enable_audio=args.audio != "none",
+        main_loop=loop,
+        frame_callback=on_output,
+        decode_policy=MIoTCameraDecodePolicy(args.decode_policy),
+        dispatcher=dispatcher,
+        encode_pool=pool,
+    )
+    if args.output == "none":
+        decoder.update_outputs({})
+    else:
+        output = (
+            MIoTCameraImageFormat(args.output)
+            if args.output in {item.value for item in MIoTCameraImageFormat}
+            else MIoTCameraPixelFormat(args.output)
+        )
+        decoder.update_outputs(
+            {MIoTCameraVariant.create(output, args.quality, args.max_width, args.max_height): args.frame_interval}
+        )
+    decoder.daemon = True
+    decoder.start()
+
+    def feed() -> None:
+        start = time.perf_counter()
+        for is_video, frame_data in stream:
+            if realtime:
+                delay = start + frame_data.timestamp / 1000 - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            if is_video:
+                push_ts[frame_data.timestamp] = time.perf_counter()
+                decoder.push_video_frame(frame_data)
+            else:
+                decoder.push_audio_frame(frame_data)
+
+    sampler = ResourceSampler()
+    sampler.start()
+    start = time.perf_counter()
+    await loop.run_in_executor(None, feed)
+    # Drain the decoder and the encode stage
+    while decoder.pending or (pool and pool.pending):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - start - 0.2
+    sampler.stop()
+
+    decoded: int = decoder.decode_timer.stats("decode").count
+    decoder.stop()
+    if pool:
+        pool.stop()
+    await dispatcher.stop_async()
+    return {
+        "mode": "realtime" if realtime else "line",
+        "pushed": sum(1 for is_video, _ in stream if is_video),
+        "decoded": decoded,
+        "outputs": len(latencies),
+        "fps": decoded / elapsed,
+        "latency": np.percentile(np.array(latencies) * 1000, [50, 90, 99]) if latencies else [0, 0, 0],
+        "dropped": decoder.dropped_frames + (pool.dropped if pool else 0),
+        "pcm": pcm_chunks[0],
+        "cpu": sampler.cpu_time / elapsed * 100,
+        "rss": sampler.peak_rss / 1024 / 1024,
+    }
+
+
+async def main_async(args) -> None:
+    count: int = int(args.duration * args.fps)
+    print(
+        f"encoding {count} frames of {args.width}x{args.height} {args.codec} at {args.fps} fps,"
+        f" gop {args.gop}, {args.bitrate // 1000} kbps, audio {args.audio}"
+    )
+    video = gen_video_frames(
+        codec=args.codec,
+        width=args.width,
+        height=args.height,
+        fps=args.fps,
+        gop=args.gop,
+        bitrate=args.bitrate,
+        count=count,
+    )
+    audio = gen_audio_frames(codec=args.audio, duration=args.duration) if args.audio != "none" else []
+    stream = interleave(video, audio)
+
+    modes = ["line", "realtime"] if args.mode == "both" else [args.mode]
+    print(
+        f"{'mode':<9} {'pushed':>7} {'decoded':>8} {'outputs':>8} {'fps':>8} {'p50 ms':>8} {'p90 ms':>8}"
+        f" {'p99 ms':>8} {'dropped':>8} {'pcm':>6} {'cpu %':>7} {'rss MB':>8}"
+    )
+    for mode in modes:
+        result = await run(stream, args, realtime=mode == "realtime")
+        p50, p90, p99 = result["latency"]
+        print(
+            f"{result['mode']:<9} {result['pushed']:>7} {result['decoded']:>8} {result['outputs']:>8}"
+            f" {result['fps']:>8.1f} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} {result['dropped']:>8}"
+            f" {result['pcm']:>6} {result['cpu']:>7.1f} {result['rss']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codec", choices=list(VIDEO_CODECS.keys()), default="h264")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--gop", type=int, default=40)
+    parser.add_argument("--bitrate", type=int, default=2_000_000)
+    parser.add_argument("--duration", type=float, default=10, help="stream seconds")
+    parser.add_argument("--audio", choices=["none"] + list(AUDIO_CODECS.keys()), default="none")
+    parser.add_argument("--mode", choices=["line", "realtime", "both"], default="both")
+    parser.add_argument("--output", choices=OUTPUTS, default="jpeg")
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--max-width", type=int, default=0)
+    parser.add_argument("--max-height", type=int, default=0)
+    parser.add_argument("--frame-interval", type=int, default=0, help="ms between outputs")
+    parser.add_argument("--encode-workers", type=int, default=1, help="0 encodes in the decode thread")
+    parser.add_argument("--decode-policy", choices=[item.value for item in MIoTCameraDecodePolicy], default="all")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Video decode throughput and output delay per MIoTCameraDecoderOptions, synthetic 1080p hevc by default.
+The output delay is the number of packets fed before the first frame comes out, frame threading adds
+up to thread_count frames.
+
+    python benchmarks/bench_decoder_options.py --codec hevc --width 1920 --height 1080 --count 120
+"""
+import argparse
+import os
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+from av.codec import CodecContext
+from av.packet import Packet
+from av.video.frame import VideoFrame
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from miloco_sdk.utils.decoder import _create_video_codec
+from miloco_sdk.utils.types import (
+    MIoTCameraCodec,
+    MIoTCameraDecodeDiscard,
+    MIoTCameraDecoderOptions,
+    MIoTCameraDecodeThreadType,
+)
+
+SETTINGS = {
+    "default": MIoTCameraDecoderOptions(),
+    "single": MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.NONE, thread_count=1),
+    "slice": MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.SLICE, thread_count=0),
+    "frame": MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.FRAME, thread_count=0),
+    "frame+slice": MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.AUTO, thread_count=0),
+    "low_delay": MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.SLICE, low_delay=True),
+    "preview": MIoTCameraDecoderOptions(
+        thread_type=MIoTCameraDecodeThreadType.AUTO,
+        skip_loop_filter=MIoTCameraDecodeDiscard.ALL,
+        fast=True,
+    ),
+    "nonref": MIoTCameraDecoderOptions(
+        thread_type=MIoTCameraDecodeThreadType.AUTO, skip_frame=MIoTCameraDecodeDiscard.NONREF
+    ),
+}
+
+
+def encode(codec: str, width: int, height: int, count: int, gop: int):
+    """Encode a moving gradient, the packets are camera packets without container."""
+    encoder = CodecContext.create("libx265" if codec == "hevc" else "libx264", "w")
+    encoder.width = width
+    encoder.height = height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, 25)
+    encoder.gop_size = gop
+    encoder.max_b_frames = 0
+    if codec == "hevc":
+        encoder.options = {"x265-params": f"keyint={gop}:min-keyint={gop}:scenecut=0:log-level=error"}
+    else:
+        encoder.options = {"tune": "zerolatency", "sc_threshold": "0"}
+    encoder.open()
+    base = np.add.outer(np.arange(height) // 4, np.arange(width) // 4).astype(np.uint8)
+    packets = []
+    for i in range(count):
+        img = np.stack([base + i, base + 2 * i, base - i], axis=-1)
+        frame = VideoFrame.from_ndarray(img, format="rgb24").reformat(format="yuv420p")
+        frame.pts = i
+        packets.extend(bytes(pkt) for pkt in encoder.encode(frame))
+    packets.extend(bytes(pkt) for pkt in encoder.encode(None))
+    return packets
+
+
+def run(codec_id: int, packets, options: MIoTCameraDecoderOptions):
+    codec = _create_video_codec(codec_id, options)
+    decoded: int = 0
+    first_output: int = -1
+    start = time.perf_counter()
+    for index, data in enumerate(packets):
+        frames = codec.decode(Packet(data))
+        if frames and first_output < 0:
+            first_output = index + 1
+        decoded += len(frames)
+    decoded += len(codec.decode(None))
+    elapsed = time.perf_counter() - start
+    return decoded, elapsed, first_output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codec", choices=["hevc", "h264"], default="hevc")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--count", type=int, default=120)
+    parser.add_argument("--gop", type=int, default=50)
+    parser.add_argument("--settings", nargs="*", default=list(SETTINGS.keys()), choices=list(SETTINGS.keys()))
+    args = parser.parse_args()
+
+    print(f"encoding {args.count} frames of {args.width}x{args.height} {args.codec}, cpu {os.cpu_count()}")
+    packets = encode(args.codec, args.width, args.height, args.count, args.gop)
+    codec_id = MIoTCameraCodec.VIDEO_H265 if args.codec == "hevc" else MIoTCameraCodec.VIDEO_H264
+    print(f"{'setting':<12} {'frames':>7} {'fps':>9} {'ms/frame':>9} {'delay':>6}")
+    for name in args.settings:
+        decoded, elapsed, first_output = run(codec_id, packets, SETTINGS[name])
+        print(
+            f"{name:<12} {decoded:>7} {decoded / elapsed:>9.1f} {elapsed * 1000 / max(1, decoded):>9.2f}"
+            f" {first_output:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Callback thread time per frame, pydantic MIoTCameraFrameData vs the MIoTCameraFrame tuple,
+with the payload copied by string_at or into the pooled slabs.
+
+    python benchmarks/bench_frame_record.py --count 100000
+"""
+import argparse
+import os
+import sys
+import timeit
+from ctypes import POINTER, c_uint8, cast, create_string_buffer, string_at
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from miloco_sdk.plugin.miot.camera import _MIoTCameraFrameHeaderC
+from miloco_sdk.utils.decoder import MIoTMediaBufferPool
+from miloco_sdk.utils.types import MIoTCameraCodec, MIoTCameraFrame, MIoTCameraFrameData, MIoTCameraFrameType
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--size", type=int, default=4096, help="payload bytes")
+    args = parser.parse_args()
+
+    header = _MIoTCameraFrameHeaderC(MIoTCameraCodec.VIDEO_H264, args.size, 123456, 1, 0, 0)
+    header_ptr = POINTER(_MIoTCameraFrameHeaderC)(header)
+    data = cast(create_string_buffer(args.size), POINTER(c_uint8))
+
+    def pydantic_record():
+        frame_header = header_ptr.contents
+        return MIoTCameraFrameData(
+            codec_id=MIoTCameraCodec(frame_header.codec_id),
+            length=frame_header.length,
+            timestamp=frame_header.timestamp,
+            sequence=frame_header.sequence,
+            frame_type=MIoTCameraFrameType(frame_header.frame_type),
+            channel=frame_header.channel,
+            data=string_at(data, frame_header.length),
+        )
+
+    def tuple_record():
+        frame_header = header_ptr.contents
+        return MIoTCameraFrame(
+            frame_header.codec_id,
+            frame_header.length,
+            frame_header.timestamp,
+            frame_header.sequence,
+            frame_header.frame_type,
+            frame_header.channel,
+            string_at(data, frame_header.length),
+        )
+
+    pool = MIoTMediaBufferPool()
+
+    def pooled_record():
+        frame_header = header_ptr.contents
+        return MIoTCameraFrame(
+            frame_header.codec_id,
+            frame_header.length,
+            frame_header.timestamp,
+            frame_header.sequence,
+            frame_header.frame_type,
+            frame_header.channel,
+            pool.copy(data, frame_header.length),
+        )
+
+    for name, func in (("pydantic", pydantic_record), ("tuple", tuple_record), ("pooled", pooled_record)):
+        cost = min(timeit.repeat(func, number=args.count, repeat=5)) / args.count
+        print(f"{name:>8}: {cost * 1e6:.3f} us/frame")
+
+
+if __name__ == "__main__":
+    main()
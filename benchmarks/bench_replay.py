@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End to end load of many cameras on MIoTCameraReplayLib, no camera or cloud login needed.
+Every camera replays the same synthetic stream (or a frame file) through MIoTCamera with jpeg subscribers,
+random disconnects exercise the reconnect logic.
+
+    python benchmarks/bench_replay.py --cameras 100 --duration 30 --disconnect-interval 20 --decode-workers 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Dict
+
+import psutil
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from synthetic import VIDEO_CODECS, gen_video_frames
+
+from miloco_sdk.plugin.miot.camera import MIoTCamera
+from miloco_sdk.plugin.miot.replay import MIoTCameraReplayLib, MIoTCameraReplaySource
+from miloco_sdk.utils.types import MIoTCameraDecodePolicy, MIoTCameraStatus
+
+
+def camera_info(did: str) -> Dict:
+    return {
+        "did": did,
+        "name": f"replay {did}",
+        "uid": "0",
+        "urn": "urn:miot-spec-v2:device:camera:0000A01C:replay:1",
+        "model": "replay.camera.v1",
+        "manufacturer": "replay",
+        "connect_type": 0,
+        "pid": 0,
+        "token": "",
+        "online": True,
+        "voice_ctrl": 0,
+        "order_time": 0,
+        "channel_count": 1,
+        "camera_status": MIoTCameraStatus.DISCONNECTED,
+    }
+
+
+async def main_async(args) -> None:
+    if args.source:
+        source = MIoTCameraReplaySource.from_file(args.source)
+    else:
+        source = MIoTCameraReplaySource(
+            gen_video_frames(codec=args.codec, width=args.width, height=args.height, fps=args.fps, count=args.fps * 10)
+        )
+    lib = MIoTCameraReplayLib(
+        source, connect_delay=args.connect_delay, disconnect_interval=args.disconnect_interval, seed=0
+    )
+    miot_camera = MIoTCamera(
+        cloud_server="cn",
+        access_token="replay",
+        lib_miot_camera=lib,
+        decode_workers=args.decode_workers,
+        encode_workers=args.encode_workers,
+    )
+    jpegs: Dict[str, int] = {}
+    connects: Dict[str, int] = {}
+    disconnects: Dict[str, int] = {}
+
+    async def on_jpeg(did: str, data: bytes, ts: int, channel: int) -> None:
+        jpegs[did] = jpegs.get(did, 0) + 1
+
+    async def on_status(did: str, status: MIoTCameraStatus) -> None:
+        if status == MIoTCameraStatus.CONNECTED:
+            connects[did] = connects.get(did, 0) + 1
+        elif status == MIoTCameraStatus.DISCONNECTED:
+            disconnects[did] = disconnects.get(did, 0) + 1
+
+    process = psutil.Process()
+    cpu_start = process.cpu_times()
+    start = time.perf_counter()
+    for index in range(args.cameras):
+        camera = await miot_camera.create_camera_async(
+            camera_info(str(index)),
+            frame_interval=args.frame_interval,
+            decode_policy=MIoTCameraDecodePolicy(args.decode_policy),
+        )
+        await camera.register_status_changed_async(on_status)
+        await camera.register_decode_jpg_async(on_jpeg)
+        await camera.start_async(enable_reconnect=True)
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - start
+    cpu_end = process.cpu_times()
+    await miot_camera.deinit_async()
+
+    cpu: float = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    print(f"cameras {args.cameras}, {elapsed:.1f} s, replayed frames {lib.delivered}")
+    print(f"jpeg {sum(jpegs.values())}, {sum(jpegs.values()) / elapsed:.1f}/s, cameras with jpeg {len(jpegs)}")
+    print(f"connects {sum(connects.values())}, disconnects {sum(disconnects.values())}")
+    print(f"cpu {cpu / elapsed * 100:.1f} %, rss {process.memory_info().rss / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cameras", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--source", help="frame file, synthetic stream by default")
+    parser.add_argument("--codec", choices=list(VIDEO_CODECS.keys()), default="h264")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--frame-interval", type=int, default=1000, help="ms between jpeg")
+    parser.add_argument("--decode-policy", choices=[item.value for item in MIoTCameraDecodePolicy], default="all")
+    parser.add_argument("--decode-workers", type=int, default=0)
+    parser.add_argument("--encode-workers", type=int, default=1)
+    parser.add_argument("--connect-delay", type=float, default=0.2)
+    parser.add_argument("--disconnect-interval", type=float, default=0, help="mean seconds, 0 never disconnects")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic camera streams for the benchmarks, encoded with PyAV and wrapped as MIoTCameraFrame
+the way the raw data callback of the camera does, no camera or cloud login needed.
+Run as a script to write a frame file for MIoTCameraReplaySource:
+
+    python benchmarks/synthetic.py camera.miot --codec hevc --duration 10 --audio opus
+"""
+import argparse
+import os
+import sys
+from fractions import Fraction
+from typing import List, Tuple
+
+import numpy as np
+from av.audio.frame import AudioFrame
+from av.codec import CodecContext
+from av.video.frame import VideoFrame
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from miloco_sdk.plugin.miot.replay import dump_frames
+from miloco_sdk.utils.types import MIoTCameraCodec, MIoTCameraFrame, MIoTCameraFrameType
+
+VIDEO_CODECS = {"h264": MIoTCameraCodec.VIDEO_H264, "hevc": MIoTCameraCodec.VIDEO_H265}
+AUDIO_CODECS = {
+    "opus": MIoTCameraCodec.AUDIO_OPUS,
+    "g711a": MIoTCameraCodec.AUDIO_G711A,
+    "g711u": MIoTCameraCodec.AUDIO_G711U,
+}
+
+
+def gen_video_frames(
+    codec: str = "h264",
+    width: int = 1280,
+    height: int = 720,
+    fps: int = 20,
+    gop: int = 40,
+    bitrate: int = 2_000_000,
+    count: int = 200,
+    channel: int = 0,
+) -> List[MIoTCameraFrame]:
+    """Encode a moving gradient with a moving box, I frames every gop frames and no B frames like the cameras."""
+    encoder = CodecContext.create("libx265" if codec == "hevc" else "libx264", "w")
+    encoder.width = width
+    encoder.height = height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, fps)
+    encoder.framerate = Fraction(fps, 1)
+    encoder.gop_size = gop
+    encoder.max_b_frames = 0
+    encoder.bit_rate = bitrate
+    if codec == "hevc":
+        encoder.options = {"x265-params": f"keyint={gop}:min-keyint={gop}:scenecut=0:bframes=0:log-level=error"}
+    else:
+        encoder.options = {"tune": "zerolatency", "sc_threshold": "0"}
+    encoder.open()
+
+    base = np.add.outer(np.arange(height) // 4, np.arange(width) // 4).astype(np.uint8)
+    box: int = max(16, min(width, height) // 8)
+    packets = []
+    for i in range(count):
+        img = np.stack([base + i % 256, base + 2 * i % 256, base - i % 256], axis=-1)
+        x: int = (i * 8) % max(1, width - box)
+        y: int = (i * 4) % max(1, height - box)
+        img[y : y + box, x : x + box] = 255
+        frame = VideoFrame.from_ndarray(img, format="rgb24").reformat(format="yuv420p")
+        frame.pts = i
+        packets.extend(encoder.encode(frame))
+    packets.extend(encoder.encode(None))
+    return [
+        MIoTCameraFrame(
+            codec_id=VIDEO_CODECS[codec],
+            length=pkt.size,
+            timestamp=index * 1000 // fps,
+            sequence=index,
+            frame_type=MIoTCameraFrameType.FRAME_I if pkt.is_keyframe else MIoTCameraFrameType.FRAME_P,
+            channel=channel,
+            data=bytes(pkt),
+        )
+        for index, pkt in enumerate(packets)
+    ]
+
+
+def gen_audio_frames(codec: str = "opus", duration: float = 10, channel: int = 0) -> List[MIoTCameraFrame]:
+    """Encode a 440 Hz tone, 20 ms packets of 48 kHz opus or 8 kHz G.711 mono."""
+    if codec == "opus":
+        encoder = CodecContext.create("libopus", "w")
+        sample_rate: int = 48000
+    else:
+        encoder = CodecContext.create("pcm_alaw" if codec == "g711a" else "pcm_mulaw", "w")
+        sample_rate = 8000
+    encoder.sample_rate = sample_rate
+    encoder.layout = "mono"
+    encoder.format = "s16"
+    encoder.time_base = Fraction(1, sample_rate)
+    encoder.open()
+
+    samples: int = sample_rate // 50
+    packets = []
+    for i in range(int(duration * 50)):
+        t = (np.arange(samples) + i * samples) / sample_rate
+        pcm = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16).reshape(1, -1)
+        frame = AudioFrame.from_ndarray(pcm, format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        frame.pts = i * samples
+        packets.extend(encoder.encode(frame))
+    packets.extend(encoder.encode(None))
+    return [
+        MIoTCameraFrame(
+            codec_id=AUDIO_CODECS[codec],
+            length=pkt.size,
+            timestamp=index * 20,
+            sequence=index,
+            frame_type=MIoTCameraFrameType.FRAME_I,
+            channel=channel,
+            data=bytes(pkt),
+        )
+        for index, pkt in enumerate(packets)
+    ]
+
+
+def interleave(video: List[MIoTCameraFrame], audio: List[MIoTCameraFrame]) -> List[Tuple[bool, MIoTCameraFrame]]:
+    """Merge video and audio by timestamp, format: is_video, frame."""
+    items = [(True, frame) for frame in video] + [(False, frame) for frame in audio]
+    items.sort(key=lambda item: item[1].timestamp)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--codec", choices=list(VIDEO_CODECS.keys()), default="h264")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=20)
+    parser.add_argument("--gop", type=int, default=40)
+    parser.add_argument("--bitrate", type=int, default=2_000_000)
+    parser.add_argument("--duration", type=float, default=10, help="stream seconds")
+    parser.add_argument("--audio", choices=["none"] + list(AUDIO_CODECS.keys()), default="none")
+    args = parser.parse_args()
+
+    frames = gen_video_frames(
+        codec=args.codec,
+        width=args.width,
+        height=args.height,
+        fps=args.fps,
+        gop=args.gop,
+        bitrate=args.bitrate,
+        count=int(args.duration * args.fps),
+    )
+    if args.audio != "none":
+        frames += gen_audio_frames(codec=args.audio, duration=args.duration)
+    dump_frames(args.path, frames)
+    print(f"{len(frames)} frames, {os.path.getsize(args.path)} bytes, {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,17 @@ import logging
 import re
 
 from miloco_sdk import XiaomiClient
-from miloco_sdk.cli.config import IMAGE_PATH, get_openai_config
+from miloco_sdk.cli.config import get_openai_config
 from miloco_sdk.cli.llm import llm_api
-from miloco_sdk.cli.mcp_tool import mcp
+from miloco_sdk.cli.mcp_tool import SNAPSHOT_CAMERAS, mcp
 from miloco_sdk.cli.utils import get_auth_info
 from miloco_sdk.utils.mcp_jsonrpc import call_tool
+from miloco_sdk.utils.types import MIoTCameraFleetState
 
 # 禁用 httpx 模块的日志输出
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
-async def on_decode_jpg(did: str, data: bytes, ts: int, channel: int) -> None:
-    # 图片存储到本地
-    # print("on_decode_jpg: ", IMAGE_PATH)
-    with open(IMAGE_PATH, "wb") as f:
-        f.write(data)
-
-
 async def run():
     _ = get_openai_config()
     client = XiaomiClient()
@@ -30,12 +24,23 @@ async def run():
 
     online_devices = [line for line in device_list if line.get("isOnline", False)]
 
-    for device in online_devices:
-        if "camera" in device["model"]:
-            # 检测到摄像头设备，开始拉流
-            print(f"检测到摄像头设备: {device['name']}, 正在拉流...")
-            await client.miot_camera_stream.run_stream(device["did"], 0, on_decode_jpg_callback=on_decode_jpg)
-            # await asyncio.sleep(0.5)
+    camera_devices = [device for device in online_devices if "camera" in device["model"]]
+    for device in camera_devices:
+        # 检测到摄像头设备，开始拉流
+        print(f"检测到摄像头设备: {device['name']}, 正在拉流...")
+    if camera_devices:
+        # 共享一个客户端并发拉流，不再持续解码 JPEG，提问时再从最近的 GOP 解码截图
+        members = await client.miot_camera_stream.run_fleet(
+            [device["did"] for device in camera_devices], 0, enable_snapshot=True
+        )
+        fleet = client.miot_camera_stream.fleet
+        for device in camera_devices:
+            member = members[device["did"]]
+            camera_instance = fleet.get_instance(device["did"]) if fleet else None
+            if camera_instance and member.state != MIoTCameraFleetState.FAILED:
+                SNAPSHOT_CAMERAS.append(camera_instance)
+            else:
+                print(f"摄像头拉流失败: {device['name']}, {member.error}")
 
     # await asyncio.sleep(2)
     # tool_result = await call_tool(mcp, "vision_understand", {"question": "看下摄像头"})
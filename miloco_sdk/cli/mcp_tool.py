@@ -1,5 +1,4 @@
 import base64
-import os
 
 from fastmcp import FastMCP
 from openai import OpenAI
@@ -9,6 +8,9 @@ from miloco_sdk.cli.config import IMAGE_PATH, get_openai_config
 
 mcp = FastMCP("Miloco")
 
+# 已开启截图的摄像头实例，提问时按需解码最新画面
+SNAPSHOT_CAMERAS = []
+
 
 # Add an addition tool
 @mcp.tool()
@@ -16,12 +18,19 @@ async def vision_understand(question: str = Field(description="用户的提问")
     """
     家里摄像头拍摄的图片，理解用户的提问，并给出回答。
     """
-    if not os.path.exists(IMAGE_PATH):
-        return {"success": False, "error": f"图片文件不存在: {IMAGE_PATH}。请确保摄像头已开始流并接收到图片数据。"}
-
-    image_base64 = None
-    with open(IMAGE_PATH, "rb") as f:
-        image_base64 = base64.b64encode(f.read()).decode("utf-8")
+    image_data = None
+    for camera_instance in SNAPSHOT_CAMERAS:
+        image_data = await camera_instance.get_snapshot_async(max_size=1280)
+        if image_data:
+            break
+
+    # 没有摄像头给出画面时不回退到上一次保存的旧图片
+    if not image_data:
+        return {"success": False, "error": "没有获取到摄像头画面。请确保摄像头已开始流并接收到图片数据。"}
+
+    with open(IMAGE_PATH, "wb") as f:
+        f.write(image_data)
+    image_base64 = base64.b64encode(image_data).decode("utf-8")
 
     messages = [
         {
@@ -5,8 +5,13 @@
 MIoT Camera.
 """
 import asyncio
+import heapq
 import logging
+import os
 import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import (
     CDLL,
     CFUNCTYPE,
@@ -20,29 +25,58 @@ from ctypes import (
     c_uint32,
     c_uint64,
     c_void_p,
-    string_at,
 )
 from pathlib import Path
-from typing import Any, Callable, Coroutine, Dict, List, Optional
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Set, Tuple
 
 import aiofiles
+import numpy as np
 import yaml
 
+from miloco_sdk.utils.common import randomize_float
 from miloco_sdk.utils.const import (
     CAMERA_RECONNECT_TIME_MAX,
     CAMERA_RECONNECT_TIME_MIN,
+    CAMERA_STATS_WINDOW,
     OAUTH2_API_HOST_DEFAULT,
     OAUTH2_CLIENT_ID,
 )
-from miloco_sdk.utils.decoder import MIoTMediaDecoder
+from miloco_sdk.utils.decoder import (
+    MIoTMediaBufferPool,
+    MIoTMediaClipExporter,
+    MIoTMediaDecodeScheduler,
+    MIoTMediaDecoder,
+    MIoTMediaEncodePool,
+    MIoTMediaPreRollBuffer,
+    MIoTMediaRecorder,
+    MIoTMediaSnapshot,
+    MIoTMediaStageTimer,
+    MIoTMediaStreamMeter,
+)
+from miloco_sdk.utils.dispatcher import MIoTCallbackDispatcher, MIoTSubscriberQueue
 from miloco_sdk.utils.error import MIoTCameraError
 from miloco_sdk.utils.types import (
+    MIoTCameraAudioFormat,
     MIoTCameraCodec,
+    MIoTCameraDecoderOptions,
+    MIoTCameraDecodePolicy,
+    MIoTCameraDecodeWorkerMode,
     MIoTCameraExtraInfo,
-    MIoTCameraFrameData,
+    MIoTCameraFrame,
     MIoTCameraFrameType,
+    MIoTCameraImageFormat,
     MIoTCameraInfo,
+    MIoTCameraPixelFormat,
+    MIoTCameraQueuePolicy,
+    MIoTCameraRecordFormat,
+    MIoTCameraRecordSegment,
+    MIoTCameraStageStats,
     MIoTCameraStatus,
+    MIoTCameraStreamFrame,
+    MIoTCameraStreamKind,
+    MIoTCameraStreamStats,
+    MIoTCameraSubscriberStats,
+    MIoTCameraVariant,
     MIoTCameraVideoQuality,
 )
 
@@ -70,6 +104,13 @@ class _MIoTCameraFrameHeaderC(Structure):
 
 _MIOT_CAMERA_ON_RAW_DATA = CFUNCTYPE(None, POINTER(_MIoTCameraFrameHeaderC), POINTER(c_uint8))
 
+_MIOT_CAMERA_VIDEO_CODECS: Set[int] = {MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265}
+_MIOT_CAMERA_AUDIO_CODECS: Set[int] = {
+    MIoTCameraCodec.AUDIO_OPUS,
+    MIoTCameraCodec.AUDIO_G711A,
+    MIoTCameraCodec.AUDIO_G711U,
+}
+
 
 class _MIoTCameraInfoC(Structure):
     """MIoT Camera Info C."""
@@ -91,6 +132,288 @@ class _MIoTCameraInstanceC(c_void_p):
     """MIoT Camera Clang Instance."""
 
 
+# Register key prefix of each frame stream kind
+_MIOT_CAMERA_STREAM_REG_KEYS: Dict[MIoTCameraStreamKind, str] = {
+    MIoTCameraStreamKind.RAW_VIDEO: "raw_video",
+    MIoTCameraStreamKind.RAW_AUDIO: "raw_audio",
+    MIoTCameraStreamKind.JPEG: "decode_jpg",
+    MIoTCameraStreamKind.NDARRAY: "decode_frame",
+    MIoTCameraStreamKind.PCM: "decode_pcm",
+}
+# Stream kinds fed by the raw video and by the raw audio of a channel
+_MIOT_CAMERA_VIDEO_STREAM_KINDS: List[MIoTCameraStreamKind] = [
+    MIoTCameraStreamKind.RAW_VIDEO,
+    MIoTCameraStreamKind.JPEG,
+    MIoTCameraStreamKind.NDARRAY,
+]
+_MIOT_CAMERA_AUDIO_STREAM_KINDS: List[MIoTCameraStreamKind] = [MIoTCameraStreamKind.RAW_AUDIO, MIoTCameraStreamKind.PCM]
+# Prometheus metric of the MIoTCameraStreamStats fields, format: field, metric name, metric type
+_MIOT_CAMERA_STREAM_METRICS: List[Tuple[str, str, str]] = [
+    ("fps", "miot_camera_stream_fps", "gauge"),
+    ("bitrate", "miot_camera_stream_bitrate_kbps", "gauge"),
+    ("key_interval", "miot_camera_stream_key_interval_ms", "gauge"),
+    ("seq_gaps", "miot_camera_stream_seq_gaps", "gauge"),
+    ("seq_reorders", "miot_camera_stream_seq_reorders", "gauge"),
+    ("avg_latency", "miot_camera_stream_latency_avg_ms", "gauge"),
+    ("max_latency", "miot_camera_stream_latency_max_ms", "gauge"),
+    ("ring_dropped", "miot_camera_stream_ring_dropped_total", "counter"),
+    ("avg_decode", "miot_camera_stream_decode_avg_ms", "gauge"),
+    ("max_decode", "miot_camera_stream_decode_max_ms", "gauge"),
+    ("callback_lag", "miot_camera_stream_callback_lag_ms", "gauge"),
+    ("total_frames", "miot_camera_stream_frames_total", "counter"),
+    ("total_gaps", "miot_camera_stream_seq_gaps_total", "counter"),
+    ("resyncs", "miot_camera_stream_resyncs_total", "counter"),
+]
+# Register keys of the camera events, not stream subscribers
+_MIOT_CAMERA_EVENT_REG_KEYS: Set[str] = {"status", "resync"}
+
+
+class MIoTCameraFrameStream:
+    """MIoT Camera Frame Stream, async iterator pulling frames from a bounded queue.
+    The first pull or async with subscribes, aclose or leaving async with unsubscribes.
+    """
+
+    _camera: "MIoTCameraInstance"
+    _kind: MIoTCameraStreamKind
+    _channel: int
+    # Decoded kinds only
+    _variant: Optional[MIoTCameraVariant]
+    _max_fps: Optional[float]
+    _queue: MIoTSubscriberQueue
+    _reg_id: Optional[int]
+
+    def __init__(
+        self,
+        camera: "MIoTCameraInstance",
+        kind: MIoTCameraStreamKind,
+        channel: int,
+        maxsize: int,
+        queue_policy: MIoTCameraQueuePolicy,
+        variant: Optional[MIoTCameraVariant] = None,
+        max_fps: Optional[float] = None,
+    ) -> None:
+        self._camera = camera
+        self._kind = kind
+        self._channel = channel
+        self._variant = variant
+        self._max_fps = max_fps
+        self._queue = MIoTSubscriberQueue(maxsize=maxsize, policy=queue_policy)
+        self._reg_id = None
+
+    @property
+    def kind(self) -> MIoTCameraStreamKind:
+        return self._kind
+
+    @property
+    def channel(self) -> int:
+        return self._channel
+
+    @property
+    def variant(self) -> Optional[MIoTCameraVariant]:
+        return self._variant
+
+    @property
+    def max_fps(self) -> Optional[float]:
+        return self._max_fps
+
+    @property
+    def queue(self) -> MIoTSubscriberQueue:
+        return self._queue
+
+    async def open_async(self) -> None:
+        """Subscribe, a closed stream is never opened again."""
+        if self._reg_id is not None or self._queue.closed:
+            return
+        self._reg_id = await self._camera._open_frame_stream_async(self)
+
+    async def aclose(self) -> None:
+        """Unsubscribe, queued frames are dropped."""
+        reg_id, self._reg_id = self._reg_id, None
+        self._queue.close()
+        if reg_id is not None:
+            await self._camera._close_frame_stream_async(self, reg_id)
+
+    def __aiter__(self) -> "MIoTCameraFrameStream":
+        return self
+
+    async def __anext__(self) -> MIoTCameraStreamFrame:
+        await self.open_async()
+        args = await self._queue.get()
+        if args is None:
+            raise StopAsyncIteration
+        if self._kind in (MIoTCameraStreamKind.RAW_VIDEO, MIoTCameraStreamKind.RAW_AUDIO):
+            did, data, timestamp, sequence, channel = args
+            return MIoTCameraStreamFrame(did, channel, timestamp, data, sequence)
+        did, data, timestamp, channel = args
+        return MIoTCameraStreamFrame(did, channel, timestamp, data)
+
+    async def __aenter__(self) -> "MIoTCameraFrameStream":
+        await self.open_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.aclose()
+
+
+class MIoTCameraReconnectLimiter:
+    """Token bucket shared by the reconnects of the cameras of a MIoTCamera, against reconnect storms.
+    Waiters are served by priority, higher first, then in arrival order.
+    """
+
+    _main_loop: asyncio.AbstractEventLoop
+    # tokens per second
+    _rate: float
+    _burst: int
+    _tokens: float
+    _token_ts: float
+    # format: -priority, order, future
+    _waiters: List[Tuple[int, int, asyncio.Future]]
+    _order: int
+    _timer: Optional[asyncio.TimerHandle]
+
+    def __init__(
+        self, rate: float = 1.0, burst: int = 5, main_loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        if rate <= 0 or burst <= 0:
+            raise MIoTCameraError(f"invalid reconnect limit, {rate}, {burst}")
+        self._main_loop = main_loop or asyncio.get_event_loop()
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._token_ts = time.monotonic()
+        self._waiters = []
+        self._order = 0
+        self._timer = None
+
+    @property
+    def waiting(self) -> int:
+        """Queued reconnects."""
+        return len(self._waiters)
+
+    async def acquire_async(self, priority: int = 0) -> None:
+        """Wait for a reconnect token."""
+        self.__refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        future: asyncio.Future = self._main_loop.create_future()
+        heapq.heappush(self._waiters, (-priority, self._order, future))
+        self._order += 1
+        self.__schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted while cancelled, give the token back
+                self._tokens += 1
+            self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+            heapq.heapify(self._waiters)
+            raise
+
+    def __refill(self) -> None:
+        now: float = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._token_ts) * self._rate)
+        self._token_ts = now
+
+    def __schedule(self) -> None:
+        if self._timer or not self._waiters:
+            return
+        self._timer = self._main_loop.call_later(max(0, (1 - self._tokens) / self._rate), self.__serve)
+
+    def __serve(self) -> None:
+        self._timer = None
+        self.__refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        self.__schedule()
+
+
+class MIoTCameraNativeExecutor:
+    """Sized thread pool of the blocking native library calls, apart from the default executor of the loop.
+    Queue wait and call time are recorded per native function.
+    """
+
+    _main_loop: asyncio.AbstractEventLoop
+    _executor: ThreadPoolExecutor
+    _max_workers: int
+    _lock: threading.Lock
+    # key: function name, value: queued calls
+    _pending: Dict[str, int]
+    _active: int
+    # key: function name
+    _timers: Dict[str, MIoTMediaStageTimer]
+
+    def __init__(self, max_workers: int = 8, main_loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        if max_workers <= 0:
+            raise MIoTCameraError(f"invalid native workers, {max_workers}")
+        self._main_loop = main_loop or asyncio.get_event_loop()
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="miot_camera_native")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._active = 0
+        self._timers = {}
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def pending(self) -> int:
+        """Calls waiting for a worker."""
+        with self._lock:
+            return sum(self._pending.values())
+
+    @property
+    def active(self) -> int:
+        """Calls running."""
+        return self._active
+
+    async def run_async(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking native call in the pool."""
+        name: str = getattr(func, "__name__", repr(func))
+        submit_ts: float = time.perf_counter()
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + 1
+            timer = self._timers.setdefault(name, MIoTMediaStageTimer())
+
+        def call() -> Any:
+            start_ts: float = time.perf_counter()
+            with self._lock:
+                self._pending[name] -= 1
+                self._active += 1
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                timer.record(time.perf_counter() - start_ts, start_ts - submit_ts)
+
+        future = self._executor.submit(call)
+        try:
+            return await asyncio.wrap_future(future, loop=self._main_loop)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Never started
+                with self._lock:
+                    self._pending[name] -= 1
+            raise
+
+    def stats(self) -> List[MIoTCameraStageStats]:
+        """Queue wait and call time of each native function, stage native.{function}."""
+        with self._lock:
+            items = [(name, timer, self._pending.get(name, 0)) for name, timer in self._timers.items()]
+        return [timer.stats(f"native.{name}", pending=pending) for name, timer, pending in items]
+
+    def shutdown(self) -> None:
+        """Stop the workers, queued calls are cancelled."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 class MIoTCameraInstance:
     """MIoT Camera Instance."""
 
@@ -101,6 +424,9 @@ class MIoTCameraInstance:
     _did: str
     _frame_interval: int
     _enable_hw_accel: bool
+    _decode_policy: MIoTCameraDecodePolicy
+    _decode_weight: int
+    _decoder_options: Optional[MIoTCameraDecoderOptions]
 
     _camera_info: MIoTCameraInfo
     _callback_refs: Dict[str, Callable]
@@ -112,11 +438,34 @@ class MIoTCameraInstance:
     _enable_reconnect: bool
     _enable_record: bool
     _callbacks: Dict[str, Dict[str, Callable[..., Coroutine]]]
+    # Same keys as _callbacks, bounded queue and consumer task of each subscriber
+    _queues: Dict[str, Dict[str, MIoTSubscriberQueue]]
+    # key: {reg_key}.{reg_id} of decoded outputs, value: variant and output interval, ms
+    _outputs: Dict[str, Tuple[MIoTCameraVariant, int]]
+    # Same keys as _outputs, monotonic time of the last delivered output, ms
+    _output_ts: Dict[str, int]
+    # key: channel, value: variants of the channel decoder and their output interval, ms
+    _variant_intervals: Dict[int, Dict[MIoTCameraVariant, int]]
 
     _reconnect_timer: Optional[asyncio.TimerHandle]
+    # Backoff ceiling of the next reconnect, second
     _reconnect_timeout: int
+    # A start attempt is in flight
+    _starting: bool
 
     _decoders: List[MIoTMediaDecoder]
+    # key: channel
+    _recorders: Dict[int, MIoTMediaRecorder]
+    # key: channel
+    _prerolls: Dict[int, MIoTMediaPreRollBuffer]
+    # key: channel
+    _snapshots: Dict[int, MIoTMediaSnapshot]
+    # Payload slabs of the raw data callback
+    _buffer_pool: MIoTMediaBufferPool
+    # Batched hand over of native and decoder callbacks to the event loop
+    _dispatcher: MIoTCallbackDispatcher
+    # Index: channel, format: video meter, audio meter
+    _stream_meters: List[Tuple[MIoTMediaStreamMeter, MIoTMediaStreamMeter]]
 
     def __init__(
         self,
@@ -125,6 +474,9 @@ class MIoTCameraInstance:
         enable_hw_accel: bool,
         camera_info: MIoTCameraInfo,
         main_loop: Optional[asyncio.AbstractEventLoop] = None,
+        decode_policy: MIoTCameraDecodePolicy = MIoTCameraDecodePolicy.ALL,
+        decode_weight: int = 1,
+        decoder_options: Optional[MIoTCameraDecoderOptions] = None,
     ):
         self._manager = manager
         self._main_loop = main_loop or asyncio.get_event_loop()
@@ -133,6 +485,9 @@ class MIoTCameraInstance:
         self._did = camera_info.did
         self._frame_interval = frame_interval
         self._enable_hw_accel = enable_hw_accel
+        self._decode_policy = MIoTCameraDecodePolicy(decode_policy)
+        self._decode_weight = decode_weight
+        self._decoder_options = decoder_options
         self._callback_refs = {}
 
         self._video_qualities = [MIoTCameraVideoQuality.LOW]
@@ -142,9 +497,23 @@ class MIoTCameraInstance:
         self._enable_record = False
 
         self._callbacks = {}
+        self._queues = {}
+        self._outputs = {}
+        self._output_ts = {}
+        self._variant_intervals = {}
         self._reconnect_timer = None
         self._reconnect_timeout = CAMERA_RECONNECT_TIME_MIN
+        self._starting = False
         self._decoders = []
+        self._recorders = {}
+        self._prerolls = {}
+        self._snapshots = {}
+        self._buffer_pool = MIoTMediaBufferPool()
+        self._dispatcher = MIoTCallbackDispatcher(main_loop=self._main_loop)
+        self._stream_meters = [
+            (MIoTMediaStreamMeter(CAMERA_STATS_WINDOW), MIoTMediaStreamMeter(CAMERA_STATS_WINDOW))
+            for _ in range(camera_info.channel_count)
+        ]
 
         model: str = camera_info.model
         channel_count: int = camera_info.channel_count
@@ -161,6 +530,15 @@ class MIoTCameraInstance:
         """Camera info."""
         return self._camera_info
 
+    @property
+    def has_subscribers(self) -> bool:
+        """Any stream callback, recorder, pre-roll or snapshot consumes the camera."""
+        if any(
+            callbacks for reg_key, callbacks in self._callbacks.items() if reg_key not in _MIOT_CAMERA_EVENT_REG_KEYS
+        ):
+            return True
+        return bool(self._recorders or self._prerolls or self._snapshots)
+
     async def destroy_async(self) -> None:
         """Destroy camera."""
         await self.stop_async()
@@ -172,6 +550,14 @@ class MIoTCameraInstance:
         self._lib_miot_camera.miot_camera_free(self._c_instance)
         self._callback_refs.clear()
         self._callbacks.clear()
+        for queues in self._queues.values():
+            for queue in queues.values():
+                queue.close()
+        self._queues.clear()
+        self._outputs.clear()
+        self._output_ts.clear()
+        self._buffer_pool.clear()
+        await self._dispatcher.stop_async()
 
     async def start_async(
         self,
@@ -180,8 +566,26 @@ class MIoTCameraInstance:
         enable_audio: bool = False,
         enable_reconnect: bool = False,
         enable_record: bool = False,
+        decode_policy: Optional[MIoTCameraDecodePolicy] = None,
+        record_path: Optional[str] = None,
+        record_segment_duration: int = 60,
+        record_format: MIoTCameraRecordFormat = MIoTCameraRecordFormat.MP4,
+        preroll_duration: int = 0,
+        preroll_max_bytes: int = 16 * 1024 * 1024,
+        enable_snapshot: bool = False,
+        audio_sample_rate: int = 16000,
+        audio_layout: str = "mono",
+        audio_format: MIoTCameraAudioFormat = MIoTCameraAudioFormat.INT16,
+        audio_chunk_duration: int = 20,
     ) -> None:
-        """Start camera."""
+        """Start camera.
+        decode_policy overrides the policy passed at creation, keyframes_only suits low rate snapshot consumers.
+        enable_record remuxes the raw stream into segments of record_segment_duration seconds under
+        record_path, default `{DATA_PATH}/records`, without transcoding.
+        preroll_duration > 0 keeps the last seconds of encoded GOPs in memory for export_clip_async.
+        enable_snapshot keeps the latest GOP for get_snapshot_async, decoded only on request.
+        decode_pcm callbacks get chunks of audio_chunk_duration ms in audio_format/audio_layout/audio_sample_rate.
+        """
         channel_count: int = self._camera_info.channel_count or 1
         video_qualities: List
         if isinstance(qualities, MIoTCameraVideoQuality):
@@ -198,9 +602,12 @@ class MIoTCameraInstance:
         self._enable_audio = enable_audio
         self._enable_reconnect = enable_reconnect
         self._enable_record = enable_record
+        if decode_policy is not None:
+            self._decode_policy = MIoTCameraDecodePolicy(decode_policy)
 
+        self._dispatcher.start()
         # Init decoders
-        for _ in range(channel_count):
+        for channel in range(channel_count):
             decoder = MIoTMediaDecoder(
                 frame_interval=self._frame_interval,
                 video_callback=self.__on_video_decode_callback,
@@ -208,11 +615,54 @@ class MIoTCameraInstance:
                 enable_hw_accel=self._enable_hw_accel,
                 enable_audio=self._enable_audio,
                 main_loop=self._main_loop,
+                frame_callback=self.__on_frame_decode_callback,
+                decode_policy=self._decode_policy,
+                scheduler=self._manager.decode_scheduler,
+                decode_weight=self._decode_weight,
+                audio_sample_rate=audio_sample_rate,
+                audio_layout=audio_layout,
+                audio_format=audio_format,
+                audio_chunk_duration=audio_chunk_duration,
+                dispatcher=self._dispatcher,
+                encode_pool=self._manager.encode_pool,
+                decoder_options=self._decoder_options,
+                resync_callback=self.__on_resync_callback,
             )
             self._decoders.append(decoder)
+            self.__update_decoder_outputs(channel=channel)
             decoder.daemon = True
             decoder.start()
 
+        # Init recorders
+        if self._enable_record:
+            if record_path is None:
+                from miloco_sdk.configs import DATA_PATH  # pylint: disable=import-outside-toplevel
+
+                record_path = os.path.join(DATA_PATH, "records")
+            for channel in range(channel_count):
+                recorder = MIoTMediaRecorder(
+                    did=self._did,
+                    channel=channel,
+                    record_path=record_path,
+                    segment_duration=record_segment_duration,
+                    record_format=record_format,
+                )
+                self._recorders[channel] = recorder
+                recorder.start()
+                await self.__update_raw_data_register_status_async(channel=channel)
+
+        # Init pre-roll buffers
+        if preroll_duration > 0:
+            for channel in range(channel_count):
+                self._prerolls[channel] = MIoTMediaPreRollBuffer(duration=preroll_duration, max_bytes=preroll_max_bytes)
+                await self.__update_raw_data_register_status_async(channel=channel)
+
+        # Init snapshots
+        if enable_snapshot:
+            for channel in range(channel_count):
+                self._snapshots[channel] = MIoTMediaSnapshot(self._decoder_options)
+                await self.__update_raw_data_register_status_async(channel=channel)
+
         # Register status callback.
         c_callback = _MIOT_CAMERA_ON_STATUS_CHANGED(self.__on_status_changed)
         result: int = self._lib_miot_camera.miot_camera_register_status_changed(self._c_instance, c_callback)
@@ -233,20 +683,86 @@ class MIoTCameraInstance:
             self._reconnect_timer = None
             self.__reset_try_start_timeout()
 
-        result: int = await self._main_loop.run_in_executor(
-            None, self._lib_miot_camera.miot_camera_stop, self._c_instance
+        result: int = await self._manager.native_executor.run_async(
+            self._lib_miot_camera.miot_camera_stop, self._c_instance
         )
         # Stop decoders
         for decoder in self._decoders:
             decoder.stop()
         self._decoders.clear()
+        # Stop recorders, flush the open segments
+        recorders = list(self._recorders.values())
+        self._recorders.clear()
+        for recorder in recorders:
+            await self._main_loop.run_in_executor(None, recorder.stop)
+        self._prerolls.clear()
+        for snapshot in self._snapshots.values():
+            snapshot.close()
+        self._snapshots.clear()
+        for channel in range(self._camera_info.channel_count or 1):
+            if f"r{channel}" in self._callback_refs:
+                await self.__update_raw_data_register_status_async(channel=channel, is_register=False)
 
         # _LOGGER.info("camera stop, %s, %s", self._did, result)
 
+    def get_record_segments(self, channel: Optional[int] = None) -> List[MIoTCameraRecordSegment]:
+        """Closed record segments of the current run."""
+        return [
+            segment
+            for key, recorder in self._recorders.items()
+            if channel is None or key == channel
+            for segment in recorder.segments
+        ]
+
+    async def export_clip_async(
+        self, before: int = 5, after: int = 5, channel: int = 0, path: Optional[str] = None
+    ) -> str:
+        """Export a mp4 clip of the pre-roll buffer and the following live frames, return the clip path.
+        before/after: second around the newest frame.
+        """
+        preroll = self._prerolls.get(channel, None)
+        if not preroll:
+            raise MIoTCameraError(f"pre-roll not enabled, {self._did}, {channel}")
+        if path is None:
+            from miloco_sdk.configs import DATA_PATH  # pylint: disable=import-outside-toplevel
+
+            clip_path: str = os.path.join(DATA_PATH, "clips", self._did)
+            os.makedirs(clip_path, exist_ok=True)
+            path = os.path.join(clip_path, f"{channel}_{time.strftime('%Y%m%d_%H%M%S')}.mp4")
+        future: asyncio.Future = self._main_loop.create_future()
+
+        def on_done(result: Optional[str], error: Optional[Exception]) -> None:
+            preroll.detach(exporter.push_frame)
+            if error:
+                self._main_loop.call_soon_threadsafe(
+                    future.set_exception, MIoTCameraError(f"export clip failed, {error}")
+                )
+            else:
+                self._main_loop.call_soon_threadsafe(future.set_result, result)
+
+        exporter = MIoTMediaClipExporter(path=path, after=after * 1000, done_callback=on_done)
+        frames, trigger_ts = preroll.attach(exporter.push_frame, before=before * 1000)
+        exporter.start_export(frames, trigger_ts)
+        return await future
+
+    async def get_snapshot_async(
+        self,
+        image_format: MIoTCameraImageFormat | MIoTCameraPixelFormat = MIoTCameraImageFormat.JPEG,
+        max_size: Optional[int] = None,
+        channel: int = 0,
+    ) -> Optional[bytes | np.ndarray]:
+        """Get the newest picture, decoded from the latest GOP on request.
+        Return None before the first I frame.
+        """
+        snapshot = self._snapshots.get(channel, None)
+        if not snapshot:
+            raise MIoTCameraError(f"snapshot not enabled, {self._did}, {channel}")
+        return await self._main_loop.run_in_executor(None, snapshot.get, image_format, max_size)
+
     async def get_status_async(self) -> MIoTCameraStatus:
         """Get camera status."""
-        result: int = await self._main_loop.run_in_executor(
-            None, self._lib_miot_camera.miot_camera_status, self._c_instance
+        result: int = await self._manager.native_executor.run_async(
+            self._lib_miot_camera.miot_camera_status, self._c_instance
         )
         # _LOGGER.info("camera status, %s, %s", self._did, result)
         return MIoTCameraStatus(result)
@@ -261,20 +777,45 @@ class MIoTCameraInstance:
         reg_id: int = 0
         if multi_reg:
             reg_id = len(self._callbacks["status"])
-        self._callbacks["status"][str(reg_id)] = callback
+        self.__add_subscriber("status", reg_id, callback)
         return reg_id
 
     async def unregister_status_changed_async(self, reg_id: int = 0) -> None:
         """Unregister camera status changed callback."""
         if "status" not in self._callbacks:
             return
-        self._callbacks["status"].pop(str(reg_id), None)
+        self.__remove_subscriber("status", reg_id)
+
+    async def register_resync_async(
+        self, callback: Callable[[str, int, int, int], Coroutine], multi_reg: bool = False
+    ) -> int:
+        """Register decoder resync callback, a sequence gap dropped the frames up to the next I frame.
+        async def on_resync_async(did: str, seq: int, lost: int, channel: int)
+        """
+        self._callbacks.setdefault("resync", {})
+        reg_id: int = 0
+        if multi_reg:
+            reg_id = len(self._callbacks["resync"])
+        self.__add_subscriber("resync", reg_id, callback)
+        return reg_id
+
+    async def unregister_resync_async(self, reg_id: int = 0) -> None:
+        """Unregister decoder resync callback."""
+        if "resync" not in self._callbacks:
+            return
+        self.__remove_subscriber("resync", reg_id)
 
     async def register_raw_video_async(
-        self, callback: Callable[[str, bytes, int, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        callback: Callable[[str, bytes, int, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register camera raw stream callback.
         async def on_raw_video_async(did: str, data: bytes, ts: int, seq: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         await self.__update_raw_data_register_status_async(channel=channel)
         reg_key: str = f"raw_video.{channel}"
@@ -282,7 +823,7 @@ class MIoTCameraInstance:
         reg_id: int = 0
         if multi_reg:
             reg_id = len(self._callbacks[reg_key])
-        self._callbacks[reg_key][str(reg_id)] = callback
+        self.__add_subscriber(reg_key, reg_id, callback, queue_size, queue_policy)
         return reg_id
 
     async def unregister_raw_video_async(self, channel: int = 0, reg_id: int = 0) -> None:
@@ -290,14 +831,20 @@ class MIoTCameraInstance:
         reg_key: str = f"raw_video.{channel}"
         if reg_key not in self._callbacks:
             return
-        self._callbacks[reg_key].pop(str(reg_id), None)
+        self.__remove_subscriber(reg_key, reg_id)
         await self.__update_raw_data_register_status_async(channel=channel, is_register=False)
 
     async def register_raw_audio_async(
-        self, callback: Callable[[str, bytes, int, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        callback: Callable[[str, bytes, int, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register camera raw audio callback.
         async def on_raw_audio_async(did: str, data: bytes, ts: int, seq: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         await self.__update_raw_data_register_status_async(channel=channel)
         reg_key: str = f"raw_audio.{channel}"
@@ -305,7 +852,7 @@ class MIoTCameraInstance:
         reg_id: int = 0
         if multi_reg:
             reg_id = len(self._callbacks) + 1
-        self._callbacks[reg_key][str(reg_id)] = callback
+        self.__add_subscriber(reg_key, reg_id, callback, queue_size, queue_policy)
         return reg_id
 
     async def unregister_raw_audio_async(self, channel: int = 0, reg_id: int = 0) -> None:
@@ -313,14 +860,26 @@ class MIoTCameraInstance:
         reg_key: str = f"raw_audio.{channel}"
         if reg_key not in self._callbacks:
             return
-        self._callbacks[reg_key].pop(str(reg_id), None)
+        self.__remove_subscriber(reg_key, reg_id)
         await self.__update_raw_data_register_status_async(channel=channel, is_register=False)
 
     async def register_decode_jpg_async(
-        self, callback: Callable[[str, bytes, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        callback: Callable[[str, bytes, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+        image_format: MIoTCameraImageFormat = MIoTCameraImageFormat.JPEG,
+        quality: int = 90,
     ) -> int:
-        """Register camera decode jpg callback.
+        """Register camera decode jpg callback, the picture is encoded in image_format.
         async def on_decode_jpg_async(did: str, data: bytes, ts: int, channel: int)
+        max_fps defaults to frame_interval, max_width/max_height scale down before encoding, 0 keeps the size.
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         await self.__update_raw_data_register_status_async(channel=channel)
         reg_key: str = f"decode_jpg.{channel}"
@@ -328,7 +887,14 @@ class MIoTCameraInstance:
         reg_id: int = 0
         if multi_reg:
             reg_id = len(self._callbacks) + 1
-        self._callbacks[reg_key][str(reg_id)] = callback
+        self.__add_subscriber(reg_key, reg_id, callback, queue_size, queue_policy)
+        self.__set_output(
+            reg_key,
+            reg_id,
+            MIoTCameraVariant.create(MIoTCameraImageFormat(image_format), quality, max_width, max_height),
+            max_fps,
+        )
+        self.__update_decoder_outputs(channel=channel)
         return reg_id
 
     async def unregister_decode_jpg_async(self, channel: int = 0, reg_id: int = 0) -> None:
@@ -337,13 +903,60 @@ class MIoTCameraInstance:
         reg_key: str = f"decode_jpg.{channel}"
         if reg_key not in self._callbacks:
             return
-        self._callbacks[reg_key].pop(str(reg_id), None)
+        self.__remove_subscriber(reg_key, reg_id)
+        self.__update_decoder_outputs(channel=channel)
+
+    async def register_decode_frame_async(
+        self,
+        callback: Callable[[str, np.ndarray, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        pix_fmt: MIoTCameraPixelFormat = MIoTCameraPixelFormat.BGR24,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+    ) -> int:
+        """Register camera decode frame callback, the frame is a numpy array in pix_fmt.
+        async def on_decode_frame_async(did: str, frame: np.ndarray, ts: int, channel: int)
+        bgr24/rgb24 frames are (height, width, 3), gray (height, width), yuv420p is planar I420 stacked in one
+        (height * 3 / 2, width) array, the Y plane rows then the U and V planes, see MIoTCameraPixelFormat.
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
+        """
+        await self.__update_raw_data_register_status_async(channel=channel)
+        reg_key: str = f"decode_frame.{channel}"
+        self._callbacks.setdefault(reg_key, {})
+        reg_id: int = 0
+        if multi_reg:
+            reg_id = len(self._callbacks) + 1
+        self.__add_subscriber(reg_key, reg_id, callback, queue_size, queue_policy)
+        self.__set_output(
+            reg_key, reg_id, MIoTCameraVariant.create(MIoTCameraPixelFormat(pix_fmt), 0, max_width, max_height), max_fps
+        )
+        self.__update_decoder_outputs(channel=channel)
+        return reg_id
+
+    async def unregister_decode_frame_async(self, channel: int = 0, reg_id: int = 0) -> None:
+        """Unregister camera decode frame callback."""
+        reg_key: str = f"decode_frame.{channel}"
+        if reg_key not in self._callbacks:
+            return
+        self.__remove_subscriber(reg_key, reg_id)
+        self.__update_decoder_outputs(channel=channel)
+        await self.__update_raw_data_register_status_async(channel=channel, is_register=False)
 
     async def register_decode_pcm_async(
-        self, callback: Callable[[str, bytes, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        callback: Callable[[str, bytes, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register camera decode pcm callback.
         async def on_decode_pcm_async(did: str, data: bytes, ts: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         await self.__update_raw_data_register_status_async(channel=channel)
         reg_key: str = f"decode_pcm.{channel}"
@@ -351,7 +964,7 @@ class MIoTCameraInstance:
         reg_id: int = 0
         if multi_reg:
             reg_id = len(self._callbacks) + 1
-        self._callbacks[reg_key][str(reg_id)] = callback
+        self.__add_subscriber(reg_key, reg_id, callback, queue_size, queue_policy)
         return reg_id
 
     async def unregister_decode_pcm_async(self, channel: int = 0, reg_id: int = 0) -> None:
@@ -360,7 +973,199 @@ class MIoTCameraInstance:
         reg_key: str = f"decode_pcm.{channel}"
         if reg_key not in self._callbacks:
             return
-        self._callbacks[reg_key].pop(str(reg_id), None)
+        self.__remove_subscriber(reg_key, reg_id)
+
+    def frames(
+        self,
+        channel: int = 0,
+        kind: MIoTCameraStreamKind = MIoTCameraStreamKind.RAW_VIDEO,
+        maxsize: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        pix_fmt: MIoTCameraPixelFormat = MIoTCameraPixelFormat.BGR24,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+        quality: int = 90,
+    ) -> MIoTCameraFrameStream:
+        """Pull based frame stream, the outputs of the kind are only produced while the stream is open.
+        async for frame in camera.frames(channel=0, kind="jpeg", maxsize=5)
+        max_fps, max_width, max_height and quality apply to the decoded kinds, see register_decode_jpg_async.
+        maxsize/queue_policy bound the queue, BLOCK drops the newest beyond 2 * maxsize.
+        """
+        kind = MIoTCameraStreamKind(kind)
+        variant: Optional[MIoTCameraVariant] = None
+        if kind == MIoTCameraStreamKind.JPEG:
+            variant = MIoTCameraVariant.create(MIoTCameraImageFormat.JPEG, quality, max_width, max_height)
+        elif kind == MIoTCameraStreamKind.NDARRAY:
+            variant = MIoTCameraVariant.create(MIoTCameraPixelFormat(pix_fmt), 0, max_width, max_height)
+        if queue_policy is None:
+            queue_policy = (
+                MIoTCameraQueuePolicy.KEYFRAME_PRESERVING
+                if kind == MIoTCameraStreamKind.RAW_VIDEO
+                else MIoTCameraQueuePolicy.DROP_OLDEST
+            )
+        return MIoTCameraFrameStream(
+            camera=self,
+            kind=kind,
+            channel=channel,
+            maxsize=maxsize,
+            queue_policy=MIoTCameraQueuePolicy(queue_policy),
+            variant=variant,
+            max_fps=max_fps,
+        )
+
+    async def _open_frame_stream_async(self, stream: MIoTCameraFrameStream) -> int:
+        """Subscribe the queue of a frame stream, called by MIoTCameraFrameStream."""
+        channel: int = stream.channel
+        await self.__update_raw_data_register_status_async(channel=channel)
+        reg_key: str = f"{_MIOT_CAMERA_STREAM_REG_KEYS[stream.kind]}.{channel}"
+        callbacks = self._callbacks.setdefault(reg_key, {})
+        reg_id: int = 0
+        while str(reg_id) in callbacks:
+            reg_id += 1
+        self.__set_subscriber_queue(reg_key, reg_id, stream.queue.get, stream.queue)
+        if stream.variant:
+            self.__set_output(reg_key, reg_id, stream.variant, stream.max_fps)
+        self.__update_decoder_outputs(channel=channel)
+        return reg_id
+
+    async def _close_frame_stream_async(self, stream: MIoTCameraFrameStream, reg_id: int) -> None:
+        """Unsubscribe a frame stream, called by MIoTCameraFrameStream."""
+        channel: int = stream.channel
+        reg_key: str = f"{_MIOT_CAMERA_STREAM_REG_KEYS[stream.kind]}.{channel}"
+        # The register id may have been taken over by a callback
+        if self._queues.get(reg_key, {}).get(str(reg_id)) is not stream.queue:
+            return
+        self.__remove_subscriber(reg_key, reg_id)
+        self.__update_decoder_outputs(channel=channel)
+        await self.__update_raw_data_register_status_async(channel=channel, is_register=False)
+
+    def get_pipeline_stats(self) -> List[MIoTCameraStageStats]:
+        """Latency of the decode stage of each channel, of the shared encode stage and of the native calls."""
+        stats: List[MIoTCameraStageStats] = [
+            decoder.decode_timer.stats(
+                "decode", channel=channel, pending=decoder.pending, dropped=decoder.dropped_frames
+            )
+            for channel, decoder in enumerate(self._decoders)
+        ]
+        if self._manager.encode_pool:
+            stats.append(self._manager.encode_pool.stats())
+        stats.extend(self._manager.native_executor.stats())
+        return stats
+
+    def get_stats(self) -> List[MIoTCameraStreamStats]:
+        """Stream health of each channel, video always, audio once received."""
+        stats: List[MIoTCameraStreamStats] = []
+        for channel, (video_meter, audio_meter) in enumerate(self._stream_meters):
+            decoder: Optional[MIoTMediaDecoder] = self._decoders[channel] if channel < len(self._decoders) else None
+            decode_stats: Optional[MIoTCameraStageStats] = decoder.decode_timer.stats("decode") if decoder else None
+            stats.append(
+                video_meter.stats(
+                    channel,
+                    MIoTCameraStreamKind.RAW_VIDEO,
+                    ring_dropped=decoder.dropped_frames if decoder else 0,
+                    avg_decode=decode_stats.avg_latency if decode_stats else 0.0,
+                    max_decode=decode_stats.max_latency if decode_stats else 0.0,
+                    callback_lag=self.__get_callback_lag(channel, _MIOT_CAMERA_VIDEO_STREAM_KINDS),
+                    resyncs=decoder.resyncs if decoder else 0,
+                )
+            )
+            if audio_meter.total_frames:
+                stats.append(
+                    audio_meter.stats(
+                        channel,
+                        MIoTCameraStreamKind.RAW_AUDIO,
+                        callback_lag=self.__get_callback_lag(channel, _MIOT_CAMERA_AUDIO_STREAM_KINDS),
+                    )
+                )
+        return stats
+
+    def get_subscriber_stats(self) -> List[MIoTCameraSubscriberStats]:
+        """Queue depth, lag and counters of each subscriber."""
+        return [
+            MIoTCameraSubscriberStats(
+                reg_key=reg_key,
+                reg_id=int(reg_id),
+                policy=queue.policy,
+                maxsize=queue.maxsize,
+                pending=queue.pending,
+                lag=int(queue.lag * 1000),
+                delivered=queue.delivered,
+                dropped=queue.dropped,
+                overflowed=queue.overflowed,
+            )
+            for reg_key, queues in self._queues.items()
+            for reg_id, queue in queues.items()
+        ]
+
+    def __get_callback_lag(self, channel: int, kinds: List[MIoTCameraStreamKind]) -> float:
+        """Max subscriber queue lag of the stream kinds of the channel, ms."""
+        lags: List[float] = [
+            queue.lag
+            for kind in kinds
+            for queue in self._queues.get(f"{_MIOT_CAMERA_STREAM_REG_KEYS[kind]}.{channel}", {}).values()
+        ]
+        return max(lags, default=0.0) * 1000
+
+    def __add_subscriber(
+        self,
+        reg_key: str,
+        reg_id: int,
+        callback: Callable[..., Coroutine],
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+    ) -> None:
+        """Add a subscriber, raw video keeps whole GOPs by default, other outputs drop the oldest item."""
+        if queue_policy is None:
+            queue_policy = (
+                MIoTCameraQueuePolicy.KEYFRAME_PRESERVING
+                if reg_key.startswith("raw_video.")
+                else MIoTCameraQueuePolicy.DROP_OLDEST
+            )
+        queue = MIoTSubscriberQueue(callback=callback, maxsize=queue_size, policy=queue_policy)
+        queue.start()
+        self.__set_subscriber_queue(reg_key, reg_id, callback, queue)
+
+    def __set_subscriber_queue(
+        self, reg_key: str, reg_id: int, callback: Callable[..., Coroutine], queue: MIoTSubscriberQueue
+    ) -> None:
+        old_queue = self._queues.setdefault(reg_key, {}).pop(str(reg_id), None)
+        if old_queue:
+            old_queue.close()
+        self._queues[reg_key][str(reg_id)] = queue
+        self._callbacks.setdefault(reg_key, {})[str(reg_id)] = callback
+
+    def __remove_subscriber(self, reg_key: str, reg_id: int) -> None:
+        self._outputs.pop(f"{reg_key}.{reg_id}", None)
+        self._output_ts.pop(f"{reg_key}.{reg_id}", None)
+        self._callbacks.get(reg_key, {}).pop(str(reg_id), None)
+        queue = self._queues.get(reg_key, {}).pop(str(reg_id), None)
+        if queue:
+            queue.close()
+
+    def __set_output(
+        self, reg_key: str, reg_id: int, variant: MIoTCameraVariant, max_fps: Optional[float] = None
+    ) -> None:
+        """Set the decoded output of a subscriber, max_fps defaults to frame_interval."""
+        if max_fps is not None and max_fps <= 0:
+            raise MIoTCameraError(f"invalid max fps, {max_fps}")
+        interval: int = int(1000 / max_fps) if max_fps else self._frame_interval
+        self._outputs[f"{reg_key}.{reg_id}"] = (variant, interval)
+        self._output_ts.pop(f"{reg_key}.{reg_id}", None)
+
+    def __need_output(self, key: str, variant: MIoTCameraVariant, channel: int) -> bool:
+        """Check the variant and the frame rate of a decoded output subscriber."""
+        output = self._outputs.get(key)
+        if not output or output[0] != variant:
+            return False
+        now_ts: int = int(time.monotonic() * 1000)
+        last_ts: Optional[int] = self._output_ts.get(key)
+        # The variant is produced at the highest rate of its subscribers, pick the output nearest to due
+        min_interval: int = self._variant_intervals.get(channel, {}).get(variant, output[1])
+        if last_ts is not None and now_ts - last_ts < output[1] - min_interval // 2:
+            return False
+        self._output_ts[key] = now_ts
+        return True
 
     async def __register_raw_data_async(self, channel: int = 0) -> None:
         """Register raw data callback."""
@@ -397,30 +1202,58 @@ class MIoTCameraInstance:
                 need_unreg = False
             if len(self._callbacks.get(f"decode_jpg.{channel}", {})) > 0:
                 need_unreg = False
+            if len(self._callbacks.get(f"decode_frame.{channel}", {})) > 0:
+                need_unreg = False
             if len(self._callbacks.get(f"decode_pcm.{channel}", {})) > 0:
                 need_unreg = False
+            if channel in self._recorders or channel in self._prerolls or channel in self._snapshots:
+                need_unreg = False
             if need_unreg:
                 await self.__unregister_raw_data_async(channel)
 
-    async def __try_start_async(self) -> None:
+    def __update_decoder_outputs(self, channel: int) -> None:
+        """Update decoded outputs of the channel decoder, skip the jpeg encode without subscribers."""
+        if channel < 0 or channel >= len(self._decoders):
+            return
+        variants: Dict[MIoTCameraVariant, int] = {}
+        for reg_key in (f"decode_jpg.{channel}", f"decode_frame.{channel}"):
+            for reg_id in self._callbacks.get(reg_key, {}):
+                output = self._outputs.get(f"{reg_key}.{reg_id}")
+                if output:
+                    variants[output[0]] = min(output[1], variants.get(output[0], output[1]))
+        self._variant_intervals[channel] = variants
+        self._decoders[channel].update_outputs(variants)
+
+    async def __try_start_async(self, reconnect: bool = False) -> None:
         # _LOGGER.info("try start camera, %s", self._did)
         # Cancel reconnect task if exists.
         if self._reconnect_timer:
             self._reconnect_timer.cancel()
             self._reconnect_timer = None
+        if self._starting:
+            return
 
-        result: int = await self._main_loop.run_in_executor(
-            None,
-            self._lib_miot_camera.miot_camera_start,
-            self._c_instance,
-            byref(
-                _MIoTCameraConfigC(
-                    (c_uint8 * ((self.camera_info.channel_count or 1) + 1))(*self._video_qualities),
-                    self._enable_audio,
-                    self._pin_code.encode("utf-8") if self._pin_code else None,
-                )
-            ),
-        )
+        self._starting = True
+        try:
+            if reconnect:
+                # Cameras with subscribers reconnect first
+                await self._manager.reconnect_limiter.acquire_async(priority=1 if self.has_subscribers else 0)
+                if not self._enable_reconnect:
+                    # Stopped while waiting
+                    return
+            result: int = await self._manager.native_executor.run_async(
+                self._lib_miot_camera.miot_camera_start,
+                self._c_instance,
+                byref(
+                    _MIoTCameraConfigC(
+                        (c_uint8 * ((self.camera_info.channel_count or 1) + 1))(*self._video_qualities),
+                        self._enable_audio,
+                        self._pin_code.encode("utf-8") if self._pin_code else None,
+                    )
+                ),
+            )
+        finally:
+            self._starting = False
         # _LOGGER.info(
         #     "try start camera, result->%s, did->%s, enable_audio->%s, enable_reconnect->%s, pin_code->%.2s**",
         #     result, self.camera_info.did, self._enable_audio, self._enable_reconnect, self._pin_code)
@@ -429,17 +1262,16 @@ class MIoTCameraInstance:
             return
         # Reconnect.
         if self._enable_reconnect:
-            self._reconnect_timer = self._main_loop.call_later(
-                self.__get_try_start_timeout(), lambda: self._main_loop.create_task(self.__try_start_async())
-            )
+            self.__schedule_reconnect(force=True)
         else:
             _LOGGER.error("camera start failed, %s, %s", self._did, result)
             raise MIoTCameraError(f"camera start failed, {self.camera_info.did}, {result}")
 
-    def __get_try_start_timeout(self) -> int:
+    def __get_try_start_timeout(self) -> float:
+        """Full jitter backoff, uniform between 0 and the doubling ceiling, cameras do not retry in lockstep."""
         self._reconnect_timeout = min(self._reconnect_timeout * 2, CAMERA_RECONNECT_TIME_MAX)
         # _LOGGER.info("get reconnect timeout, %s, %s", self._did, self._reconnect_timeout)
-        return self._reconnect_timeout
+        return randomize_float(self._reconnect_timeout / 2, 1.0)
 
     def __reset_try_start_timeout(self) -> None:
         self._reconnect_timeout = CAMERA_RECONNECT_TIME_MIN
@@ -451,65 +1283,140 @@ class MIoTCameraInstance:
         self._camera_info.camera_status = camera_status
         # TODO: Dirty logic, Need to optimize upper-level business judgment logic
         self._camera_info.online = self._camera_info.camera_status == MIoTCameraStatus.CONNECTED
-        s_callbacks = self._callbacks.get("status", {})
-        for callback in s_callbacks.values():
-            asyncio.run_coroutine_threadsafe(callback(self._did, camera_status), self._main_loop)
+        self._dispatcher.dispatch(self.__on_status_dispatch, camera_status)
+        if camera_status == MIoTCameraStatus.CONNECTED:
+            # Sequences restart on a new connection, not a reorder
+            for video_meter, audio_meter in self._stream_meters:
+                video_meter.reset_sequence()
+                audio_meter.reset_sequence()
         if camera_status == MIoTCameraStatus.DISCONNECTED and self._enable_reconnect:
-            self._reconnect_timer = self._main_loop.call_later(
-                self.__get_try_start_timeout(), lambda: self._main_loop.create_task(self.__try_start_async())
-            )
+            # Called on a native thread
+            self._main_loop.call_soon_threadsafe(self.__schedule_reconnect)
+
+    def __schedule_reconnect(self, force: bool = False) -> None:
+        """Schedule a reconnect on disconnect, replaces the pending one.
+        Skipped during a start attempt, a failed attempt schedules its own retry with force.
+        """
+        if not self._enable_reconnect or (self._starting and not force):
+            return
+        if self._reconnect_timer:
+            self._reconnect_timer.cancel()
+        self._reconnect_timer = self._main_loop.call_later(
+            self.__get_try_start_timeout(),
+            lambda: self._main_loop.create_task(self.__try_start_async(reconnect=True)),
+        )
 
     def __on_raw_data(self, frame_header_ptr: Any, data: bytes) -> None:
         """Callback for raw data."""
         frame_header: _MIoTCameraFrameHeaderC = frame_header_ptr.contents
-        codec_id: MIoTCameraCodec = MIoTCameraCodec(frame_header.codec_id)
+        codec_id: int = frame_header.codec_id
         channel: int = frame_header.channel
-        frame_data = MIoTCameraFrameData(
-            codec_id=codec_id,
-            length=frame_header.length,
-            timestamp=frame_header.timestamp,
-            sequence=frame_header.sequence,
-            frame_type=MIoTCameraFrameType(frame_header.frame_type),
-            channel=channel,
-            data=string_at(data, frame_header.length),
+        # Plain tuple on the native callback thread, MIoTCameraFrame.to_model() builds the pydantic model
+        frame_data = MIoTCameraFrame(
+            codec_id,
+            frame_header.length,
+            frame_header.timestamp,
+            frame_header.sequence,
+            frame_header.frame_type,
+            channel,
+            self._buffer_pool.copy(data, frame_header.length),
         )
-        if codec_id in [MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265]:
-            # raw video
-            if self._callbacks.get(f"decode_jpg.{channel}", None):
+        if codec_id in _MIOT_CAMERA_VIDEO_CODECS:
+            # raw video, the meter sees every frame and finds the sequence gaps
+            lost: int = self._stream_meters[channel][0].record(
+                frame_data.length,
+                frame_data.timestamp,
+                frame_data.sequence,
+                frame_data.frame_type == MIoTCameraFrameType.FRAME_I,
+            )
+            if self._callbacks.get(f"decode_jpg.{channel}", None) or self._callbacks.get(
+                f"decode_frame.{channel}", None
+            ):
+                if lost:
+                    self._decoders[channel].resync(frame_data.sequence, lost, channel)
                 self._decoders[channel].push_video_frame(frame_data)
-            v_callbacks = self._callbacks.get(f"raw_video.{channel}", {})
-            for v_callback in list(v_callbacks.values()):
-                asyncio.run_coroutine_threadsafe(
-                    v_callback(self._did, frame_data.data, frame_data.timestamp, frame_data.sequence, channel),
-                    self._main_loop,
+            if channel in self._recorders:
+                self._recorders[channel].push_video_frame(frame_data)
+            if channel in self._prerolls:
+                self._prerolls[channel].push(frame_data)
+            if channel in self._snapshots:
+                self._snapshots[channel].push(frame_data)
+            if self._callbacks.get(f"raw_video.{channel}", None):
+                # Subscribers keep bytes, one copy shared by all of them
+                self._dispatcher.dispatch(
+                    self.__on_raw_dispatch,
+                    f"raw_video.{channel}",
+                    bytes(frame_data.data),
+                    frame_data.timestamp,
+                    frame_data.sequence,
+                    channel,
+                    frame_data.frame_type == MIoTCameraFrameType.FRAME_I,
                 )
-        elif codec_id in [MIoTCameraCodec.AUDIO_OPUS, MIoTCameraCodec.AUDIO_G711A, MIoTCameraCodec.AUDIO_G711U]:
+        elif codec_id in _MIOT_CAMERA_AUDIO_CODECS:
             # raw audio
+            self._stream_meters[channel][1].record(frame_data.length, frame_data.timestamp, frame_data.sequence, True)
             if self._callbacks.get(f"decode_pcm.{channel}", None):
                 self._decoders[channel].push_audio_frame(frame_data)
-            a_callbacks = self._callbacks.get(f"raw_audio.{channel}", {})
-            for a_callback in list(a_callbacks.values()):
-                asyncio.run_coroutine_threadsafe(
-                    a_callback(self._did, frame_data.data, frame_data.timestamp, frame_data.sequence, channel),
-                    self._main_loop,
+            if channel in self._recorders:
+                self._recorders[channel].push_audio_frame(frame_data)
+            if channel in self._prerolls:
+                self._prerolls[channel].push(frame_data)
+            if self._callbacks.get(f"raw_audio.{channel}", None):
+                self._dispatcher.dispatch(
+                    self.__on_raw_dispatch,
+                    f"raw_audio.{channel}",
+                    bytes(frame_data.data),
+                    frame_data.timestamp,
+                    frame_data.sequence,
+                    channel,
+                    True,
                 )
         else:
             _LOGGER.error("unknown codec, %s, %s, %s", self._did, codec_id, frame_header.timestamp)
         # _LOGGER.info("raw, %s, %s, %s, %s", self._did, channel, frame_header.timestamp, frame_header.sequence)
 
-    async def __on_video_decode_callback(self, data: bytes, timestamp: int, channel: int) -> None:
+    async def __on_status_dispatch(self, camera_status: MIoTCameraStatus) -> None:
+        """Fan out status changes, run by the dispatcher in the event loop."""
+        for queue in list(self._queues.get("status", {}).values()):
+            queue.put_nowait((self._did, camera_status))
+
+    async def __on_raw_dispatch(
+        self, reg_key: str, data: bytes, timestamp: int, sequence: int, channel: int, is_key: bool
+    ) -> None:
+        """Fan out raw video or audio, run by the dispatcher in the event loop."""
+        for queue in list(self._queues.get(reg_key, {}).values()):
+            queue.put_nowait((self._did, data, timestamp, sequence, channel), is_key)
+
+    async def __on_video_decode_callback(
+        self, variant: MIoTCameraVariant, data: bytes, timestamp: int, channel: int
+    ) -> None:
         """On video decode callback."""
         # _LOGGER.info("decode jpg, %s, %s, %s, %s", self._did, len(data), timestamp, channel)
-        v_callbacks = self._callbacks.get(f"decode_jpg.{channel}", {})
-        for callback in list(v_callbacks.values()):
-            asyncio.run_coroutine_threadsafe(callback(self._did, data, timestamp, channel), self._main_loop)
+        reg_key: str = f"decode_jpg.{channel}"
+        for reg_id, queue in list(self._queues.get(reg_key, {}).items()):
+            if self.__need_output(f"{reg_key}.{reg_id}", variant, channel):
+                queue.put_nowait((self._did, data, timestamp, channel))
+
+    async def __on_frame_decode_callback(
+        self, variant: MIoTCameraVariant, frame: np.ndarray, timestamp: int, channel: int
+    ) -> None:
+        """On frame decode callback."""
+        reg_key: str = f"decode_frame.{channel}"
+        for reg_id, queue in list(self._queues.get(reg_key, {}).items()):
+            if self.__need_output(f"{reg_key}.{reg_id}", variant, channel):
+                queue.put_nowait((self._did, frame, timestamp, channel))
+
+    async def __on_resync_callback(self, sequence: int, lost: int, channel: int) -> None:
+        """On decoder resync after a sequence gap."""
+        # _LOGGER.info("decoder resync, %s, %s, %s, %s", self._did, channel, sequence, lost)
+        for queue in list(self._queues.get("resync", {}).values()):
+            queue.put_nowait((self._did, sequence, lost, channel))
 
     async def __on_audio_decode_callback(self, data: bytes, timestamp: int, channel: int) -> None:
         """On audio decode callback."""
         # _LOGGER.info("decode audio, %s, %s, %s, %s", self._did, len(data), timestamp, channel)
-        a_callbacks = self._callbacks.get(f"decode_pcm.{channel}", {})
-        for callback in list(a_callbacks.values()):
-            asyncio.run_coroutine_threadsafe(callback(self._did, data, timestamp, channel), self._main_loop)
+        for queue in list(self._queues.get(f"decode_pcm.{channel}", {}).values()):
+            queue.put_nowait((self._did, data, timestamp, channel))
 
 
 def _load_dynamic_lib():
@@ -621,6 +1528,14 @@ class MIoTCamera:
     _access_token: str
     _frame_interval: int
     _enable_hw_accel: bool
+    # Shared decode workers, None for a decode thread per camera channel
+    _decode_scheduler: Optional[MIoTMediaDecodeScheduler]
+    # Shared image encode workers, None to encode in the decode thread
+    _encode_pool: Optional[MIoTMediaEncodePool]
+    # Shared reconnect rate limit of the cameras
+    _reconnect_limiter: MIoTCameraReconnectLimiter
+    # Blocking native calls
+    _native_executor: MIoTCameraNativeExecutor
     # key: did, value: MIoTCameraInstance
     _camera_map: Dict[str, MIoTCameraInstance]
     # logger handler
@@ -638,8 +1553,24 @@ class MIoTCamera:
         frame_interval: int = 500,
         enable_hw_accel: bool = True,
         loop: Optional[asyncio.AbstractEventLoop] = None,
+        decode_workers: int = 0,
+        decode_max_fps: Optional[float] = None,
+        decode_worker_mode: MIoTCameraDecodeWorkerMode = MIoTCameraDecodeWorkerMode.THREAD,
+        encode_workers: int = 1,
+        lib_miot_camera: Optional[Any] = None,
+        reconnect_rate: float = 1.0,
+        reconnect_burst: int = 5,
+        native_workers: int = 8,
     ) -> None:
-        """Init."""
+        """Init.
+        decode_workers > 0 shares that many decode workers among all cameras instead of a thread per channel,
+        decode_max_fps caps the total decoded video frames per second,
+        decode_worker_mode process decodes video in worker processes, out of the GIL of the main loop,
+        encode_workers > 0 encodes the images in that many shared workers, 0 encodes in the decode thread,
+        lib_miot_camera replaces the native library, e.g. MIoTCameraReplayLib to replay frame files offline,
+        reconnect_rate/reconnect_burst cap the reconnects per second of all the cameras,
+        native_workers sizes the thread pool of the blocking native calls, e.g. miot_camera_start.
+        """
         if not isinstance(cloud_server, str) or not isinstance(access_token, str):
             raise MIoTCameraError("invalid parameter")
         self._main_loop = loop or asyncio.get_running_loop()
@@ -650,9 +1581,23 @@ class MIoTCamera:
         self._frame_interval = frame_interval
         self._enable_hw_accel = enable_hw_accel
         self._camera_map = {}
+        self._decode_scheduler = None
+        if decode_workers > 0:
+            self._decode_scheduler = MIoTMediaDecodeScheduler(
+                worker_count=decode_workers, max_fps=decode_max_fps, worker_mode=decode_worker_mode
+            )
+            self._decode_scheduler.start()
+        self._encode_pool = None
+        if encode_workers > 0:
+            self._encode_pool = MIoTMediaEncodePool(worker_count=encode_workers)
+            self._encode_pool.start()
+        self._reconnect_limiter = MIoTCameraReconnectLimiter(
+            rate=reconnect_rate, burst=reconnect_burst, main_loop=self._main_loop
+        )
+        self._native_executor = MIoTCameraNativeExecutor(max_workers=native_workers, main_loop=self._main_loop)
 
         # lib init
-        self._lib_miot_camera = _load_dynamic_lib()
+        self._lib_miot_camera = lib_miot_camera or _load_dynamic_lib()
         # MUST add to refs, otherwise it will be freed.
         self._log_handler = _MIOT_CAMERA_LOG_HANDLER(self._on_miot_camera_log)
         self._lib_miot_camera.miot_camera_set_log_handler(self._log_handler)
@@ -679,6 +1624,26 @@ class MIoTCamera:
         """Camera map."""
         return self._camera_map
 
+    @property
+    def decode_scheduler(self) -> Optional[MIoTMediaDecodeScheduler]:
+        """Decode scheduler."""
+        return self._decode_scheduler
+
+    @property
+    def encode_pool(self) -> Optional[MIoTMediaEncodePool]:
+        """Encode pool."""
+        return self._encode_pool
+
+    @property
+    def reconnect_limiter(self) -> MIoTCameraReconnectLimiter:
+        """Reconnect limiter."""
+        return self._reconnect_limiter
+
+    @property
+    def native_executor(self) -> MIoTCameraNativeExecutor:
+        """Native call executor."""
+        return self._native_executor
+
     async def init_async(self, frame_interval: int = 500, enable_hw_accel: bool = False) -> None:
         """Init."""
         self._frame_interval = frame_interval
@@ -690,6 +1655,13 @@ class MIoTCamera:
         for did in list(self._camera_map.keys()):
             await self.destroy_camera_async(did=did)
         self._camera_map.clear()
+        if self._decode_scheduler:
+            self._decode_scheduler.stop()
+            self._decode_scheduler = None
+        if self._encode_pool:
+            self._encode_pool.stop()
+            self._encode_pool = None
+        self._native_executor.shutdown()
         self._lib_miot_camera.miot_camera_deinit()
         self._deinit_done = True
         self._lib_miot_camera = None  # type: ignore
@@ -704,8 +1676,15 @@ class MIoTCamera:
         camera_info: MIoTCameraInfo | Dict,
         frame_interval: Optional[int] = None,
         enable_hw_accel: Optional[bool] = None,
+        decode_policy: MIoTCameraDecodePolicy = MIoTCameraDecodePolicy.ALL,
+        decode_weight: int = 1,
+        decoder_options: Optional[MIoTCameraDecoderOptions | Dict] = None,
     ) -> MIoTCameraInstance:
-        """Create camera."""
+        """Create camera.
+        decode_weight is the share of the decode workers, only used with decode_workers.
+        decoder_options tunes the video decoder, e.g. frame threading for full rate 1080p hevc,
+        skip_loop_filter for previews.
+        """
         camera: MIoTCameraInfo = (
             MIoTCameraInfo(**camera_info) if isinstance(camera_info, Dict) else camera_info.model_copy()
         )
@@ -719,6 +1698,11 @@ class MIoTCamera:
             enable_hw_accel=enable_hw_accel or self._enable_hw_accel,
             camera_info=camera,
             main_loop=self._main_loop,
+            decode_policy=decode_policy,
+            decode_weight=decode_weight,
+            decoder_options=(
+                MIoTCameraDecoderOptions(**decoder_options) if isinstance(decoder_options, Dict) else decoder_options
+            ),
         )
         return self._camera_map[did]
 
@@ -742,6 +1726,18 @@ class MIoTCamera:
         qualities: MIoTCameraVideoQuality | List[MIoTCameraVideoQuality] = MIoTCameraVideoQuality.LOW,
         enable_audio: bool = False,
         enable_reconnect: bool = False,
+        decode_policy: Optional[MIoTCameraDecodePolicy] = None,
+        enable_record: bool = False,
+        record_path: Optional[str] = None,
+        record_segment_duration: int = 60,
+        record_format: MIoTCameraRecordFormat = MIoTCameraRecordFormat.MP4,
+        preroll_duration: int = 0,
+        preroll_max_bytes: int = 16 * 1024 * 1024,
+        enable_snapshot: bool = False,
+        audio_sample_rate: int = 16000,
+        audio_layout: str = "mono",
+        audio_format: MIoTCameraAudioFormat = MIoTCameraAudioFormat.INT16,
+        audio_chunk_duration: int = 20,
     ) -> None:
         """Start camera."""
         # Check.
@@ -752,7 +1748,22 @@ class MIoTCamera:
             _LOGGER.error("invalid pin code, %s", pin_code)
             raise MIoTCameraError("invalid pin code")
         return await self._camera_map[did].start_async(
-            pin_code=pin_code, qualities=qualities, enable_audio=enable_audio, enable_reconnect=enable_reconnect
+            pin_code=pin_code,
+            qualities=qualities,
+            enable_audio=enable_audio,
+            enable_reconnect=enable_reconnect,
+            decode_policy=decode_policy,
+            enable_record=enable_record,
+            record_path=record_path,
+            record_segment_duration=record_segment_duration,
+            record_format=record_format,
+            preroll_duration=preroll_duration,
+            preroll_max_bytes=preroll_max_bytes,
+            enable_snapshot=enable_snapshot,
+            audio_sample_rate=audio_sample_rate,
+            audio_layout=audio_layout,
+            audio_format=audio_format,
+            audio_chunk_duration=audio_chunk_duration,
         )
 
     async def stop_camera_async(self, did: str) -> None:
@@ -762,6 +1773,90 @@ class MIoTCamera:
             raise MIoTCameraError(f"camera not found, {did}")
         return await self._camera_map[did].stop_async()
 
+    async def export_clip_async(
+        self, did: str, before: int = 5, after: int = 5, channel: int = 0, path: Optional[str] = None
+    ) -> str:
+        """Export a clip around now, the camera must be started with preroll_duration."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return await self._camera_map[did].export_clip_async(before=before, after=after, channel=channel, path=path)
+
+    def frames(
+        self,
+        did: str,
+        channel: int = 0,
+        kind: MIoTCameraStreamKind = MIoTCameraStreamKind.RAW_VIDEO,
+        maxsize: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        pix_fmt: MIoTCameraPixelFormat = MIoTCameraPixelFormat.BGR24,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+        quality: int = 90,
+    ) -> MIoTCameraFrameStream:
+        """Pull based frame stream of the camera.
+        async for frame in miot_camera.frames(did, channel=0, kind="jpeg", maxsize=5)
+        maxsize/queue_policy bound the queue, BLOCK drops the newest beyond 2 * maxsize.
+        """
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        if channel < 0 or channel >= self._camera_map[did].camera_info.channel_count:
+            _LOGGER.error("invalid channel, %s, %s", did, channel)
+            raise MIoTCameraError(f"invalid channel, {did}, {channel}")
+        return self._camera_map[did].frames(
+            channel=channel,
+            kind=kind,
+            maxsize=maxsize,
+            queue_policy=queue_policy,
+            pix_fmt=pix_fmt,
+            max_fps=max_fps,
+            max_width=max_width,
+            max_height=max_height,
+            quality=quality,
+        )
+
+    async def get_pipeline_stats_async(self, did: str) -> List[MIoTCameraStageStats]:
+        """Latency of the decode and encode stages of the camera."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return self._camera_map[did].get_pipeline_stats()
+
+    async def get_stats_async(self, did: str) -> List[MIoTCameraStreamStats]:
+        """Stream health of the camera, fps, bitrate, sequence gaps and latency of each channel."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return self._camera_map[did].get_stats()
+
+    async def get_prometheus_stats_async(self) -> str:
+        """Stream health of all the cameras in the Prometheus text exposition format."""
+        return format_prometheus_stats({did: camera.get_stats() for did, camera in self._camera_map.items()})
+
+    async def get_subscriber_stats_async(self, did: str) -> List[MIoTCameraSubscriberStats]:
+        """Queue depth, lag and counters of each subscriber of the camera."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return self._camera_map[did].get_subscriber_stats()
+
+    async def get_snapshot_async(
+        self,
+        did: str,
+        image_format: MIoTCameraImageFormat | MIoTCameraPixelFormat = MIoTCameraImageFormat.JPEG,
+        max_size: Optional[int] = None,
+        channel: int = 0,
+    ) -> Optional[bytes | np.ndarray]:
+        """Get the newest picture, the camera must be started with enable_snapshot."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return await self._camera_map[did].get_snapshot_async(
+            image_format=image_format, max_size=max_size, channel=channel
+        )
+
     async def get_camera_status_async(self, did: str) -> MIoTCameraStatus:
         """Get camera status."""
         if did not in self._camera_map:
@@ -771,7 +1866,7 @@ class MIoTCamera:
 
     async def get_camera_version_async(self) -> str:
         """Get camera version."""
-        result: bytes = await self._main_loop.run_in_executor(None, self._lib_miot_camera.miot_camera_version)
+        result: bytes = await self._native_executor.run_async(self._lib_miot_camera.miot_camera_version)
         return result.decode("utf-8")
 
     async def register_status_changed_async(
@@ -792,15 +1887,35 @@ class MIoTCamera:
             raise MIoTCameraError(f"camera not found, {did}")
         return await self._camera_map[did].unregister_status_changed_async(reg_id=reg_id)
 
+    async def register_resync_async(
+        self, did: str, callback: Callable[[str, int, int, int], Coroutine], multi_reg: bool = False
+    ) -> int:
+        """Register decoder resync.
+        async def on_resync_async(did: str, seq: int, lost: int, channel: int)
+        """
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        return await self._camera_map[did].register_resync_async(callback=callback, multi_reg=multi_reg)
+
+    async def unregister_resync_async(self, did: str, reg_id: int = 0) -> None:
+        """Unregister decoder resync."""
+        if did not in self._camera_map:
+            raise MIoTCameraError(f"camera not found, {did}")
+        return await self._camera_map[did].unregister_resync_async(reg_id=reg_id)
+
     async def register_raw_video_async(
         self,
         did: str,
         callback: Callable[[str, bytes, int, int, int], Coroutine],
         channel: int = 0,
         multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register raw video.
         async def on_raw_video_async(did: str, data: bytes, ts: int, seq: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         if did not in self._camera_map:
             _LOGGER.error("camera not found, %s", did)
@@ -810,7 +1925,7 @@ class MIoTCamera:
             raise MIoTCameraError(f"invalid channel, {did}, {channel}")
 
         return await self._camera_map[did].register_raw_video_async(
-            callback=callback, channel=channel, multi_reg=multi_reg
+            callback=callback, channel=channel, multi_reg=multi_reg, queue_size=queue_size, queue_policy=queue_policy
         )
 
     async def unregister_raw_video_async(self, did: str, channel: int = 0, reg_id: int = 0) -> None:
@@ -830,9 +1945,12 @@ class MIoTCamera:
         callback: Callable[[str, bytes, int, int, int], Coroutine],
         channel: int = 0,
         multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register raw audio.
         async def on_raw_audio_async(did: str, data: bytes, ts: int, seq: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         if did not in self._camera_map:
             _LOGGER.error("camera not found, %s", did)
@@ -842,7 +1960,7 @@ class MIoTCamera:
             raise MIoTCameraError(f"invalid channel, {did}, {channel}")
 
         return await self._camera_map[did].register_raw_audio_async(
-            callback=callback, channel=channel, multi_reg=multi_reg
+            callback=callback, channel=channel, multi_reg=multi_reg, queue_size=queue_size, queue_policy=queue_policy
         )
 
     async def unregister_raw_audio_async(self, did: str, channel: int = 0, reg_id: int = 0) -> None:
@@ -857,10 +1975,22 @@ class MIoTCamera:
         return await self._camera_map[did].unregister_raw_audio_async(channel=channel, reg_id=reg_id)
 
     async def register_decode_jpg_async(
-        self, did: str, callback: Callable[[str, bytes, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        did: str,
+        callback: Callable[[str, bytes, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+        image_format: MIoTCameraImageFormat = MIoTCameraImageFormat.JPEG,
+        quality: int = 90,
     ) -> int:
         """Register decode jpg.
         async def on_decode_jpg_async(did: str, data: bytes, ts: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         if did not in self._camera_map:
             _LOGGER.error("camera not found, %s", did)
@@ -869,7 +1999,16 @@ class MIoTCamera:
             _LOGGER.error("invalid channel, %s, %s", did, channel)
             raise MIoTCameraError(f"invalid channel, {did}, {channel}")
         return await self._camera_map[did].register_decode_jpg_async(
-            callback=callback, channel=channel, multi_reg=multi_reg
+            callback=callback,
+            channel=channel,
+            multi_reg=multi_reg,
+            queue_size=queue_size,
+            queue_policy=queue_policy,
+            max_fps=max_fps,
+            max_width=max_width,
+            max_height=max_height,
+            image_format=image_format,
+            quality=quality,
         )
 
     async def unregister_decode_jpg_async(self, did: str, channel: int = 0, reg_id: int = 0) -> None:
@@ -882,11 +2021,64 @@ class MIoTCamera:
             raise MIoTCameraError(f"invalid channel, {did}, {channel}")
         return await self._camera_map[did].unregister_decode_jpg_async(channel=channel, reg_id=reg_id)
 
+    async def register_decode_frame_async(
+        self,
+        did: str,
+        callback: Callable[[str, np.ndarray, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        pix_fmt: MIoTCameraPixelFormat = MIoTCameraPixelFormat.BGR24,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
+        max_fps: Optional[float] = None,
+        max_width: int = 0,
+        max_height: int = 0,
+    ) -> int:
+        """Register decode frame.
+        async def on_decode_frame_async(did: str, frame: np.ndarray, ts: int, channel: int)
+        yuv420p frames are planar I420 stacked in one (height * 3 / 2, width) array, see MIoTCameraPixelFormat.
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
+        """
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        if channel < 0 or channel >= self._camera_map[did].camera_info.channel_count:
+            _LOGGER.error("invalid channel, %s, %s", did, channel)
+            raise MIoTCameraError(f"invalid channel, {did}, {channel}")
+        return await self._camera_map[did].register_decode_frame_async(
+            callback=callback,
+            channel=channel,
+            multi_reg=multi_reg,
+            pix_fmt=pix_fmt,
+            queue_size=queue_size,
+            queue_policy=queue_policy,
+            max_fps=max_fps,
+            max_width=max_width,
+            max_height=max_height,
+        )
+
+    async def unregister_decode_frame_async(self, did: str, channel: int = 0, reg_id: int = 0) -> None:
+        """Unregister decode frame."""
+        if did not in self._camera_map:
+            _LOGGER.error("camera not found, %s", did)
+            raise MIoTCameraError(f"camera not found, {did}")
+        if channel < 0 or channel >= self._camera_map[did].camera_info.channel_count:
+            _LOGGER.error("invalid channel, %s, %s", did, channel)
+            raise MIoTCameraError(f"invalid channel, {did}, {channel}")
+        return await self._camera_map[did].unregister_decode_frame_async(channel=channel, reg_id=reg_id)
+
     async def register_decode_pcm_async(
-        self, did: str, callback: Callable[[str, bytes, int, int], Coroutine], channel: int = 0, multi_reg: bool = False
+        self,
+        did: str,
+        callback: Callable[[str, bytes, int, int], Coroutine],
+        channel: int = 0,
+        multi_reg: bool = False,
+        queue_size: int = 30,
+        queue_policy: Optional[MIoTCameraQueuePolicy] = None,
     ) -> int:
         """Register decode pcm.
         async def on_decode_pcm_async(did: str, data: bytes, ts: int, channel: int)
+        queue_size/queue_policy bound the backlog of a slow callback, BLOCK drops the newest beyond 2 * queue_size.
         """
         if did not in self._camera_map:
             _LOGGER.error("camera not found, %s", did)
@@ -895,7 +2087,7 @@ class MIoTCamera:
             _LOGGER.error("invalid channel, %s, %s", did, channel)
             raise MIoTCameraError(f"invalid channel, {did}, {channel}")
         return await self._camera_map[did].register_decode_pcm_async(
-            callback=callback, channel=channel, multi_reg=multi_reg
+            callback=callback, channel=channel, multi_reg=multi_reg, queue_size=queue_size, queue_policy=queue_policy
         )
 
     async def unregister_decode_pcm_async(self, did: str, channel: int = 0, reg_id: int = 0) -> None:
@@ -914,6 +2106,20 @@ class MIoTCamera:
         _LOGGER.info(msg.decode("utf-8"))
 
 
+def format_prometheus_stats(stats: Dict[str, List[MIoTCameraStreamStats]]) -> str:
+    """Prometheus text exposition of the stream stats, key: did."""
+    lines: List[str] = []
+    for field, name, metric_type in _MIOT_CAMERA_STREAM_METRICS:
+        lines.append(f"# HELP {name} {MIoTCameraStreamStats.model_fields[field].description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for did, items in stats.items():
+            label_did: str = did.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            for item in items:
+                labels: str = f'did="{label_did}",channel="{item.channel}",kind="{item.kind.value}"'
+                lines.append(f"{name}{{{labels}}} {getattr(item, field)}")
+    return "\n".join(lines) + "\n"
+
+
 async def get_camera_extra_info() -> MIoTCameraExtraInfo:
     """Get cameras extra info."""
     # TODO: Get from cloud.
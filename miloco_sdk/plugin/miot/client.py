@@ -18,6 +18,9 @@ from miloco_sdk.plugin.miot.network import MIoTNetwork
 from miloco_sdk.utils.const import CLOUD_SERVER_DEFAULT, SYSTEM_LANGUAGE_DEFAULT
 from miloco_sdk.utils.types import (
     MIoTAppNotify,
+    MIoTCameraDecoderOptions,
+    MIoTCameraDecodePolicy,
+    MIoTCameraDecodeWorkerMode,
     MIoTCameraExtraInfo,
     MIoTCameraInfo,
     MIoTCameraStatus,
@@ -58,6 +61,9 @@ class MIoTClient:
     _network_client: MIoTNetwork
     _lan_client: MIoTLan
     _camera_client: MIoTCamera
+    _camera_decode_workers: int
+    _camera_decode_max_fps: Optional[float]
+    _camera_decode_worker_mode: MIoTCameraDecodeWorkerMode
 
     _cameras_buffer: Optional[Dict[str, MIoTCameraInfo]]
     _last_lan_ping_ts: int
@@ -75,6 +81,9 @@ class MIoTClient:
         oauth_info: Optional[MIoTOauthInfo | Dict] = None,
         cloud_server: Optional[str] = None,
         loop: Optional[asyncio.AbstractEventLoop] = None,
+        camera_decode_workers: int = 0,
+        camera_decode_max_fps: Optional[float] = None,
+        camera_decode_worker_mode: MIoTCameraDecodeWorkerMode = MIoTCameraDecodeWorkerMode.THREAD,
     ) -> None:
         """MIoT Client init.
         **MUST call `init_async` after initialization.**
@@ -87,6 +96,12 @@ class MIoTClient:
             cloud_server (Optional[str], optional): The area where the server is located,
                 Such as `cn`, `ru`. Defaults to None.
             loop (Optional[asyncio.AbstractEventLoop], optional): Main loop. Defaults to None.
+            camera_decode_workers (int, optional): Decode workers shared by all cameras,
+                0 for a decode thread per camera channel. Defaults to 0.
+            camera_decode_max_fps (Optional[float], optional): Total decoded video frames per second
+                of the shared decode workers. Defaults to None.
+            camera_decode_worker_mode (MIoTCameraDecodeWorkerMode, optional): `process` decodes video in
+                worker processes with shared memory frame transport. Defaults to `thread`.
 
         """
         if not uuid:
@@ -104,6 +119,10 @@ class MIoTClient:
         self._cloud_server = cloud_server or CLOUD_SERVER_DEFAULT
         self._lang = lang or SYSTEM_LANGUAGE_DEFAULT
 
+        self._camera_decode_workers = camera_decode_workers
+        self._camera_decode_max_fps = camera_decode_max_fps
+        self._camera_decode_worker_mode = camera_decode_worker_mode
+
         self._cameras_buffer = None
         self._last_lan_ping_ts = 0
         self._callbacks_lan_device_status_changed = {}
@@ -191,6 +210,9 @@ class MIoTClient:
             cloud_server=self._cloud_server,
             access_token=self._oauth_info.access_token if self._oauth_info else "",
             loop=self._main_loop,
+            decode_workers=self._camera_decode_workers,
+            decode_max_fps=self._camera_decode_max_fps,
+            decode_worker_mode=self._camera_decode_worker_mode,
         )
         await self._camera_client.init_async()
         self._init_done = True
@@ -419,18 +441,31 @@ class MIoTClient:
         self._last_lan_ping_ts = ts_now
 
     async def create_camera_instance_async(
-        self, camera_info: MIoTCameraInfo, frame_interval: int = 500, enable_hw_accel: bool = True
+        self,
+        camera_info: MIoTCameraInfo,
+        frame_interval: int = 500,
+        enable_hw_accel: bool = True,
+        decode_policy: MIoTCameraDecodePolicy = MIoTCameraDecodePolicy.ALL,
+        decoder_options: Optional[MIoTCameraDecoderOptions] = None,
     ) -> MIoTCameraInstance:
         """Create camera instance.
 
         Args:
             camera_info (MIoTCameraInfo): Camera info.
+            decode_policy (MIoTCameraDecodePolicy): Video decode policy, use `keyframes_only` for
+                low rate snapshot consumers. Defaults to `all`.
+            decoder_options (MIoTCameraDecoderOptions): Video decoder threading and quality options.
+                Defaults to the codec defaults.
 
         Returns:
             MIoTCameraInstance: MIoT camera instance.
         """
         return await self._camera_client.create_camera_async(
-            camera_info=camera_info, frame_interval=frame_interval, enable_hw_accel=enable_hw_accel
+            camera_info=camera_info,
+            frame_interval=frame_interval,
+            enable_hw_accel=enable_hw_accel,
+            decode_policy=decode_policy,
+            decoder_options=decoder_options,
         )
 
     async def get_camera_instance_async(self, did: str) -> Optional[MIoTCameraInstance]:
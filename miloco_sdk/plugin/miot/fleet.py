@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2025 Xiaomi Corporation
+# This software may be used and distributed according to the terms of the Xiaomi Miloco License Agreement.
+"""
+MIoT Camera Fleet.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from miloco_sdk.plugin.miot.camera import MIoTCamera, MIoTCameraInstance
+from miloco_sdk.utils.error import MIoTCameraError
+from miloco_sdk.utils.types import (
+    MIoTCameraFleetMember,
+    MIoTCameraFleetState,
+    MIoTCameraInfo,
+    MIoTCameraStatus,
+    MIoTCameraVideoQuality,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MIoTCameraFleet:
+    """MIoT Camera Fleet, many cameras sharing one MIoTCamera.
+    At most max_concurrency cameras connect at a time, a slot is held until the first connect result,
+    each start waits a random jitter so that the connects do not burst.
+    """
+
+    _camera_client: MIoTCamera
+    _max_concurrency: int
+    # second
+    _start_jitter: float
+    _connect_timeout: float
+    _semaphore: asyncio.Semaphore
+    # key: did
+    _members: Dict[str, MIoTCameraFleetMember]
+    # key: did
+    _instances: Dict[str, MIoTCameraInstance]
+    # key: did, set on the first connect result
+    _connect_events: Dict[str, asyncio.Event]
+    # key: did, status callback register id
+    _status_reg_ids: Dict[str, int]
+
+    def __init__(
+        self,
+        camera_client: MIoTCamera,
+        max_concurrency: int = 8,
+        start_jitter: float = 0.5,
+        connect_timeout: float = 30,
+    ) -> None:
+        if max_concurrency <= 0:
+            raise MIoTCameraError(f"invalid max concurrency, {max_concurrency}")
+        self._camera_client = camera_client
+        self._max_concurrency = max_concurrency
+        self._start_jitter = start_jitter
+        self._connect_timeout = connect_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._members = {}
+        self._instances = {}
+        self._connect_events = {}
+        self._status_reg_ids = {}
+
+    @property
+    def members(self) -> Dict[str, MIoTCameraFleetMember]:
+        """Lifecycle of each camera."""
+        return {did: member.model_copy() for did, member in self._members.items()}
+
+    @property
+    def instances(self) -> Dict[str, MIoTCameraInstance]:
+        """Created camera instances."""
+        return dict(self._instances)
+
+    def get_instance(self, did: str) -> Optional[MIoTCameraInstance]:
+        return self._instances.get(did, None)
+
+    async def start_async(
+        self,
+        cameras: List[MIoTCameraInfo | Dict],
+        qualities: MIoTCameraVideoQuality | Dict[str, MIoTCameraVideoQuality] = MIoTCameraVideoQuality.LOW,
+        on_created: Optional[Callable[[MIoTCameraInstance], Coroutine]] = None,
+        create_kwargs: Optional[Dict[str, Any]] = None,
+        **start_kwargs: Any,
+    ) -> Dict[str, MIoTCameraFleetMember]:
+        """Start the cameras, return once each of them is connected, disconnected or failed.
+        qualities: one quality for all the cameras or a quality per did, LOW for a missing did.
+        on_created: async def on_created(camera: MIoTCameraInstance), register the callbacks before the start.
+        create_kwargs are passed to create_camera_async, start_kwargs to start_async, e.g. enable_reconnect.
+        """
+        await asyncio.gather(
+            *(
+                self.__start_camera_async(
+                    camera_info=(MIoTCameraInfo(**camera_info) if isinstance(camera_info, Dict) else camera_info),
+                    qualities=qualities,
+                    on_created=on_created,
+                    create_kwargs=create_kwargs or {},
+                    start_kwargs=start_kwargs,
+                )
+                for camera_info in cameras
+            )
+        )
+        return self.members
+
+    async def stop_async(self, dids: Optional[List[str]] = None) -> None:
+        """Stop and destroy the cameras, all of them by default."""
+        targets: List[str] = list(self._instances.keys()) if dids is None else dids
+        await asyncio.gather(*(self.__stop_camera_async(did) for did in targets))
+
+    async def __start_camera_async(
+        self,
+        camera_info: MIoTCameraInfo,
+        qualities: MIoTCameraVideoQuality | Dict[str, MIoTCameraVideoQuality],
+        on_created: Optional[Callable[[MIoTCameraInstance], Coroutine]],
+        create_kwargs: Dict[str, Any],
+        start_kwargs: Dict[str, Any],
+    ) -> None:
+        did: str = camera_info.did
+        quality: MIoTCameraVideoQuality = (
+            qualities.get(did, MIoTCameraVideoQuality.LOW) if isinstance(qualities, Dict) else qualities
+        )
+        member = MIoTCameraFleetMember(did=did, quality=quality, update_ts=int(time.time()))
+        self._members[did] = member
+        async with self._semaphore:
+            if self._start_jitter > 0:
+                await asyncio.sleep(random.uniform(0, self._start_jitter))
+            start_ts: float = time.monotonic()
+            self.__set_state(member, MIoTCameraFleetState.STARTING)
+            event = asyncio.Event()
+            self._connect_events[did] = event
+            try:
+                camera = await self._camera_client.create_camera_async(camera_info=camera_info, **create_kwargs)
+                self._instances[did] = camera
+                self._status_reg_ids[did] = await camera.register_status_changed_async(
+                    self.__on_status_changed, multi_reg=True
+                )
+                if on_created:
+                    await on_created(camera)
+                await camera.start_async(qualities=quality, **start_kwargs)
+                await asyncio.wait_for(event.wait(), timeout=self._connect_timeout)
+            except asyncio.TimeoutError:
+                member.error = "connect timeout"
+                self.__set_state(member, MIoTCameraFleetState.FAILED)
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("fleet camera start error, %s, %s", did, e)
+                member.error = str(e)
+                self.__set_state(member, MIoTCameraFleetState.FAILED)
+            finally:
+                self._connect_events.pop(did, None)
+            member.start_duration = int((time.monotonic() - start_ts) * 1000)
+
+    async def __stop_camera_async(self, did: str) -> None:
+        member = self._members.get(did, None)
+        camera = self._instances.pop(did, None)
+        if member:
+            self.__set_state(member, MIoTCameraFleetState.STOPPED)
+        if not camera:
+            return
+        reg_id = self._status_reg_ids.pop(did, None)
+        if reg_id is not None:
+            await camera.unregister_status_changed_async(reg_id)
+        try:
+            await self._camera_client.destroy_camera_async(did)
+        except Exception as e:  # pylint: disable=broad-except
+            _LOGGER.error("fleet camera stop error, %s, %s", did, e)
+
+    async def __on_status_changed(self, did: str, status: MIoTCameraStatus) -> None:
+        member = self._members.get(did, None)
+        if not member or member.state == MIoTCameraFleetState.STOPPED:
+            return
+        if status == MIoTCameraStatus.CONNECTED:
+            member.connects += 1
+            self.__set_state(member, MIoTCameraFleetState.CONNECTED)
+        elif status in (MIoTCameraStatus.DISCONNECTED, MIoTCameraStatus.ERROR):
+            if member.state == MIoTCameraFleetState.CONNECTED:
+                member.disconnects += 1
+            self.__set_state(member, MIoTCameraFleetState.DISCONNECTED)
+        else:
+            # Connecting
+            return
+        event = self._connect_events.get(did, None)
+        if event:
+            # Release the start slot, a failed connect retries by itself when reconnect is enabled
+            event.set()
+
+    def __set_state(self, member: MIoTCameraFleetMember, state: MIoTCameraFleetState) -> None:
+        # _LOGGER.info("fleet camera state, %s, %s -> %s", member.did, member.state, state)
+        member.state = state
+        member.update_ts = int(time.time())
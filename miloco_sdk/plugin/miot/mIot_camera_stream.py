@@ -1,13 +1,55 @@
 import asyncio
+from typing import Dict, List, Optional
 
 from miloco_sdk.base import BaseApi
+from miloco_sdk.plugin.miot.camera import MIoTCameraInstance
 from miloco_sdk.plugin.miot.client import MIoTClient
+from miloco_sdk.plugin.miot.fleet import MIoTCameraFleet
 from miloco_sdk.utils.const import MICO_REDIRECT_URI
-from miloco_sdk.utils.types import MIoTCameraVideoQuality, MIoTOauthInfo
+from miloco_sdk.utils.types import (
+    MIoTCameraFleetMember,
+    MIoTCameraFleetState,
+    MIoTCameraInfo,
+    MIoTCameraPixelFormat,
+    MIoTCameraVideoQuality,
+    MIoTOauthInfo,
+)
 
 
 class MIoTCameraStream(BaseApi):
 
+    miot_client: Optional[MIoTClient]
+    camera_instance: Optional[MIoTCameraInstance]
+    fleet: Optional[MIoTCameraFleet]
+    _cameras: Optional[Dict[str, MIoTCameraInfo]]
+
+    def __init__(self, client=None):
+        super().__init__(client)
+        self.miot_client = None
+        self.camera_instance = None
+        self.fleet = None
+        self._cameras = None
+
+    async def get_miot_client(self) -> MIoTClient:
+        """共享的 MIoTClient，所有摄像头只初始化一次（网络探测、局域网线程、底层库初始化）。"""
+        if self.miot_client is None:
+            oauth_info = MIoTOauthInfo(access_token=self._client._access_token, refresh_token="", expires_ts=0)
+            self.miot_client = MIoTClient(
+                uuid=self._client._device_id,
+                redirect_uri=MICO_REDIRECT_URI,
+                lang="zh_CN",
+                oauth_info=oauth_info,
+            )
+            await self.miot_client.init_async()
+        return self.miot_client
+
+    async def get_cameras(self) -> Dict[str, MIoTCameraInfo]:
+        """摄像头列表，只向云端请求一次。"""
+        if self._cameras is None:
+            miot_client = await self.get_miot_client()
+            self._cameras = await miot_client.get_cameras_async()
+        return self._cameras
+
     async def run_stream(
         self,
         did: str,
@@ -16,70 +58,142 @@ class MIoTCameraStream(BaseApi):
         on_decode_jpg_callback=None,
         on_raw_audio_callback=None,
         on_decode_pcm_callback=None,
-        video_quality=MIoTCameraVideoQuality.LOW # 清晰度， 默认 LOW，可改成 HIGH
+        video_quality=MIoTCameraVideoQuality.LOW, # 清晰度， 默认 LOW，可改成 HIGH
+        on_decode_frame_callback=None,
+        pix_fmt=MIoTCameraPixelFormat.BGR24,  # 解码帧像素格式，用于 on_decode_frame_callback
+        enable_snapshot=False,  # 缓存最近 GOP，按需通过 get_snapshot_async 解码截图
     ) -> None:
         """从小米云端获取并打印摄像头原始视频流信息。"""
-        # 解析 oauth_info
-        oauth_dict = {"access_token": self._client._access_token, "refresh_token": "", "expires_ts": 0}
-        oauth_info = MIoTOauthInfo(**oauth_dict)
-
-        # 初始化 MIoTClient
-        self.miot_client = MIoTClient(
-            uuid=self._client._device_id,
-            redirect_uri=MICO_REDIRECT_URI,
-            lang="zh_CN",
-            oauth_info=oauth_info,
-        )
-        await self.miot_client.init_async()
-
         # 获取摄像头列表，并找到我们的 did
-        cameras = await self.miot_client.get_cameras_async()
+        cameras = await self.get_cameras()
         camera_info = cameras[did]
 
         # 创建摄像头实例
-        self.camera_instance = await self.miot_client.create_camera_instance_async(
+        miot_client = await self.get_miot_client()
+        self.camera_instance = await miot_client.create_camera_instance_async(
             camera_info=camera_info,
             frame_interval=500,  # 毫秒，内部解码用
             enable_hw_accel=False,  # 关闭硬件加速，脚本调试更稳定
         )
+        await self._register_callbacks(
+            self.camera_instance,
+            channel,
+            on_raw_video_callback=on_raw_video_callback,
+            on_decode_jpg_callback=on_decode_jpg_callback,
+            on_raw_audio_callback=on_raw_audio_callback,
+            on_decode_pcm_callback=on_decode_pcm_callback,
+            on_decode_frame_callback=on_decode_frame_callback,
+            pix_fmt=pix_fmt,
+        )
 
+        # 启动摄像头（拉流）
+        await self.camera_instance.start_async(
+            qualities=video_quality,
+            pin_code=None,  # 如有摄像头 PIN 码就在这里填 4 位字符串
+            enable_audio=True,  # 如需音频可改为 True
+            enable_reconnect=True,  # 断线自动重连
+            enable_record=False,
+            enable_snapshot=enable_snapshot,
+        )
+
+    async def run_fleet(
+        self,
+        dids: List[str],
+        channel: int = 0,
+        on_raw_video_callback=None,
+        on_decode_jpg_callback=None,
+        on_raw_audio_callback=None,
+        on_decode_pcm_callback=None,
+        video_quality: MIoTCameraVideoQuality | Dict[str, MIoTCameraVideoQuality] = MIoTCameraVideoQuality.LOW,
+        on_decode_frame_callback=None,
+        pix_fmt=MIoTCameraPixelFormat.BGR24,
+        enable_snapshot=False,
+        max_concurrency: int = 8,  # 同时建连的摄像头数
+        start_jitter: float = 0.5,  # 每路启动前的随机延迟上限，秒
+    ) -> Dict[str, MIoTCameraFleetMember]:
+        """共享一个 MIoTClient 并发拉多路摄像头流，返回每路摄像头的状态。
+        video_quality 可按 did 分别设置。
+        """
+        cameras = await self.get_cameras()
+        miot_client = await self.get_miot_client()
+        if self.fleet is None:
+            self.fleet = MIoTCameraFleet(
+                miot_client.camera_client, max_concurrency=max_concurrency, start_jitter=start_jitter
+            )
+
+        async def on_created(camera_instance: MIoTCameraInstance) -> None:
+            await self._register_callbacks(
+                camera_instance,
+                channel,
+                on_raw_video_callback=on_raw_video_callback,
+                on_decode_jpg_callback=on_decode_jpg_callback,
+                on_raw_audio_callback=on_raw_audio_callback,
+                on_decode_pcm_callback=on_decode_pcm_callback,
+                on_decode_frame_callback=on_decode_frame_callback,
+                pix_fmt=pix_fmt,
+            )
+
+        members = await self.fleet.start_async(
+            [cameras[did] for did in dids if did in cameras],
+            qualities=video_quality,
+            on_created=on_created,
+            create_kwargs={"frame_interval": 500, "enable_hw_accel": False},
+            enable_audio=True,
+            enable_reconnect=True,
+            enable_snapshot=enable_snapshot,
+        )
+        for did in dids:
+            if did not in cameras:
+                members[did] = MIoTCameraFleetMember(did=did, state=MIoTCameraFleetState.FAILED, error="not found")
+        return members
+
+    async def _register_callbacks(
+        self,
+        camera_instance: MIoTCameraInstance,
+        channel: int,
+        on_raw_video_callback=None,
+        on_decode_jpg_callback=None,
+        on_raw_audio_callback=None,
+        on_decode_pcm_callback=None,
+        on_decode_frame_callback=None,
+        pix_fmt=MIoTCameraPixelFormat.BGR24,
+    ) -> None:
         if on_raw_video_callback:
-            await self.camera_instance.register_raw_video_async(
+            await camera_instance.register_raw_video_async(
                 callback=on_raw_video_callback,
                 channel=channel,
                 multi_reg=False,
             )
 
         if on_decode_jpg_callback:
-            await self.camera_instance.register_decode_jpg_async(
+            await camera_instance.register_decode_jpg_async(
                 callback=on_decode_jpg_callback,
                 channel=channel,
                 multi_reg=False,
             )
 
+        if on_decode_frame_callback:
+            await camera_instance.register_decode_frame_async(
+                callback=on_decode_frame_callback,
+                channel=channel,
+                multi_reg=False,
+                pix_fmt=pix_fmt,
+            )
+
         if on_raw_audio_callback:
-            await self.camera_instance.register_raw_audio_async(
+            await camera_instance.register_raw_audio_async(
                 callback=on_raw_audio_callback,
                 channel=channel,
                 multi_reg=False,
             )
 
         if on_decode_pcm_callback:
-            await self.camera_instance.register_decode_pcm_async(
+            await camera_instance.register_decode_pcm_async(
                 callback=on_decode_pcm_callback,
                 channel=channel,
                 multi_reg=False,
             )
 
-        # 启动摄像头（拉流）
-        await self.camera_instance.start_async(
-            qualities=video_quality,
-            pin_code=None,  # 如有摄像头 PIN 码就在这里填 4 位字符串
-            enable_audio=True,  # 如需音频可改为 True
-            enable_reconnect=True,  # 断线自动重连
-            enable_record=False,
-        )
-
     async def wait_for_data(self):
         print("开始接收摄像头数据，按 Ctrl+C 结束...")
         try:
@@ -93,5 +207,13 @@ class MIoTCameraStream(BaseApi):
             await self.cleanup()
 
     async def cleanup(self):
-        await self.camera_instance.stop_async()
-        await self.miot_client.deinit_async()
+        if self.fleet:
+            await self.fleet.stop_async()
+            self.fleet = None
+        if self.camera_instance:
+            await self.camera_instance.stop_async()
+            self.camera_instance = None
+        if self.miot_client:
+            await self.miot_client.deinit_async()
+            self.miot_client = None
+            self._cameras = None
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2025 Xiaomi Corporation
+# This software may be used and distributed according to the terms of the Xiaomi Miloco License Agreement.
+"""
+MIoT Camera Replay.
+Stand-in of libmiot_camera_lite replaying frame files, no cloud connection needed.
+"""
+import heapq
+import logging
+import random
+import struct
+import threading
+import time
+from ctypes import POINTER, c_uint8, cast, pointer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from miloco_sdk.plugin.miot.camera import _MIoTCameraFrameHeaderC, _MIoTCameraInstanceC
+from miloco_sdk.utils.error import MIoTCameraError
+from miloco_sdk.utils.types import MIoTCameraCodec, MIoTCameraFrame, MIoTCameraStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+# File header of a frame file, then a frame header and the payload for each frame
+_MIOT_CAMERA_FRAME_FILE_MAGIC: bytes = b"MIOTFRM1"
+# codec_id, length, timestamp, sequence, frame_type, channel
+_MIOT_CAMERA_FRAME_HEADER = struct.Struct("<IIQIIB")
+
+_MIOT_CAMERA_REPLAY_VERSION: bytes = b"replay-1.0.0"
+# Log levels of the log handler
+_MIOT_CAMERA_LOG_INFO: int = 2
+_MIOT_CAMERA_LOG_ERROR: int = 4
+
+
+def dump_frames(path: str, frames: List[MIoTCameraFrame]) -> None:
+    """Write frames to a frame file."""
+    with open(path, "wb") as f:
+        f.write(_MIOT_CAMERA_FRAME_FILE_MAGIC)
+        for frame in frames:
+            data: bytes = bytes(frame.data)
+            f.write(
+                _MIOT_CAMERA_FRAME_HEADER.pack(
+                    frame.codec_id, len(data), frame.timestamp, frame.sequence, frame.frame_type, frame.channel
+                )
+            )
+            f.write(data)
+
+
+def load_frames(path: str) -> List[MIoTCameraFrame]:
+    """Read the frames of a frame file."""
+    with open(path, "rb") as f:
+        content: bytes = f.read()
+    if not content.startswith(_MIOT_CAMERA_FRAME_FILE_MAGIC):
+        raise MIoTCameraError(f"invalid frame file, {path}")
+    frames: List[MIoTCameraFrame] = []
+    offset: int = len(_MIOT_CAMERA_FRAME_FILE_MAGIC)
+    while offset < len(content):
+        codec_id, length, timestamp, sequence, frame_type, channel = _MIOT_CAMERA_FRAME_HEADER.unpack_from(
+            content, offset
+        )
+        offset += _MIOT_CAMERA_FRAME_HEADER.size
+        if offset + length > len(content):
+            raise MIoTCameraError(f"truncated frame file, {path}")
+        frames.append(
+            MIoTCameraFrame(
+                codec_id, length, timestamp, sequence, frame_type, channel, content[offset : offset + length]
+            )
+        )
+        offset += length
+    return frames
+
+
+class MIoTCameraReplaySource:
+    """Frames replayed by a camera, looped, timestamps and sequences keep increasing across loops.
+    The payloads are copied once into ctypes buffers shared by all the cameras replaying the source.
+    """
+
+    _frames: List[MIoTCameraFrame]
+    _buffers: List[Any]
+    # Offset of the frame in the loop, ms
+    _offsets: List[int]
+    # ms
+    _duration: int
+    # key: is video, value: sequence span of a loop
+    _sequence_spans: Dict[bool, int]
+
+    def __init__(self, frames: List[MIoTCameraFrame]) -> None:
+        if not frames:
+            raise MIoTCameraError("empty replay source")
+        self._frames = sorted(frames, key=lambda frame: frame.timestamp)
+        self._buffers = [(c_uint8 * len(frame.data)).from_buffer_copy(frame.data) for frame in self._frames]
+        first_ts: int = self._frames[0].timestamp
+        self._offsets = [frame.timestamp - first_ts for frame in self._frames]
+        video_ts: List[int] = [frame.timestamp for frame in self._frames if _is_video(frame)]
+        # One more frame interval so that the next loop does not start on the last frame
+        interval: int = (video_ts[-1] - video_ts[0]) // (len(video_ts) - 1) if len(video_ts) > 1 else 50
+        self._duration = self._offsets[-1] + max(1, interval)
+        self._sequence_spans = {}
+        for frame in self._frames:
+            is_video: bool = _is_video(frame)
+            self._sequence_spans[is_video] = max(self._sequence_spans.get(is_video, 0), frame.sequence + 1)
+
+    @classmethod
+    def from_file(cls, path: str) -> "MIoTCameraReplaySource":
+        """Source of a frame file written by dump_frames."""
+        return cls(load_frames(path))
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._frames)
+
+    @property
+    def duration(self) -> int:
+        """Loop duration, ms."""
+        return self._duration
+
+    def get(self, index: int) -> Tuple[MIoTCameraFrame, Any, int]:
+        """Frame of the replay index with its rewritten sequence, payload buffer, offset from the replay start in ms."""
+        loop, pos = divmod(index, len(self._frames))
+        frame: MIoTCameraFrame = self._frames[pos]
+        return (
+            frame._replace(sequence=frame.sequence + loop * self._sequence_spans[_is_video(frame)]),
+            self._buffers[pos],
+            loop * self._duration + self._offsets[pos],
+        )
+
+
+def _is_video(frame: MIoTCameraFrame) -> bool:
+    return frame.codec_id in (MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265)
+
+
+class _MIoTCameraReplayInstance:
+    """Replay state of a camera instance."""
+
+    did: str
+    model: str
+    channel_count: int
+    source: Optional[MIoTCameraReplaySource]
+    status: MIoTCameraStatus
+    status_callback: Optional[Callable]
+    # key: channel
+    raw_callbacks: Dict[int, Callable]
+    enable_audio: bool
+    # Bumped on stop and disconnect, scheduled frames of an old run are dropped
+    generation: int
+    # Timestamp base of the current run, ms
+    base_ts: int
+    start_mono: float
+
+    def __init__(self, did: str, model: str, channel_count: int, source: Optional[MIoTCameraReplaySource]) -> None:
+        self.did = did
+        self.model = model
+        self.channel_count = channel_count
+        self.source = source
+        self.status = MIoTCameraStatus.DISCONNECTED
+        self.status_callback = None
+        self.raw_callbacks = {}
+        self.enable_audio = False
+        self.generation = 0
+        self.base_ts = 0
+        self.start_mono = 0.0
+
+
+class MIoTCameraReplayLib:
+    """Stand-in of libmiot_camera_lite, same call surface as the ctypes library.
+    Pass it as lib_miot_camera of MIoTCamera, the cameras replay their source with the recorded timing
+    through the same native callbacks, a single replay thread serves all the cameras.
+    connect_delay: second miot_camera_start blocks while connecting.
+    start_failure_rate: share of miot_camera_start calls failing.
+    disconnect_interval: mean seconds between random disconnects, 0 never disconnects.
+    speed: replay speed, 2 replays twice as fast as recorded.
+    """
+
+    # key: did, a source for all the cameras with the key ""
+    _sources: Dict[str, MIoTCameraReplaySource]
+    _connect_delay: float
+    _start_failure_rate: float
+    _disconnect_interval: float
+    _speed: float
+    _random: random.Random
+
+    _lock: threading.Condition
+    # key: handle
+    _instances: Dict[int, _MIoTCameraReplayInstance]
+    _next_handle: int
+    # format: due monotonic time, order, handle, generation, frame index, -1 for a disconnect
+    _schedule: List[Tuple[float, int, int, int, int]]
+    _order: int
+    _thread: Optional[threading.Thread]
+    _running: bool
+    _log_handler: Optional[Callable]
+    _access_token: Optional[bytes]
+    _delivered: int
+
+    def __init__(
+        self,
+        sources: MIoTCameraReplaySource | Dict[str, MIoTCameraReplaySource],
+        connect_delay: float = 0.2,
+        start_failure_rate: float = 0.0,
+        disconnect_interval: float = 0.0,
+        speed: float = 1.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        if speed <= 0:
+            raise MIoTCameraError(f"invalid replay speed, {speed}")
+        self._sources = {"": sources} if isinstance(sources, MIoTCameraReplaySource) else dict(sources)
+        self._connect_delay = connect_delay
+        self._start_failure_rate = start_failure_rate
+        self._disconnect_interval = disconnect_interval
+        self._speed = speed
+        self._random = random.Random(seed)
+
+        self._lock = threading.Condition()
+        self._instances = {}
+        self._next_handle = 1
+        self._schedule = []
+        self._order = 0
+        self._thread = None
+        self._running = False
+        self._log_handler = None
+        self._access_token = None
+        self._delivered = 0
+
+    @property
+    def delivered(self) -> int:
+        """Frames handed to the raw data callbacks."""
+        return self._delivered
+
+    def disconnect(self, did: str) -> None:
+        """Drop the connection of a camera now, like a network loss."""
+        with self._lock:
+            handles: List[int] = [handle for handle, ins in self._instances.items() if ins.did == did]
+        for handle in handles:
+            self.__disconnect(handle)
+
+    def miot_camera_set_log_handler(self, handler: Optional[Callable]) -> None:
+        self._log_handler = handler
+
+    def miot_camera_init(self, host: bytes, client_id: bytes, access_token: bytes) -> int:
+        self._access_token = access_token
+        with self._lock:
+            if not self._thread:
+                self._running = True
+                self._thread = threading.Thread(target=self.__replay_loop, name="miot_camera_replay", daemon=True)
+                self._thread.start()
+        self.__log(_MIOT_CAMERA_LOG_INFO, f"replay init, {host.decode('utf-8')}")
+        return 0
+
+    def miot_camera_deinit(self) -> None:
+        with self._lock:
+            self._running = False
+            self._schedule.clear()
+            self._lock.notify()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+
+    def miot_camera_update_access_token(self, access_token: bytes) -> int:
+        self._access_token = access_token
+        return 0
+
+    def miot_camera_version(self) -> bytes:
+        return _MIOT_CAMERA_REPLAY_VERSION
+
+    def miot_camera_new(self, camera_info: Any) -> _MIoTCameraInstanceC:
+        # byref() argument or pointer
+        info = getattr(camera_info, "_obj", None) or camera_info.contents
+        did: str = info.did.decode("utf-8")
+        with self._lock:
+            handle: int = self._next_handle
+            self._next_handle += 1
+            self._instances[handle] = _MIoTCameraReplayInstance(
+                did=did,
+                model=info.model.decode("utf-8"),
+                channel_count=info.channel_count or 1,
+                source=self._sources.get(did, self._sources.get("")),
+            )
+        return _MIoTCameraInstanceC(handle)
+
+    def miot_camera_free(self, c_instance: _MIoTCameraInstanceC) -> None:
+        with self._lock:
+            ins = self._instances.pop(c_instance.value, None)
+            if ins:
+                ins.generation += 1
+
+    def miot_camera_start(self, c_instance: _MIoTCameraInstanceC, config: Any) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins:
+            return -1
+        if ins.status == MIoTCameraStatus.CONNECTED:
+            return 0
+        cfg = getattr(config, "_obj", None) or config.contents
+        self.__set_status(ins, MIoTCameraStatus.CONNECTING)
+        # Blocking like the native library
+        time.sleep(self._connect_delay)
+        if not ins.source or self._random.random() < self._start_failure_rate:
+            self.__log(_MIOT_CAMERA_LOG_ERROR, f"replay connect failed, {ins.did}")
+            self.__set_status(ins, MIoTCameraStatus.DISCONNECTED)
+            return -1
+        with self._lock:
+            if c_instance.value not in self._instances:
+                return -1
+            ins.generation += 1
+            ins.enable_audio = bool(cfg.enable_audio)
+            ins.base_ts = int(time.time() * 1000)
+            ins.start_mono = time.monotonic()
+            self.__schedule(ins.start_mono, c_instance.value, ins.generation, 0)
+            if self._disconnect_interval > 0:
+                self.__schedule(
+                    ins.start_mono + self._random.expovariate(1 / self._disconnect_interval),
+                    c_instance.value,
+                    ins.generation,
+                    -1,
+                )
+        self.__set_status(ins, MIoTCameraStatus.CONNECTED)
+        return 0
+
+    def miot_camera_stop(self, c_instance: _MIoTCameraInstanceC) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins:
+            return -1
+        with self._lock:
+            ins.generation += 1
+        if ins.status != MIoTCameraStatus.DISCONNECTED:
+            self.__set_status(ins, MIoTCameraStatus.DISCONNECTED)
+        return 0
+
+    def miot_camera_status(self, c_instance: _MIoTCameraInstanceC) -> int:
+        ins = self.__get_instance(c_instance)
+        return ins.status.value if ins else MIoTCameraStatus.ERROR.value
+
+    def miot_camera_register_status_changed(self, c_instance: _MIoTCameraInstanceC, callback: Callable) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins:
+            return -1
+        ins.status_callback = callback
+        return 0
+
+    def miot_camera_unregister_status_changed(self, c_instance: _MIoTCameraInstanceC) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins:
+            return -1
+        ins.status_callback = None
+        return 0
+
+    def miot_camera_register_raw_data(self, c_instance: _MIoTCameraInstanceC, callback: Callable, channel: int) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins or channel >= ins.channel_count:
+            return -1
+        with self._lock:
+            ins.raw_callbacks[channel] = callback
+        return 0
+
+    def miot_camera_unregister_raw_data(self, c_instance: _MIoTCameraInstanceC, channel: int) -> int:
+        ins = self.__get_instance(c_instance)
+        if not ins:
+            return -1
+        with self._lock:
+            ins.raw_callbacks.pop(channel, None)
+        return 0
+
+    def __get_instance(self, c_instance: _MIoTCameraInstanceC) -> Optional[_MIoTCameraReplayInstance]:
+        with self._lock:
+            return self._instances.get(c_instance.value)
+
+    def __schedule(self, due: float, handle: int, generation: int, index: int) -> None:
+        """Schedule a frame or a disconnect, MUST hold the lock."""
+        heapq.heappush(self._schedule, (due, self._order, handle, generation, index))
+        self._order += 1
+        self._lock.notify()
+
+    def __set_status(self, ins: _MIoTCameraReplayInstance, status: MIoTCameraStatus) -> None:
+        ins.status = status
+        callback = ins.status_callback
+        if callback:
+            callback(status.value)
+
+    def __disconnect(self, handle: int) -> None:
+        with self._lock:
+            ins = self._instances.get(handle)
+            if not ins or ins.status != MIoTCameraStatus.CONNECTED:
+                return
+            ins.generation += 1
+        self.__log(_MIOT_CAMERA_LOG_INFO, f"replay disconnected, {ins.did}")
+        self.__set_status(ins, MIoTCameraStatus.DISCONNECTED)
+
+    def __log(self, level: int, msg: str) -> None:
+        if self._log_handler:
+            self._log_handler(level, msg.encode("utf-8"))
+
+    def __replay_loop(self) -> None:
+        while True:
+            with self._lock:
+                while self._running and (not self._schedule or self._schedule[0][0] > time.monotonic()):
+                    self._lock.wait(self._schedule[0][0] - time.monotonic() if self._schedule else None)
+                if not self._running:
+                    break
+                _, _, handle, generation, index = heapq.heappop(self._schedule)
+                ins = self._instances.get(handle)
+                if not ins or ins.generation != generation or not ins.source:
+                    continue
+                if index < 0:
+                    callback = None
+                else:
+                    frame, buf, offset = ins.source.get(index)
+                    callback = ins.raw_callbacks.get(frame.channel)
+                    if not ins.enable_audio and not _is_video(frame):
+                        callback = None
+                    # The next frame, paced by the recorded timestamps
+                    _, _, next_offset = ins.source.get(index + 1)
+                    self.__schedule(ins.start_mono + next_offset / 1000 / self._speed, handle, generation, index + 1)
+            if index < 0:
+                self.__disconnect(handle)
+                continue
+            if not callback:
+                continue
+            header = _MIoTCameraFrameHeaderC(
+                frame.codec_id,
+                frame.length,
+                ins.base_ts + int(offset / self._speed),
+                frame.sequence,
+                frame.frame_type,
+                frame.channel,
+            )
+            try:
+                callback(pointer(header), cast(buf, POINTER(c_uint8)))
+                self._delivered += 1
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("replay raw data callback error, %s, %s", ins.did, e)
@@ -49,6 +49,8 @@ MANUFACTURER_EFFECTIVE_TIME = 3600 * 24 * 30
 # Camera reconnect interval, seconds
 CAMERA_RECONNECT_TIME_MIN: int = 3
 CAMERA_RECONNECT_TIME_MAX: int = 1200
+# Camera stream stats window, seconds
+CAMERA_STATS_WINDOW: int = 10
 
 CLOUD_SERVER_DEFAULT: str = "cn"
 CLOUD_SERVERS: dict = {
@@ -4,99 +4,813 @@
 """
 MIoT Decoder.
 """
+import abc
 import asyncio
+import itertools
 import logging
+import math
+import multiprocessing
+import os
+import signal
 import subprocess
 import threading
 import time
 from collections import deque
+from ctypes import addressof, c_uint8, memmove, string_at
+from fractions import Fraction
 from io import BytesIO
-from typing import Callable, Coroutine, List, Optional
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Coroutine, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+import av
+import numpy as np
 from av.audio.codeccontext import AudioCodecContext
 from av.audio.frame import AudioFrame
+from av.audio.layout import AudioLayout
 from av.audio.resampler import AudioResampler
 from av.codec import CodecContext
+from av.codec.context import Flags, Flags2
+from av.container import OutputContainer
 from av.packet import Packet
 from av.video.codeccontext import VideoCodecContext
 from av.video.frame import VideoFrame
-from PIL import Image
 
+from miloco_sdk.utils.dispatcher import MIoTCallbackDispatcher
 from miloco_sdk.utils.error import MIoTMediaDecoderError
-from miloco_sdk.utils.types import MIoTCameraCodec, MIoTCameraFrameData, MIoTCameraFrameType
+from miloco_sdk.utils.types import (
+    MIoTCameraAudioFormat,
+    MIoTCameraCodec,
+    MIoTCameraDecodeDiscard,
+    MIoTCameraDecodePolicy,
+    MIoTCameraDecoderOptions,
+    MIoTCameraDecodeWorkerMode,
+    MIoTCameraFrame,
+    MIoTCameraFrameType,
+    MIoTCameraImageFormat,
+    MIoTCameraPixelFormat,
+    MIoTCameraRecordFormat,
+    MIoTCameraRecordSegment,
+    MIoTCameraStageStats,
+    MIoTCameraStreamKind,
+    MIoTCameraStreamStats,
+    MIoTCameraVariant,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
 
+def _g711_alaw_table() -> np.ndarray:
+    """A-law code to 16 bit linear PCM, ITU-T G.711."""
+    code = np.arange(256, dtype=np.int32) ^ 0x55
+    seg = (code & 0x70) >> 4
+    value = ((code & 0x0F) << 4) + np.where(seg == 0, 8, 0x108)
+    value = np.where(seg > 1, value << np.maximum(seg - 1, 0), value)
+    return np.where(code & 0x80, value, -value).astype(np.int16)
+
+
+def _g711_ulaw_table() -> np.ndarray:
+    """u-law code to 16 bit linear PCM, ITU-T G.711."""
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    value = (((code & 0x0F) << 3) + 0x84) << ((code & 0x70) >> 4)
+    return np.where(code & 0x80, 0x84 - value, value - 0x84).astype(np.int16)
+
+
+class MIoTG711Decoder:
+    """G.711 A-law/u-law decoder, a whole packet is expanded by one table lookup."""
+
+    _G711_TABLES: Dict[int, np.ndarray] = {
+        MIoTCameraCodec.AUDIO_G711A: _g711_alaw_table(),
+        MIoTCameraCodec.AUDIO_G711U: _g711_ulaw_table(),
+    }
+
+    _table: np.ndarray
+    _sample_rate: int
+
+    def __init__(self, codec_id: int, sample_rate: int = 8000) -> None:
+        if codec_id not in self._G711_TABLES:
+            raise MIoTMediaDecoderError(f"unsupported g711 codec, {codec_id}")
+        self._table = self._G711_TABLES[codec_id]
+        self._sample_rate = sample_rate
+
+    def decode(self, pkt: Packet) -> List[AudioFrame]:
+        """Decode a packet to a mono s16 frame, same as CodecContext.decode."""
+        samples: np.ndarray = self._table[np.frombuffer(pkt, dtype=np.uint8)]
+        if not samples.size:
+            return []
+        frame = AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = self._sample_rate
+        return [frame]
+
+
+class MIoTAudioChunker:
+    """Resample decoded audio and slice it into fixed duration chunks.
+    Samples are written into a preallocated ring, a chunk is copied out once it is full.
+    """
+
+    _resampler: AudioResampler
+    _sample_rate: int
+    _channels: int
+    _chunk_samples: int
+    # shape: (capacity, channels)
+    _ring: np.ndarray
+    _read_pos: int
+    _fill: int
+    # Total samples written and the sample position/timestamp of the last packet
+    _written: int
+    _anchor_pos: int
+    _anchor_ts: int
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        layout: str = "mono",
+        audio_format: MIoTCameraAudioFormat = MIoTCameraAudioFormat.INT16,
+        chunk_duration: int = 20,
+    ) -> None:
+        """chunk_duration: ms."""
+        audio_format = MIoTCameraAudioFormat(audio_format)
+        self._chunk_samples = sample_rate * chunk_duration // 1000
+        if self._chunk_samples <= 0:
+            raise MIoTMediaDecoderError(f"invalid audio chunk duration, {chunk_duration}")
+        self._resampler = AudioResampler(format=audio_format.value, layout=layout, rate=sample_rate)
+        self._sample_rate = sample_rate
+        self._channels = AudioLayout(layout).nb_channels
+        # Room for a chunk and a second of resampled samples
+        self._ring = np.zeros(
+            (self._chunk_samples + sample_rate, self._channels),
+            dtype=np.int16 if audio_format == MIoTCameraAudioFormat.INT16 else np.float32,
+        )
+        self._read_pos = 0
+        self._fill = 0
+        self._written = 0
+        self._anchor_pos = 0
+        self._anchor_ts = 0
+
+    def push(self, frames: List[AudioFrame], timestamp: int) -> List[Tuple[np.ndarray, int]]:
+        """Push the decoded frames of a packet, return the full chunks and their timestamps."""
+        self._anchor_pos, self._anchor_ts = self._written, timestamp
+        chunks: List[Tuple[np.ndarray, int]] = []
+        for frame in frames:
+            for rs_frame in self._resampler.resample(frame):
+                self.__write(rs_frame.to_ndarray().reshape(-1, self._channels), chunks)
+        return chunks
+
+    def __write(self, samples: np.ndarray, chunks: List[Tuple[np.ndarray, int]]) -> None:
+        capacity: int = len(self._ring)
+        offset: int = 0
+        while offset < len(samples):
+            count: int = min(len(samples) - offset, capacity - self._fill)
+            start: int = (self._read_pos + self._fill) % capacity
+            first: int = min(count, capacity - start)
+            self._ring[start : start + first] = samples[offset : offset + first]
+            self._ring[: count - first] = samples[offset + first : offset + count]
+            offset += count
+            self._fill += count
+            self._written += count
+            while self._fill >= self._chunk_samples:
+                chunks.append(self.__read_chunk())
+
+    def __read_chunk(self) -> Tuple[np.ndarray, int]:
+        capacity: int = len(self._ring)
+        end: int = self._read_pos + self._chunk_samples
+        if end <= capacity:
+            chunk = self._ring[self._read_pos : end].copy()
+        else:
+            chunk = np.concatenate((self._ring[self._read_pos :], self._ring[: end - capacity]))
+        # Position of the chunk in the whole stream, relative to the last packet
+        chunk_pos: int = self._written - self._fill
+        timestamp: int = self._anchor_ts + (chunk_pos - self._anchor_pos) * 1000 // self._sample_rate
+        self._read_pos = end % capacity
+        self._fill -= self._chunk_samples
+        return chunk, timestamp
+
+
+class MIoTMediaBufferPool:
+    """Frame payload pool, packets are copied into preallocated bytearray slabs and handed out
+    as memoryview slices.
+    A retired slab goes back to the free list once no slice of it is alive, CPython refuses to
+    resize a bytearray with live buffer exports, so the exports are the reference count.
+    """
+
+    _lock: threading.Lock
+    _min_slab_size: int
+    _max_slab_size: int
+    # Slab holds about slab_duration seconds of payload at the observed bitrate
+    _slab_duration: float
+    _max_free_slabs: int
+    _slab_size: int
+
+    _slab: Optional[bytearray]
+    # Address and view of the current slab, dropped when it retires so the exports can drain
+    _slab_addr: int
+    _slab_view: Optional[memoryview]
+    _offset: int
+    # Retired slabs, may still be referenced
+    _busy: deque[bytearray]
+    _free: List[bytearray]
+    _window_bytes: int
+    _window_start: float
+
+    def __init__(
+        self,
+        min_slab_size: int = 256 * 1024,
+        max_slab_size: int = 8 * 1024 * 1024,
+        slab_duration: float = 1,
+        max_free_slabs: int = 4,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._min_slab_size = min_slab_size
+        self._max_slab_size = max_slab_size
+        self._slab_duration = slab_duration
+        self._max_free_slabs = max_free_slabs
+        self._slab_size = min_slab_size
+
+        self._slab = None
+        self._slab_addr = 0
+        self._slab_view = None
+        self._offset = 0
+        self._busy = deque()
+        self._free = []
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+
+    @property
+    def slab_size(self) -> int:
+        """Size of new slabs."""
+        return self._slab_size
+
+    @property
+    def slab_count(self) -> int:
+        """Slabs held by the pool, in use or free."""
+        return len(self._busy) + len(self._free) + (1 if self._slab is not None else 0)
+
+    def copy(self, src: Any, length: int) -> memoryview:
+        """Copy length bytes from a ctypes pointer into the pool."""
+        if length > self._slab_size:
+            # Oversized packet, not pooled
+            return memoryview(string_at(src, length))
+        with self._lock:
+            if self._slab is None or self._offset + length > len(self._slab):
+                self.__next_slab()
+            offset: int = self._offset
+            self._offset += length
+            self._window_bytes += length
+            memmove(self._slab_addr + offset, src, length)
+            return self._slab_view[offset : offset + length]  # type: ignore
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slab = None
+            self._slab_view = None
+            self._busy.clear()
+            self._free.clear()
+
+    def __next_slab(self) -> None:
+        if self._slab is not None:
+            self._busy.append(self._slab)
+            self._slab_view = None
+        self.__update_slab_size()
+        for _ in range(len(self._busy)):
+            slab = self._busy.popleft()
+            if not self.__is_free(slab):
+                self._busy.append(slab)
+            elif len(slab) == self._slab_size and len(self._free) < self._max_free_slabs:
+                self._free.append(slab)
+        self._slab = self._free.pop() if self._free else bytearray(self._slab_size)
+        # The temporary ctypes export is released right away, the current slab is never resized
+        self._slab_addr = addressof((c_uint8 * len(self._slab)).from_buffer(self._slab))
+        self._slab_view = memoryview(self._slab)
+        self._offset = 0
+
+    def __update_slab_size(self) -> None:
+        now: float = time.monotonic()
+        elapsed: float = now - self._window_start
+        if elapsed < 1:
+            return
+        rate: float = self._window_bytes / elapsed
+        size: int = 1 << max(0, math.ceil(math.log2(max(1.0, rate * self._slab_duration))))
+        self._slab_size = min(self._max_slab_size, max(self._min_slab_size, size))
+        self._free = [slab for slab in self._free if len(slab) == self._slab_size]
+        self._window_bytes = 0
+        self._window_start = now
+
+    @staticmethod
+    def __is_free(slab: bytearray) -> bool:
+        try:
+            slab.append(0)
+        except BufferError:
+            return False
+        slab.pop()
+        return True
+
+
 class MIoTMediaRingBuffer:
-    """Ring buffer."""
+    """Ring buffer, video frames are grouped by GOP."""
 
     _maxlen: int
-    _video_buffer: deque[MIoTCameraFrameData]
-    _audio_buffer: deque[MIoTCameraFrameData]
+    # Each GOP starts with an I frame, the last GOP is open for P frames
+    _video_buffer: deque[deque[MIoTCameraFrame]]
+    _video_len: int
+    _audio_buffer: deque[MIoTCameraFrame]
     _cond: threading.Condition
+    # P frames are dropped until the next I frame once their reference is gone
+    _drop_until_key: bool
+    _dropped_frames: int
+    _dropped_gops: int
 
     def __init__(self, maxlen: int = 20):
         self._maxlen = maxlen
-        self._video_buffer = deque(maxlen=maxlen)
+        self._video_buffer = deque()
+        self._video_len = 0
         self._audio_buffer = deque(maxlen=maxlen)
         self._cond = threading.Condition()
+        self._drop_until_key = True
+        self._dropped_frames = 0
+        self._dropped_gops = 0
 
-    def put_video(self, item: MIoTCameraFrameData) -> None:
-        with self._cond:
-            # When the queue is full, non-key frames are discarded first
-            if len(self._video_buffer) >= self._maxlen:
-                if item.frame_type == MIoTCameraFrameType.FRAME_I:
-                    removed: bool = False
-                    for i in range(len(self._video_buffer)):
-                        if self._video_buffer[i].frame_type != MIoTCameraFrameType.FRAME_I:
-                            del self._video_buffer[i]
-                            removed = True
-                            break
-                    if not removed:
-                        self._video_buffer.popleft()
-                    self._video_buffer.append(item)
-                    self._cond.notify()
-                else:
-                    # Drop non-I frame
-                    pass
-                # _LOGGER.info("drop non-I frame, %s, %s", item.codec_id, item.timestamp)
-            else:
-                self._video_buffer.append(item)
+    @property
+    def video_len(self) -> int:
+        """Queued video frames."""
+        return self._video_len
+
+    @property
+    def dropped_frames(self) -> int:
+        """Dropped video frames."""
+        return self._dropped_frames
+
+    @property
+    def dropped_gops(self) -> int:
+        """Dropped GOPs, partially dropped GOPs included."""
+        return self._dropped_gops
+
+    def put_video(self, item: MIoTCameraFrame) -> None:
+        with self._cond:
+            if item.frame_type == MIoTCameraFrameType.FRAME_I:
+                # When the queue is full, the oldest GOPs are discarded as a whole
+                while self._video_len >= self._maxlen and self._video_buffer:
+                    gop = self._video_buffer.popleft()
+                    if gop:
+                        self._video_len -= len(gop)
+                        self._dropped_frames += len(gop)
+                        self._dropped_gops += 1
+                self._video_buffer.append(deque([item]))
+                self._video_len += 1
+                self._drop_until_key = False
                 self._cond.notify()
+                return
+            if self._drop_until_key or not self._video_buffer or self._video_len >= self._maxlen:
+                # Drop the P frame and the rest of its GOP, they are undecodable without it
+                if not self._drop_until_key:
+                    self._dropped_gops += 1
+                self._drop_until_key = True
+                self._dropped_frames += 1
+                # _LOGGER.info("drop non-I frame, %s, %s", item.codec_id, item.timestamp)
+                return
+            self._video_buffer[-1].append(item)
+            self._video_len += 1
+            self._cond.notify()
 
-    def put_audio(self, item: MIoTCameraFrameData) -> None:
+    def drop_until_key(self) -> None:
+        """Drop the P frames until the next I frame, their references are lost."""
+        with self._cond:
+            if not self._drop_until_key:
+                self._dropped_gops += 1
+            self._drop_until_key = True
+
+    def put_audio(self, item: MIoTCameraFrame) -> None:
         with self._cond:
             self._audio_buffer.append(item)
             self._cond.notify()
 
+    @property
+    def pending(self) -> int:
+        """Queued video and audio frames."""
+        return self._video_len + len(self._audio_buffer)
+
+    def pop_nowait(self) -> Tuple[Optional[MIoTCameraFrame], bool]:
+        """Pop a frame without waiting, return the frame and whether it is a video frame."""
+        with self._cond:
+            return self.__pop()
+
     def step(
         self,
-        on_video_frame: Callable[[MIoTCameraFrameData], None],
-        on_audio_frame: Callable[[MIoTCameraFrameData], None],
+        on_video_frame: Callable[[MIoTCameraFrame], None],
+        on_audio_frame: Callable[[MIoTCameraFrame], None],
         timeout: float = 0.2,
     ) -> None:
-        on_frame: Callable[[MIoTCameraFrameData], None] = on_video_frame
-        frame_data: Optional[MIoTCameraFrameData] = None
+        frame_data: Optional[MIoTCameraFrame] = None
+        is_video: bool = True
         # get frame
         with self._cond:
-            if self._video_buffer:
-                frame_data = self._video_buffer.popleft()
-            elif self._audio_buffer:
-                frame_data = self._audio_buffer.popleft()
-                on_frame = on_audio_frame
-            else:
+            frame_data, is_video = self.__pop()
+            if frame_data is None:
                 self._cond.wait(timeout=timeout)
         # handle frame
         if frame_data:
-            on_frame(frame_data)
+            if is_video:
+                on_video_frame(frame_data)
+            else:
+                on_audio_frame(frame_data)
+
+    def __pop(self) -> Tuple[Optional[MIoTCameraFrame], bool]:
+        """Pop a frame, video first, MUST hold the condition."""
+        while len(self._video_buffer) > 1 and not self._video_buffer[0]:
+            self._video_buffer.popleft()
+        if self._video_buffer and self._video_buffer[0]:
+            self._video_len -= 1
+            return self._video_buffer[0].popleft(), True
+        if self._audio_buffer:
+            return self._audio_buffer.popleft(), False
+        return None, True
 
     def stop(self):
         del self._cond
         self._video_buffer.clear()
+        self._video_len = 0
         self._audio_buffer.clear()
 
 
+class MIoTMediaStageTimer:
+    """Latency counters of a pipeline stage."""
+
+    _lock: threading.Lock
+    _count: int
+    # second
+    _total: float
+    _max: float
+    _wait_total: float
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._wait_total = 0.0
+
+    def record(self, latency: float, wait: float = 0.0) -> None:
+        """Record the handle time of an item and its queue wait, second."""
+        with self._lock:
+            self._count += 1
+            self._total += latency
+            self._wait_total += wait
+            if latency > self._max:
+                self._max = latency
+
+    def stats(
+        self, stage: str, channel: Optional[int] = None, pending: int = 0, dropped: int = 0
+    ) -> MIoTCameraStageStats:
+        with self._lock:
+            count: int = self._count
+            return MIoTCameraStageStats(
+                stage=stage,
+                channel=channel,
+                count=count,
+                avg_latency=self._total * 1000 / count if count else 0.0,
+                max_latency=self._max * 1000,
+                avg_wait=self._wait_total * 1000 / count if count else 0.0,
+                pending=pending,
+                dropped=dropped,
+            )
+
+
+class MIoTMediaStreamMeter:
+    """Rolling window counters of a received stream, one bucket per wall clock second in fixed size lists.
+    Recorded on the native callback thread without lock, a concurrent read may miss the frame in flight.
+    """
+
+    # A late frame further back than the window, or a run of late frames, is a sequence restart
+    REORDER_WINDOW: int = 64
+    REORDER_RUN: int = 8
+
+    # second
+    _window: int
+    # Wall clock second of each bucket
+    _seconds: List[int]
+    _frames: List[int]
+    _bytes: List[int]
+    _gaps: List[int]
+    _reorders: List[int]
+    # ms
+    _latency_total: List[int]
+    _latency_max: List[int]
+    # Camera time between I frames, ms
+    _key_interval_total: List[int]
+    _key_intervals: List[int]
+    # Sequence of the newest frame and camera timestamp of the last I frame, -1 before the first one
+    _last_sequence: int
+    _last_key_ts: int
+    # Consecutive late frames
+    _reorder_run: int
+    # Wall clock of the first frame, second
+    _start: float
+    _total_frames: int
+    _total_gaps: int
+
+    def __init__(self, window: int = 10) -> None:
+        if window <= 0:
+            raise MIoTMediaDecoderError(f"invalid meter window, {window}")
+        self._window = window
+        self._seconds = [-1] * window
+        self._frames = [0] * window
+        self._bytes = [0] * window
+        self._gaps = [0] * window
+        self._reorders = [0] * window
+        self._latency_total = [0] * window
+        self._latency_max = [0] * window
+        self._key_interval_total = [0] * window
+        self._key_intervals = [0] * window
+        self._last_sequence = -1
+        self._last_key_ts = -1
+        self._reorder_run = 0
+        self._start = 0.0
+        self._total_frames = 0
+        self._total_gaps = 0
+
+    @property
+    def total_frames(self) -> int:
+        return self._total_frames
+
+    def reset_sequence(self) -> None:
+        """Forget the last sequence and I frame, the camera restarts them on a new connection."""
+        self._last_sequence = -1
+        self._last_key_ts = -1
+        self._reorder_run = 0
+
+    def record(self, length: int, timestamp: int, sequence: int, is_key: bool) -> int:
+        """Record a received frame, timestamp is the camera wall clock, ms.
+        Return the frames missing in the sequence before this one.
+        """
+        now: float = time.time()
+        second: int = int(now)
+        index: int = second % self._window
+        if self._seconds[index] != second:
+            self._seconds[index] = second
+            self._frames[index] = 0
+            self._bytes[index] = 0
+            self._gaps[index] = 0
+            self._reorders[index] = 0
+            self._latency_total[index] = 0
+            self._key_interval_total[index] = 0
+            self._key_intervals[index] = 0
+        if not self._total_frames:
+            self._start = now
+        self._total_frames += 1
+        self._frames[index] += 1
+        self._bytes[index] += length
+        latency: int = int(now * 1000) - timestamp
+        self._latency_total[index] += latency
+        if self._frames[index] == 1 or latency > self._latency_max[index]:
+            self._latency_max[index] = latency
+        lost: int = 0
+        if self._last_sequence < 0:
+            self._last_sequence = sequence
+        else:
+            # uint32 sequence, wraps around
+            delta: int = (sequence - self._last_sequence) & 0xFFFFFFFF
+            if delta == 0 or delta >= 0x80000000:
+                self._reorder_run += 1
+                if 0x100000000 - delta > self.REORDER_WINDOW or self._reorder_run >= self.REORDER_RUN:
+                    # The camera restarted the sequence, count from this frame on
+                    self._last_sequence = sequence
+                    self._reorder_run = 0
+                else:
+                    self._reorders[index] += 1
+            else:
+                self._reorder_run = 0
+                lost = delta - 1
+                self._gaps[index] += lost
+                self._total_gaps += lost
+                self._last_sequence = sequence
+        if is_key:
+            if 0 <= self._last_key_ts < timestamp:
+                self._key_interval_total[index] += timestamp - self._last_key_ts
+                self._key_intervals[index] += 1
+            self._last_key_ts = timestamp
+        return lost
+
+    def stats(
+        self,
+        channel: int,
+        kind: MIoTCameraStreamKind,
+        ring_dropped: int = 0,
+        avg_decode: float = 0.0,
+        max_decode: float = 0.0,
+        callback_lag: float = 0.0,
+        resyncs: int = 0,
+    ) -> MIoTCameraStreamStats:
+        now: float = time.time()
+        second: int = int(now)
+        frames: int = 0
+        size: int = 0
+        gaps: int = 0
+        reorders: int = 0
+        latency_total: int = 0
+        latency_max: Optional[int] = None
+        key_interval_total: int = 0
+        key_intervals: int = 0
+        for index in range(self._window):
+            if second - self._seconds[index] >= self._window or not self._frames[index]:
+                continue
+            frames += self._frames[index]
+            size += self._bytes[index]
+            gaps += self._gaps[index]
+            reorders += self._reorders[index]
+            latency_total += self._latency_total[index]
+            if latency_max is None or self._latency_max[index] > latency_max:
+                latency_max = self._latency_max[index]
+            key_interval_total += self._key_interval_total[index]
+            key_intervals += self._key_intervals[index]
+        # The current bucket is partly elapsed
+        span: float = min(self._window - 1 + now - second, now - self._start) if self._total_frames else 0.0
+        return MIoTCameraStreamStats(
+            channel=channel,
+            kind=kind,
+            window=span,
+            frames=frames,
+            fps=frames / span if span > 0 else 0.0,
+            bitrate=size * 8 / 1000 / span if span > 0 else 0.0,
+            key_interval=key_interval_total / key_intervals if key_intervals else 0.0,
+            seq_gaps=gaps,
+            seq_reorders=reorders,
+            avg_latency=latency_total / frames if frames else 0.0,
+            max_latency=latency_max or 0,
+            ring_dropped=ring_dropped,
+            avg_decode=avg_decode,
+            max_decode=max_decode,
+            callback_lag=callback_lag,
+            total_frames=self._total_frames,
+            total_gaps=self._total_gaps,
+            resyncs=resyncs,
+        )
+
+
+class MIoTImageEncoder(abc.ABC):
+    """Image encoder of an image format, pluggable in the encode stage."""
+
+    @abc.abstractmethod
+    def encode(self, frame: VideoFrame, quality: int, buf: BytesIO) -> None:
+        """Encode the rgb24 frame into buf."""
+
+
+class MIoTPillowImageEncoder(MIoTImageEncoder):
+    """Pillow image encoder, quality is ignored by lossless formats."""
+
+    _format: str
+    _lossy: bool
+
+    def __init__(self, image_format: str, lossy: bool = True) -> None:
+        self._format = image_format
+        self._lossy = lossy
+
+    def encode(self, frame: VideoFrame, quality: int, buf: BytesIO) -> None:
+        if self._lossy:
+            frame.to_image().save(buf, format=self._format, quality=quality)
+        else:
+            frame.to_image().save(buf, format=self._format)
+
+
+class MIoTRawImageEncoder(MIoTImageEncoder):
+    """Packed rgb24 pixels, the size is the variant fit of the decoded picture."""
+
+    def encode(self, frame: VideoFrame, quality: int, buf: BytesIO) -> None:
+        buf.write(frame.to_ndarray().data)
+
+
+_MIOT_IMAGE_ENCODERS: Dict[MIoTCameraImageFormat, MIoTImageEncoder] = {
+    MIoTCameraImageFormat.JPEG: MIoTPillowImageEncoder("JPEG"),
+    MIoTCameraImageFormat.WEBP: MIoTPillowImageEncoder("WEBP"),
+    MIoTCameraImageFormat.PNG: MIoTPillowImageEncoder("PNG", lossy=False),
+    MIoTCameraImageFormat.RAW: MIoTRawImageEncoder(),
+}
+
+
+def _encode_variants(
+    frame: VideoFrame,
+    variants: Iterable[MIoTCameraVariant],
+    encoders: Dict[MIoTCameraImageFormat, MIoTImageEncoder],
+    buf: BytesIO,
+) -> Dict[MIoTCameraVariant, bytes]:
+    """Encode the image variants of a frame, the rgb24 picture of a size is scaled once and shared."""
+    outputs: Dict[MIoTCameraVariant, bytes] = {}
+    # key: (width, height)
+    rgb_frames: Dict[Tuple[int, int], VideoFrame] = {}
+    for variant in variants:
+        size: Tuple[int, int] = variant.fit(frame.width, frame.height)
+        rgb_frame: Optional[VideoFrame] = rgb_frames.get(size)
+        if rgb_frame is None:
+            rgb_frame = frame.reformat(width=size[0], height=size[1], format="rgb24")
+            rgb_frames[size] = rgb_frame
+        buf.seek(0)
+        buf.truncate()
+        encoders[variant.output].encode(rgb_frame, variant.quality, buf)  # type: ignore
+        outputs[variant] = buf.getvalue()
+    return outputs
+
+
+def _create_video_codec(codec_id: int, options: Optional[MIoTCameraDecoderOptions] = None) -> CodecContext:
+    """Create the video codec context of a camera codec with the decoder options."""
+    options = options or MIoTCameraDecoderOptions()
+    if codec_id == MIoTCameraCodec.VIDEO_H264:
+        name: str = options.h264_decoder or "h264"
+    elif codec_id == MIoTCameraCodec.VIDEO_H265:
+        name = options.hevc_decoder or "hevc"
+    else:
+        raise MIoTMediaDecoderError(f"unsupported video codec, {codec_id}")
+    try:
+        codec: CodecContext = VideoCodecContext.create(name, "r")
+    except Exception as e:  # pylint: disable=broad-except
+        raise MIoTMediaDecoderError(f"create video decoder failed, {name}, {e}") from e
+    if options.thread_type is not None:
+        codec.thread_type = options.thread_type.value.upper()
+    if options.thread_count is not None:
+        codec.thread_count = options.thread_count
+    if options.skip_frame != MIoTCameraDecodeDiscard.DEFAULT:
+        codec.skip_frame = options.skip_frame.value.upper()
+    if options.skip_loop_filter != MIoTCameraDecodeDiscard.DEFAULT:
+        codec.options = {"skip_loop_filter": options.skip_loop_filter.value}
+    if options.low_delay:
+        codec.flags |= Flags.low_delay
+    if options.fast:
+        codec.flags2 |= Flags2.fast
+    return codec
+
+
+class MIoTVideoDecodeContext:
+    """Video codec context of a camera channel, created with the first frame.
+    Shared by the local decode path and the decode worker processes.
+    """
+
+    _options: Optional[MIoTCameraDecoderOptions]
+    _codec: Optional[CodecContext]
+    # The last decoded frame
+    _frame: Optional[VideoFrame]
+    # Reused by the image encoders
+    _buf: BytesIO
+
+    def __init__(self, options: Optional[MIoTCameraDecoderOptions] = None) -> None:
+        self._options = options
+        self._codec = None
+        self._frame = None
+        self._buf = BytesIO()
+
+    @property
+    def frame(self) -> Optional[VideoFrame]:
+        """The first frame decoded from the last packet."""
+        return self._frame
+
+    def decode(
+        self,
+        codec_id: int,
+        data: bytes,
+        variants: Iterable[MIoTCameraVariant],
+        drain: bool = False,
+        reset: bool = False,
+    ) -> Tuple[bool, Dict[MIoTCameraVariant, bytes | np.ndarray]]:
+        """Decode a packet, the first decoded frame is converted to each variant.
+        drain flushes the codec after the packet, reset drops the reference frames before it.
+        Return whether a frame is decoded and the output of each variant.
+        """
+        if not self._codec:
+            # Create video decoder
+            self._codec = _create_video_codec(codec_id, self._options)
+            # _LOGGER.info("video decoder created, %s", codec_id)
+        elif reset:
+            self._codec.flush_buffers()
+        pkt = Packet(data)
+        frames: List[VideoFrame] = self._codec.decode(pkt)  # type: ignore
+        if drain:
+            # Drain the packet, then reset the codec for the next one
+            frames += self._codec.decode(None)  # type: ignore
+            self._codec.flush_buffers()
+        self._frame = frames[0] if frames else None
+        if not frames:
+            return False, {}
+        # _LOGGER.debug("video frame, %d, %d", frames[0].height, frames[0].width)
+        return True, self.__convert(frames[0], variants)
+
+    def close(self) -> None:
+        """Release the codec context."""
+        self._codec = None
+        self._frame = None
+
+    def __convert(
+        self, frame: VideoFrame, variants: Iterable[MIoTCameraVariant]
+    ) -> Dict[MIoTCameraVariant, bytes | np.ndarray]:
+        """Scale and convert in libswscale, numpy variants skip the PIL round trip."""
+        outputs: Dict[MIoTCameraVariant, bytes | np.ndarray] = {}
+        image_variants: List[MIoTCameraVariant] = []
+        for variant in variants:
+            if isinstance(variant.output, MIoTCameraPixelFormat):
+                width, height = variant.fit(frame.width, frame.height)
+                outputs[variant] = frame.to_ndarray(width=width, height=height, format=variant.output.value)
+            else:
+                image_variants.append(variant)
+        if image_variants:
+            outputs.update(_encode_variants(frame, image_variants, _MIOT_IMAGE_ENCODERS, self._buf))
+        return outputs
+
+
 class MIoTMediaDecoder(threading.Thread):
     """MIoT Decoder."""
 
@@ -105,29 +819,74 @@ class MIoTMediaDecoder(threading.Thread):
     _frame_interval: int
     _enable_hw_accel: bool
     _enable_audio: bool
+    _decode_policy: MIoTCameraDecodePolicy
 
-    # format: did, data, ts, channel
-    _video_callback: Callable[[bytes, int, int], Coroutine]
+    # format: variant, image data, ts, channel
+    _video_callback: Callable[[MIoTCameraVariant, bytes, int, int], Coroutine]
     # format: did, data, ts, channel
     _audio_callback: Callable[[bytes, int, int], Coroutine]
+    # format: variant, frame, ts, channel
+    _frame_callback: Optional[Callable[[MIoTCameraVariant, np.ndarray, int, int], Coroutine]]
+    _resync_callback: Optional[Callable[[int, int, int], Coroutine]]
+    # Decoded outputs requested by subscribers, value: output interval, ms
+    _variants: Dict[MIoTCameraVariant, int]
+    # Pacing clock of the last output of each variant, ms
+    _variant_ts: Dict[MIoTCameraVariant, int]
 
     _queue: MIoTMediaRingBuffer
-    _video_decoder: Optional[CodecContext]
-    _audio_decoder: Optional[CodecContext]
-    _resampler: AudioResampler
+    # Batched callback dispatch to the event loop, None for a task per callback
+    _dispatcher: Optional[MIoTCallbackDispatcher]
+    # Shared decode scheduler, None for a dedicated decode thread
+    _scheduler: Optional["MIoTMediaDecodeScheduler"]
+    # Shared encode stage of the image variants, None to encode in the decode thread
+    _encode_pool: Optional["MIoTMediaEncodePool"]
+    _decode_timer: MIoTMediaStageTimer
+    _decode_weight: int
+    _decoder_options: Optional[MIoTCameraDecoderOptions]
+    _video_context: MIoTVideoDecodeContext
+    # Drop the reference frames before the next video packet
+    _reset_video: bool
+    # A sequence gap is found, the I frame resuming the decode is not pushed yet
+    _resyncing: bool
+    # Sequence of the I frame resuming the decode after the last gap, -1 for none
+    _resync_sequence: int
+    _resyncs: int
+    _audio_decoder: Optional[CodecContext | MIoTG711Decoder]
+    _audio_chunker: Optional[MIoTAudioChunker]
+    _audio_sample_rate: int
+    _audio_layout: str
+    _audio_format: MIoTCameraAudioFormat
+    # ms
+    _audio_chunk_duration: int
 
     _current_jpg_width: int
     _current_jpg_height: int
     _last_jpeg_ts: int
+    # Interval aligned policy, camera time of the last I frame (-1 for none) and the GOP duration, ms
+    _last_key_ts: int
+    _gop_duration: int
+    _skip_gop: bool
 
     def __init__(
         self,
         frame_interval: int,
-        video_callback: Callable[[bytes, int, int], Coroutine],
+        video_callback: Callable[[MIoTCameraVariant, bytes, int, int], Coroutine],
         audio_callback: Optional[Callable[[bytes, int, int], Coroutine]] = None,
         enable_hw_accel: bool = False,
         enable_audio: bool = False,
         main_loop: Optional[asyncio.AbstractEventLoop] = None,
+        frame_callback: Optional[Callable[[MIoTCameraVariant, np.ndarray, int, int], Coroutine]] = None,
+        decode_policy: MIoTCameraDecodePolicy = MIoTCameraDecodePolicy.ALL,
+        scheduler: Optional["MIoTMediaDecodeScheduler"] = None,
+        decode_weight: int = 1,
+        audio_sample_rate: int = 16000,
+        audio_layout: str = "mono",
+        audio_format: MIoTCameraAudioFormat = MIoTCameraAudioFormat.INT16,
+        audio_chunk_duration: int = 20,
+        dispatcher: Optional[MIoTCallbackDispatcher] = None,
+        encode_pool: Optional["MIoTMediaEncodePool"] = None,
+        decoder_options: Optional[MIoTCameraDecoderOptions] = None,
+        resync_callback: Optional[Callable[[int, int, int], Coroutine]] = None,
     ) -> None:
         super().__init__()
         self._main_loop = main_loop or asyncio.get_running_loop()
@@ -135,8 +894,14 @@ class MIoTMediaDecoder(threading.Thread):
         self._frame_interval = frame_interval
         self._enable_hw_accel = enable_hw_accel
         self._enable_audio = enable_audio
+        self._decode_policy = MIoTCameraDecodePolicy(decode_policy)
 
         self._video_callback = video_callback
+        self._frame_callback = frame_callback
+        self._resync_callback = resync_callback
+        # Full size jpeg at frame_interval until the subscribers are known
+        self._variants = {MIoTCameraVariant(): frame_interval}
+        self._variant_ts = {}
         if enable_audio:
             if not audio_callback:
                 raise MIoTMediaDecoderError("audio_callback is required when enable audio")
@@ -144,11 +909,28 @@ class MIoTMediaDecoder(threading.Thread):
                 self._audio_callback = audio_callback
 
         self._queue = MIoTMediaRingBuffer()
-        self._video_decoder = None
+        self._dispatcher = dispatcher
+        self._scheduler = scheduler
+        self._encode_pool = encode_pool
+        self._decode_timer = MIoTMediaStageTimer()
+        self._decode_weight = decode_weight
+        self._decoder_options = decoder_options
+        self._video_context = MIoTVideoDecodeContext(decoder_options)
+        self._reset_video = False
+        self._resyncing = False
+        self._resync_sequence = -1
+        self._resyncs = 0
         self._audio_decoder = None
-        self._resampler = None  # type: ignore
+        self._audio_chunker = None
+        self._audio_sample_rate = audio_sample_rate
+        self._audio_layout = audio_layout
+        self._audio_format = MIoTCameraAudioFormat(audio_format)
+        self._audio_chunk_duration = audio_chunk_duration
 
-        self._last_jpeg_ts = 0
+        self._last_jpeg_ts = -frame_interval
+        self._last_key_ts = -1
+        self._gop_duration = 0
+        self._skip_gop = True
 
     def run(self) -> None:
         """Start the decoder."""
@@ -162,19 +944,118 @@ class MIoTMediaDecoder(threading.Thread):
                     break
         # _LOGGER.info("decoder stopped")
 
+    def start(self) -> None:
+        """Start the decoder, attach to the scheduler if any, otherwise start the decode thread."""
+        if self._scheduler:
+            self._running = True
+            self._scheduler.attach(self, weight=self._decode_weight)
+            return
+        super().start()
+
     def stop(self) -> None:
         """Stop the decoder."""
         self._running = False
+        if self._scheduler:
+            # Wait for the in-flight frame of the worker
+            self._scheduler.detach(self)
+        if self._encode_pool:
+            self._encode_pool.detach(self)
         self._queue.stop()
-        self._video_decoder = None
+        self._video_context.close()
         self._audio_decoder = None
-        self.join()
+        self._audio_chunker = None
+        if self.is_alive():
+            self.join()
+
+    @property
+    def pending(self) -> int:
+        """Queued frames."""
+        return self._queue.pending
+
+    def process(self, max_frames: int, throttle: Optional[Callable[[], None]] = None) -> int:
+        """Handle up to max_frames queued frames without waiting, used by the scheduler workers.
+        throttle is called before each video frame is decoded.
+        """
+        handled: int = 0
+        while handled < max_frames and self._running:
+            frame_data, is_video = self._queue.pop_nowait()
+            if frame_data is None:
+                break
+            try:
+                if is_video:
+                    if throttle:
+                        throttle()
+                    self._on_video_callback(frame_data)
+                else:
+                    self._on_audio_callback(frame_data)
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("frame data handle error, %s", e)
+            handled += 1
+        return handled
+
+    @property
+    def decoder_options(self) -> Optional[MIoTCameraDecoderOptions]:
+        """Video decoder options."""
+        return self._decoder_options
+
+    @property
+    def decode_timer(self) -> MIoTMediaStageTimer:
+        """Latency of the decode stage, conversions and inline encodes included."""
+        return self._decode_timer
+
+    @property
+    def dropped_frames(self) -> int:
+        """Video frames dropped by the ring buffer."""
+        return self._queue.dropped_frames
+
+    @property
+    def dropped_gops(self) -> int:
+        """GOPs dropped by the ring buffer."""
+        return self._queue.dropped_gops
+
+    @property
+    def resyncs(self) -> int:
+        """Resyncs to the next I frame after a sequence gap."""
+        return self._resyncs
+
+    def update_outputs(self, variants: Dict[MIoTCameraVariant, int]) -> None:
+        """Update the decoded outputs, value is the output interval of the variant, ms.
+        Each variant is produced at most once per frame whatever the number of its subscribers.
+        """
+        if not self._frame_callback and any(isinstance(variant.output, MIoTCameraPixelFormat) for variant in variants):
+            raise MIoTMediaDecoderError("frame_callback is required when decode frame")
+        self._variants = dict(variants)
+        self._variant_ts = {variant: ts for variant, ts in self._variant_ts.items() if variant in variants}
+
+    def resync(self, sequence: int, lost: int, channel: int) -> None:
+        """lost frames are missing before the frame of sequence, found on the raw data path.
+        The P frames up to the next I frame reference them, smeared pictures and wasted decode, they are dropped.
+        """
+        self._resyncs += 1
+        self._resyncing = True
+        self._queue.drop_until_key()
+        # _LOGGER.info("sequence gap, resync, %s, %s", sequence, lost)
+        if self._resync_callback:
+            self._dispatch(self._resync_callback, sequence, lost, channel)
 
-    def push_video_frame(self, frame_data: MIoTCameraFrameData) -> None:
+    def push_video_frame(self, frame_data: MIoTCameraFrame) -> None:
+        if self._resyncing and frame_data.frame_type == MIoTCameraFrameType.FRAME_I:
+            self._resyncing = False
+            self._resync_sequence = frame_data.sequence
+        if (
+            self._decode_policy == MIoTCameraDecodePolicy.KEYFRAMES_ONLY
+            and frame_data.frame_type != MIoTCameraFrameType.FRAME_I
+        ):
+            # P frames never reach the codec in keyframe only mode
+            return
         self._queue.put_video(frame_data)
+        if self._scheduler:
+            self._scheduler.notify(self)
 
-    def push_audio_frame(self, frame_data: MIoTCameraFrameData) -> None:
+    def push_audio_frame(self, frame_data: MIoTCameraFrame) -> None:
         self._queue.put_audio(frame_data)
+        if self._scheduler:
+            self._scheduler.notify(self)
 
     def detect_hwaccel(self):
         try:
@@ -192,54 +1073,1187 @@ class MIoTMediaDecoder(threading.Thread):
                 return f"{codec_name}_v4l2m2m"
         return codec_name
 
-    def _on_video_callback(self, frame_data: MIoTCameraFrameData) -> None:
-        if not self._video_decoder:
-            # Create video decoder
-            if frame_data.codec_id == MIoTCameraCodec.VIDEO_H264:
-                self._video_decoder = VideoCodecContext.create("h264", "r")
-            elif frame_data.codec_id == MIoTCameraCodec.VIDEO_H265:
-                self._video_decoder = VideoCodecContext.create("hevc", "r")
-            # _LOGGER.info("video decoder created, %s", frame_data.codec_id)
-        pkt = Packet(frame_data.data)
-        frames: List[VideoFrame] = self._video_decoder.decode(pkt)  # type: ignore
-        now_ts = int(time.time() * 1000)
-        if now_ts - self._last_jpeg_ts >= self._frame_interval:
-            if not frames:
-                # _LOGGER.info("video frame is empty, %d, %d", frame_data.codec_id, frame_data.timestamp)
-                self._last_jpeg_ts = now_ts
-                return
-            frame = frames[0]
-            # _LOGGER.debug("video frame, %d, %d", frame.height, frame.width)
-            rgb_frame: VideoFrame = frame.to_rgb()
-            img: Image.Image = rgb_frame.to_image()
-            buf: BytesIO = BytesIO()
-            img.save(buf, format="JPEG", quality=90)
-            jpeg_data = buf.getvalue()
-            self._main_loop.call_soon_threadsafe(
-                self._main_loop.create_task, self._video_callback(jpeg_data, frame_data.timestamp, frame_data.channel)
+    def _on_video_callback(self, frame_data: MIoTCameraFrame) -> None:
+        # Interval aligned paces on the camera clock, frames dequeued in a burst keep their spacing
+        now_ts: int = (
+            frame_data.timestamp
+            if self._decode_policy == MIoTCameraDecodePolicy.INTERVAL_ALIGNED
+            else int(time.time() * 1000)
+        )
+        if not self._need_decode_video(frame_data, now_ts):
+            return
+        emit: bool = now_ts >= self._next_output_ts()
+        # Variants due at this frame, the others are not converted
+        due: List[MIoTCameraVariant] = (
+            [
+                variant
+                for variant, interval in self._variants.items()
+                if now_ts - self._variant_ts.get(variant, -interval) >= interval
+            ]
+            if emit
+            else []
+        )
+        reset: bool = self._reset_video
+        self._reset_video = False
+        if (
+            frame_data.sequence == self._resync_sequence
+            and frame_data.frame_type == MIoTCameraFrameType.FRAME_I
+            and (not self._decoder_options or self._decoder_options.flush_on_resync)
+        ):
+            # The first I frame after a sequence gap, the references held by the codec are stale
+            reset = True
+        remote: bool = bool(self._scheduler and self._scheduler.is_remote)
+        # Image variants are encoded in the encode stage, the worker processes encode in place
+        encode_variants: List[MIoTCameraVariant] = []
+        if self._encode_pool and not remote:
+            encode_variants = [variant for variant in due if isinstance(variant.output, MIoTCameraImageFormat)]
+            due = [variant for variant in due if isinstance(variant.output, MIoTCameraPixelFormat)]
+        decode_args: Dict = {
+            "codec_id": frame_data.codec_id,
+            "data": frame_data.data,
+            "variants": due,
+            "drain": self._decode_policy == MIoTCameraDecodePolicy.KEYFRAMES_ONLY,
+            "reset": reset,
+        }
+        start_ts: float = time.perf_counter()
+        if remote:
+            # Decode in the worker process
+            decoded, outputs = self._scheduler.decode_video(self, **decode_args)  # type: ignore
+        else:
+            decoded, outputs = self._video_context.decode(**decode_args)
+        self._decode_timer.record(time.perf_counter() - start_ts)
+        if decoded and encode_variants:
+            self._encode_pool.submit(  # type: ignore
+                self,
+                self._video_context.frame,  # type: ignore
+                encode_variants,
+                frame_data.timestamp,
+                frame_data.channel,
+                self._on_encoded,
             )
-            self._last_jpeg_ts = now_ts
+        due += encode_variants
+        if not emit:
+            return
+        self._last_jpeg_ts = now_ts
+        for variant in due:
+            self._variant_ts[variant] = now_ts
+        if not decoded:
+            # _LOGGER.info("video frame is empty, %d, %d", frame_data.codec_id, frame_data.timestamp)
+            return
+        for variant, output in outputs.items():
+            callback = (
+                self._frame_callback if isinstance(variant.output, MIoTCameraPixelFormat) else self._video_callback
+            )
+            self._dispatch(callback, variant, output, frame_data.timestamp, frame_data.channel)  # type: ignore
+        if (
+            self._decode_policy == MIoTCameraDecodePolicy.INTERVAL_ALIGNED
+            and self._gop_duration
+            and self._last_key_ts + self._gop_duration <= self._next_output_ts()
+        ):
+            # The next I frame arrives before the next output is due
+            self._skip_gop = True
+
+    def _need_decode_video(self, frame_data: MIoTCameraFrame, now_ts: int) -> bool:
+        """Check the decode policy, frames rejected here never reach the codec."""
+        if self._decode_policy == MIoTCameraDecodePolicy.ALL:
+            return True
+        is_key: bool = frame_data.frame_type == MIoTCameraFrameType.FRAME_I
+        if self._decode_policy == MIoTCameraDecodePolicy.KEYFRAMES_ONLY:
+            return is_key and now_ts >= self._next_output_ts()
+        # Interval aligned, now_ts is the camera time of the frame
+        if not is_key:
+            return not self._skip_gop
+        if now_ts <= self._last_key_ts:
+            # The camera clock went back, start the pacing over
+            self._variant_ts = {}
+            self._last_jpeg_ts = now_ts - self._frame_interval
+            self._last_key_ts = -1
+            self._gop_duration = 0
+        if self._last_key_ts >= 0:
+            self._gop_duration = now_ts - self._last_key_ts
+        self._last_key_ts = now_ts
+        if self._gop_duration and now_ts + self._gop_duration <= self._next_output_ts():
+            # The whole GOP is ahead of the next output
+            self._skip_gop = True
+            return False
+        if self._skip_gop:
+            self._reset_video = True
+        self._skip_gop = False
+        return True
+
+    def _on_encoded(self, variant: MIoTCameraVariant, data: bytes, timestamp: int, channel: int) -> None:
+        """On an image variant encoded, called by the encode stage."""
+        self._dispatch(self._video_callback, variant, data, timestamp, channel)
 
-    def _on_audio_callback(self, frame_data: MIoTCameraFrameData) -> None:
+    def _next_output_ts(self) -> int:
+        """Pacing clock the next output is due, ms, frame_interval paces the decode without outputs.
+        The camera clock for the interval aligned policy, the wall clock otherwise.
+        """
+        if not self._variants:
+            return self._last_jpeg_ts + self._frame_interval
+        return min(self._variant_ts.get(variant, -interval) + interval for variant, interval in self._variants.items())
+
+    def _on_audio_callback(self, frame_data: MIoTCameraFrame) -> None:
         if not self._audio_decoder:
             # Create audio decoder
             if frame_data.codec_id == MIoTCameraCodec.AUDIO_OPUS:
                 self._audio_decoder = AudioCodecContext.create("opus", "r")
-            self._resampler = AudioResampler(format="s16", layout="mono", rate=16000)
+            elif frame_data.codec_id in (MIoTCameraCodec.AUDIO_G711A, MIoTCameraCodec.AUDIO_G711U):
+                self._audio_decoder = MIoTG711Decoder(frame_data.codec_id)
+            else:
+                raise MIoTMediaDecoderError(f"unsupported audio codec, {frame_data.codec_id}")
+            self._audio_chunker = MIoTAudioChunker(
+                sample_rate=self._audio_sample_rate,
+                layout=self._audio_layout,
+                audio_format=self._audio_format,
+                chunk_duration=self._audio_chunk_duration,
+            )
             # _LOGGER.info("audio decoder created, %s", frame_data.codec_id)
         pkt = Packet(frame_data.data)
         frames: List[AudioFrame] = self._audio_decoder.decode(pkt)  # type: ignore
-        pcm_bytes: bytes = b""
-        for frame in frames:
-            rs_frames = self._resampler.resample(frame)
-            for rs_frame in rs_frames:
-                pcm_bytes += rs_frame.to_ndarray().tobytes()
-        self._main_loop.call_soon_threadsafe(
-            self._main_loop.create_task, self._audio_callback(pcm_bytes, frame_data.timestamp, frame_data.channel)
+        # Fixed duration chunks, no callback until a chunk is full
+        for chunk, timestamp in self._audio_chunker.push(frames, frame_data.timestamp):  # type: ignore
+            self._dispatch(self._audio_callback, chunk.tobytes(), timestamp, frame_data.channel)
+
+    def _dispatch(self, callback: Callable[..., Coroutine], *args: Any) -> None:
+        """Hand a callback over to the event loop, batched by the dispatcher if any."""
+        if self._dispatcher:
+            self._dispatcher.dispatch(callback, *args)
+            return
+        self._main_loop.call_soon_threadsafe(self._main_loop.create_task, callback(*args))
+
+
+def _decode_process_main(conn: Connection, shm_name: str, slot_size: int, slot_count: int) -> None:
+    """Decode worker process, packets come in through the pipe, decoded frames go out through shared memory."""
+    # The parent handles Ctrl+C and stops the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Spawned workers share the resource tracker of the parent, the parent unlinks the segment
+    shm = shared_memory.SharedMemory(name=shm_name)
+    contexts: Dict[int, MIoTVideoDecodeContext] = {}
+    try:
+        while True:
+            try:
+                msg: Tuple = conn.recv()
+            except EOFError:
+                break
+            cmd: str = msg[0]
+            if cmd == "stop":
+                break
+            if cmd == "release":
+                contexts.pop(msg[1], None)
+                continue
+            if cmd == "open":
+                options: Optional[Dict] = msg[2]
+                contexts[msg[1]] = MIoTVideoDecodeContext(MIoTCameraDecoderOptions(**options) if options else None)
+                continue
+            # decode
+            stream_id, decode_args = msg[1], msg[2]
+            try:
+                context = contexts.setdefault(stream_id, MIoTVideoDecodeContext())
+                decoded, variant_outputs = context.decode(**decode_args)
+                outputs: List[Tuple[MIoTCameraVariant, int, Tuple, str]] = []
+                for variant, output in variant_outputs.items():
+                    array: np.ndarray = np.frombuffer(output, dtype=np.uint8) if isinstance(output, bytes) else output
+                    slot: int = len(outputs)
+                    if slot >= slot_count or array.nbytes > slot_size:
+                        _LOGGER.error("shared memory slot overflow, %s, %s", variant, array.nbytes)
+                        continue
+                    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=slot * slot_size)
+                    view[...] = array
+                    del view
+                    outputs.append((variant, slot, array.shape, array.dtype.str))
+                conn.send(("ok", decoded, outputs))
+            except Exception as e:  # pylint: disable=broad-except
+                conn.send(("error", str(e), []))
+    finally:
+        contexts.clear()
+        shm.close()
+
+
+class MIoTMediaDecodeProcess:
+    """Decode worker process, one request in flight at a time.
+    Encoded packets are sent through a pipe, decoded frames are written to shared memory slots
+    that stay valid until the next request.
+    """
+
+    _slot_size: int
+    _slot_count: int
+    _shm: shared_memory.SharedMemory
+    _conn: Connection
+    _process: Any
+    # Streams with a codec context in the worker process
+    _streams: Set[int]
+    # Serialize the requests from the scheduler workers
+    lock: threading.Lock
+
+    def __init__(self, slot_size: int, slot_count: int) -> None:
+        self._slot_size = slot_size
+        self._slot_count = slot_count
+        self._shm = shared_memory.SharedMemory(create=True, size=slot_size * slot_count)
+        # Spawn, fork is unsafe with the native lib and event loop threads
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_decode_process_main,
+            args=(child_conn, self._shm.name, slot_size, slot_count),
+            name="miot_decode_process",
+            daemon=True,
         )
+        self._process.start()
+        child_conn.close()
+        self._streams = set()
+        self.lock = threading.Lock()
+
+    def decode(
+        self, stream_id: int, decode_args: Dict, options: Optional[MIoTCameraDecoderOptions] = None
+    ) -> Tuple[bool, Dict[MIoTCameraVariant, bytes | np.ndarray]]:
+        """Decode a packet in the worker process, MUST hold the lock.
+        The options are sent once, with the first packet of the stream.
+        """
+        if stream_id not in self._streams:
+            self._conn.send(("open", stream_id, options.model_dump() if options else None))
+            self._streams.add(stream_id)
+        # Pooled payloads are memoryview slices, pickle needs bytes
+        self._conn.send(("decode", stream_id, {**decode_args, "data": bytes(decode_args["data"])}))
+        status, result, outputs = self._conn.recv()
+        if status != "ok":
+            raise MIoTMediaDecoderError(f"decode process error, {result}")
+        variant_outputs: Dict[MIoTCameraVariant, bytes | np.ndarray] = {}
+        for variant, slot, shape, dtype in outputs:
+            # Copy out of the slot, it is reused by the next request
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=slot * self._slot_size)
+            if isinstance(variant.output, MIoTCameraPixelFormat):
+                variant_outputs[variant] = view.copy()
+            else:
+                variant_outputs[variant] = view.tobytes()
+            del view
+        return result, variant_outputs
+
+    def release(self, stream_id: int) -> None:
+        """Release the codec context of the stream, MUST hold the lock."""
+        self._streams.discard(stream_id)
+        self._conn.send(("release", stream_id))
+
+    def stop(self) -> None:
+        """Stop the worker process."""
+        with self.lock:
+            try:
+                self._conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._conn.close()
+            self._shm.close()
+            self._shm.unlink()
+
+
+class MIoTMediaDecodeScheduler:
+    """Decode scheduler, a fixed pool of workers shared by all camera channels.
+    Decoders keep their own codec contexts and are served with deficit weighted round robin,
+    a decoder is handled by at most one worker at a time.
+    In process mode each worker drives a decode process, a decoder sticks to one process which holds
+    its codec context, audio is still decoded in the worker thread.
+    The process mode uses spawn, scripts MUST guard the entry point with `if __name__ == "__main__"`.
+    """
+
+    _worker_count: int
+    _worker_mode: MIoTCameraDecodeWorkerMode
+    _shm_slot_size: int
+    _shm_slot_count: int
+    # Frames granted to a decoder of weight 1 per turn
+    _quantum: int
+    # Total decoded video frames per second of the host, None for unlimited
+    _max_fps: Optional[float]
+
+    _running: bool
+    _workers: List[threading.Thread]
+    _cond: threading.Condition
+    # Decoders with pending frames, in service order
+    _ready: deque[MIoTMediaDecoder]
+    # key: decoder, value: weight
+    _weights: Dict[MIoTMediaDecoder, int]
+    _deficits: Dict[MIoTMediaDecoder, float]
+    _busy: Set[MIoTMediaDecoder]
+    # Process mode, key: decoder, value: (process index, stream id)
+    _processes: List[MIoTMediaDecodeProcess]
+    _assignments: Dict[MIoTMediaDecoder, Tuple[int, int]]
+    _stream_ids: Iterator[int]
+
+    # Token bucket of the throughput cap
+    _token_lock: threading.Lock
+    _tokens: float
+    _token_ts: float
+
+    def __init__(
+        self,
+        worker_count: int = 2,
+        max_fps: Optional[float] = None,
+        quantum: int = 4,
+        worker_mode: MIoTCameraDecodeWorkerMode = MIoTCameraDecodeWorkerMode.THREAD,
+        shm_slot_size: int = 8 * 1024 * 1024,
+        shm_slot_count: int = 4,
+    ) -> None:
+        if worker_count <= 0:
+            raise MIoTMediaDecoderError(f"invalid worker count, {worker_count}")
+        if max_fps is not None and max_fps <= 0:
+            raise MIoTMediaDecoderError(f"invalid max fps, {max_fps}")
+        self._worker_count = worker_count
+        self._quantum = max(1, quantum)
+        self._max_fps = max_fps
+        self._worker_mode = MIoTCameraDecodeWorkerMode(worker_mode)
+        self._shm_slot_size = shm_slot_size
+        self._shm_slot_count = shm_slot_count
+
+        self._running = False
+        self._workers = []
+        self._cond = threading.Condition()
+        self._ready = deque()
+        self._weights = {}
+        self._deficits = {}
+        self._busy = set()
+        self._processes = []
+        self._assignments = {}
+        self._stream_ids = itertools.count()
+
+        self._token_lock = threading.Lock()
+        self._tokens = max(1, max_fps or 0)
+        self._token_ts = time.monotonic()
+
+    @property
+    def worker_count(self) -> int:
+        """Worker count."""
+        return self._worker_count
+
+    @property
+    def is_remote(self) -> bool:
+        """Whether video is decoded in worker processes."""
+        return self._worker_mode == MIoTCameraDecodeWorkerMode.PROCESS
+
+    def start(self) -> None:
+        """Start the workers."""
+        if self._running:
+            return
+        self._running = True
+        if self.is_remote:
+            self._processes = [
+                MIoTMediaDecodeProcess(slot_size=self._shm_slot_size, slot_count=self._shm_slot_count)
+                for _ in range(self._worker_count)
+            ]
+        for index in range(self._worker_count):
+            worker = threading.Thread(target=self.__worker_loop, name=f"miot_decode_{index}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def stop(self) -> None:
+        """Stop the workers."""
+        with self._cond:
+            self._running = False
+            self._ready.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+        for process in self._processes:
+            process.stop()
+        self._processes.clear()
+        self._assignments.clear()
+
+    def attach(self, decoder: MIoTMediaDecoder, weight: int = 1) -> None:
+        """Attach a decoder, a decoder of weight n is granted n times the frames per turn."""
+        with self._cond:
+            self._weights[decoder] = max(1, weight)
+            self._deficits[decoder] = 0
+            if self._processes:
+                # Stick to the least loaded process
+                loads: List[int] = [0] * len(self._processes)
+                for index, _ in self._assignments.values():
+                    loads[index] += 1
+                self._assignments[decoder] = (loads.index(min(loads)), next(self._stream_ids))
+        self.notify(decoder)
+
+    def detach(self, decoder: MIoTMediaDecoder) -> None:
+        """Detach a decoder, wait until no worker is handling it."""
+        with self._cond:
+            self._weights.pop(decoder, None)
+            self._deficits.pop(decoder, None)
+            if decoder in self._ready:
+                self._ready.remove(decoder)
+            while decoder in self._busy:
+                self._cond.wait()
+            assignment = self._assignments.pop(decoder, None)
+        if assignment and self._running:
+            process = self._processes[assignment[0]]
+            with process.lock:
+                process.release(assignment[1])
+
+    def decode_video(
+        self, decoder: MIoTMediaDecoder, **decode_args: Any
+    ) -> Tuple[bool, Dict[MIoTCameraVariant, bytes | np.ndarray]]:
+        """Decode a video packet of the decoder in its worker process."""
+        index, stream_id = self._assignments[decoder]
+        process = self._processes[index]
+        with process.lock:
+            return process.decode(stream_id=stream_id, decode_args=decode_args, options=decoder.decoder_options)
+
+    def notify(self, decoder: MIoTMediaDecoder) -> None:
+        """Notify the decoder has pending frames."""
+        with self._cond:
+            if decoder not in self._weights or decoder in self._busy or decoder in self._ready:
+                return
+            self._ready.append(decoder)
+            self._cond.notify()
+
+    def __worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                decoder = self._ready.popleft()
+                self._busy.add(decoder)
+                self._deficits[decoder] += self._quantum * self._weights[decoder]
+                budget: int = int(self._deficits[decoder])
+            handled: int = 0
+            try:
+                handled = decoder.process(max_frames=budget, throttle=self.__acquire_token)
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("decode worker error, %s", e)
+            with self._cond:
+                self._busy.discard(decoder)
+                if decoder in self._weights:
+                    if decoder.pending:
+                        self._deficits[decoder] -= handled
+                        self._ready.append(decoder)
+                    else:
+                        # Idle decoders do not accumulate credit
+                        self._deficits[decoder] = 0
+                self._cond.notify_all()
+
+    def __acquire_token(self) -> None:
+        """Block until the throughput cap allows another video frame."""
+        if not self._max_fps:
+            return
+        while self._running:
+            with self._token_lock:
+                now = time.monotonic()
+                self._tokens = min(max(1, self._max_fps), self._tokens + (now - self._token_ts) * self._max_fps)
+                self._token_ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait: float = (1 - self._tokens) / self._max_fps
+            time.sleep(wait)
+
+
+class MIoTMediaEncodePool:
+    """Encode stage, a fixed pool of threads encoding the image variants of decoded frames.
+    A decoder sticks to one worker so that its outputs keep the frame order. The worker queues are
+    bounded and drop the oldest job when the encoders fall behind, the decode thread never waits.
+    """
+
+    _worker_count: int
+    _maxsize: int
+    _encoders: Dict[MIoTCameraImageFormat, MIoTImageEncoder]
+
+    _running: bool
+    _workers: List[threading.Thread]
+    _cond: threading.Condition
+    # format: owner, frame, variants, timestamp, channel, callback, submit time
+    _queues: List[deque[Tuple[Any, VideoFrame, List[MIoTCameraVariant], int, int, Callable, float]]]
+    # key: owner, value: worker index
+    _assignments: Dict[Any, int]
+    _timer: MIoTMediaStageTimer
+    _dropped: int
+
+    def __init__(
+        self,
+        worker_count: int = 1,
+        maxsize: int = 8,
+        encoders: Optional[Dict[MIoTCameraImageFormat, MIoTImageEncoder]] = None,
+    ) -> None:
+        if worker_count <= 0:
+            raise MIoTMediaDecoderError(f"invalid worker count, {worker_count}")
+        self._worker_count = worker_count
+        self._maxsize = max(1, maxsize)
+        self._encoders = {**_MIOT_IMAGE_ENCODERS, **(encoders or {})}
+
+        self._running = False
+        self._workers = []
+        self._cond = threading.Condition()
+        self._queues = [deque() for _ in range(worker_count)]
+        self._assignments = {}
+        self._timer = MIoTMediaStageTimer()
+        self._dropped = 0
+
+    @property
+    def worker_count(self) -> int:
+        """Worker count."""
+        return self._worker_count
+
+    @property
+    def pending(self) -> int:
+        """Queued jobs."""
+        return sum(len(queue) for queue in self._queues)
+
+    @property
+    def dropped(self) -> int:
+        """Jobs dropped by full queues."""
+        return self._dropped
+
+    def set_encoder(self, image_format: MIoTCameraImageFormat, encoder: MIoTImageEncoder) -> None:
+        """Replace the encoder of an image format."""
+        if not isinstance(encoder, MIoTImageEncoder):
+            raise MIoTMediaDecoderError(f"invalid image encoder, {encoder!r}")
+        self._encoders[MIoTCameraImageFormat(image_format)] = encoder
+
+    def stats(self) -> MIoTCameraStageStats:
+        """Latency of the encode stage, the wait is the time queued after the decode."""
+        return self._timer.stats("encode", pending=self.pending, dropped=self._dropped)
+
+    def start(self) -> None:
+        """Start the workers."""
+        if self._running:
+            return
+        self._running = True
+        for index in range(self._worker_count):
+            worker = threading.Thread(
+                target=self.__worker_loop, args=(index,), name=f"miot_encode_{index}", daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def stop(self) -> None:
+        """Stop the workers, queued jobs are dropped."""
+        with self._cond:
+            self._running = False
+            for queue in self._queues:
+                queue.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+        self._assignments.clear()
+
+    def submit(
+        self,
+        owner: Any,
+        frame: VideoFrame,
+        variants: List[MIoTCameraVariant],
+        timestamp: int,
+        channel: int,
+        callback: Callable[[MIoTCameraVariant, bytes, int, int], None],
+    ) -> None:
+        """Queue the image variants of a decoded frame, callback is called in the worker for each output."""
+        with self._cond:
+            if not self._running:
+                return
+            index: Optional[int] = self._assignments.get(owner)
+            if index is None:
+                # Stick to the least loaded worker
+                loads: List[int] = [0] * self._worker_count
+                for assigned in self._assignments.values():
+                    loads[assigned] += 1
+                index = loads.index(min(loads))
+                self._assignments[owner] = index
+            queue = self._queues[index]
+            if len(queue) >= self._maxsize:
+                queue.popleft()
+                self._dropped += 1
+            queue.append((owner, frame, variants, timestamp, channel, callback, time.perf_counter()))
+            self._cond.notify_all()
+
+    def detach(self, owner: Any) -> None:
+        """Drop the queued jobs of the owner."""
+        with self._cond:
+            index: Optional[int] = self._assignments.pop(owner, None)
+            if index is None:
+                return
+            queue = self._queues[index]
+            for job in [job for job in queue if job[0] is owner]:
+                queue.remove(job)
+
+    def __worker_loop(self, index: int) -> None:
+        queue = self._queues[index]
+        # Reused by every encode of the worker
+        buf: BytesIO = BytesIO()
+        while True:
+            with self._cond:
+                while self._running and not queue:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                _, frame, variants, timestamp, channel, callback, submit_ts = queue.popleft()
+            start_ts: float = time.perf_counter()
+            try:
+                outputs: Dict[MIoTCameraVariant, bytes] = _encode_variants(frame, variants, self._encoders, buf)
+                for variant, data in outputs.items():
+                    callback(variant, data, timestamp, channel)
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("encode worker error, %s", e)
+            self._timer.record(time.perf_counter() - start_ts, start_ts - submit_ts)
+
+
+class MIoTMediaMuxer:
+    """Remux raw camera packets into a container without re-encoding.
+    The muxer is opened on an I frame, the video stream parameters are probed from it.
+    Opus audio is muxed as is, G.711 is not supported by mp4 and mkv and is skipped.
+    """
+
+    _container: OutputContainer
+    _video_stream: Any
+    _audio_stream: Optional[Any]
+    # Camera timestamp of the first frame, ms
+    _base_ts: int
+    _last_ts: int
+    # key: stream index, value: last dts
+    _last_dts: Dict[int, int]
+    _frame_count: int
+
+    def __init__(
+        self,
+        file: Any,
+        key_frame: MIoTCameraFrame,
+        record_format: MIoTCameraRecordFormat = MIoTCameraRecordFormat.MP4,
+        audio_codec_id: Optional[int] = None,
+    ) -> None:
+        if key_frame.frame_type != MIoTCameraFrameType.FRAME_I:
+            raise MIoTMediaDecoderError("muxer must be opened on an I frame")
+        video_format: str = "h264" if key_frame.codec_id == MIoTCameraCodec.VIDEO_H264 else "hevc"
+        container_format, options = (
+            ("mp4", {"movflags": "frag_keyframe+empty_moov+default_base_moof"})
+            if MIoTCameraRecordFormat(record_format) == MIoTCameraRecordFormat.MP4
+            else ("matroska", {})
+        )
+        try:
+            probe = av.open(BytesIO(bytes(key_frame.data)), format=video_format)
+        except Exception as e:  # pylint: disable=broad-except
+            raise MIoTMediaDecoderError(f"probe video stream failed, {e}") from e
+        try:
+            self._container = av.open(file, "w", format=container_format, options=options)
+            self._video_stream = self._container.add_stream_from_template(probe.streams.video[0])
+            self._video_stream.time_base = Fraction(1, 1000)
+        finally:
+            probe.close()
+        self._audio_stream = None
+        if audio_codec_id == MIoTCameraCodec.AUDIO_OPUS:
+            self._audio_stream = self._container.add_stream("libopus", rate=48000, layout="mono")
+            self._audio_stream.time_base = Fraction(1, 1000)
+        self._base_ts = key_frame.timestamp
+        self._last_ts = key_frame.timestamp
+        self._last_dts = {}
+        self._frame_count = 0
+
+    @property
+    def start_ts(self) -> int:
+        """Timestamp of the first frame."""
+        return self._base_ts
+
+    @property
+    def end_ts(self) -> int:
+        """Timestamp of the last frame."""
+        return self._last_ts
+
+    @property
+    def frame_count(self) -> int:
+        """Muxed frames."""
+        return self._frame_count
+
+    def mux(self, frame_data: MIoTCameraFrame) -> None:
+        """Mux a video or audio frame, timestamps are relative to the first frame."""
+        if frame_data.codec_id in (MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265):
+            stream = self._video_stream
+        elif frame_data.codec_id == MIoTCameraCodec.AUDIO_OPUS and self._audio_stream:
+            stream = self._audio_stream
+        else:
+            return
+        dts: int = frame_data.timestamp - self._base_ts
+        if dts < 0:
+            # Audio ahead of the first I frame
+            return
+        # Strictly increasing dts per stream
+        dts = max(dts, self._last_dts.get(stream.index, -1) + 1)
+        self._last_dts[stream.index] = dts
+        pkt = Packet(frame_data.data)
+        pkt.stream = stream
+        pkt.time_base = stream.time_base
+        pkt.pts = dts
+        pkt.dts = dts
+        pkt.is_keyframe = frame_data.frame_type == MIoTCameraFrameType.FRAME_I
+        self._container.mux(pkt)
+        self._last_ts = max(self._last_ts, frame_data.timestamp)
+        self._frame_count += 1
+
+    def close(self) -> None:
+        """Write the trailer and close the container."""
+        self._container.close()
 
 
 class MIoTMediaRecorder(threading.Thread):
-    """MIoT Recorder."""
+    """MIoT Recorder, remux the raw camera packets of a channel into time bounded segments.
+    Segments start on I frames, file writes are buffered, closed segments are appended to
+    the per-camera index `{record_path}/{did}/index.jsonl`.
+    """
 
-    _main_loop: asyncio.AbstractEventLoop
+    # Serialize the index writes of the channels
+    _index_lock: threading.Lock = threading.Lock()
+
+    _did: str
+    _channel: int
+    _record_path: str
+    # Segment duration, ms
+    _segment_duration: int
+    _record_format: MIoTCameraRecordFormat
+    _buffer_size: int
+
+    _running: bool
+    _cond: threading.Condition
+    _queue: deque[MIoTCameraFrame]
+    _maxlen: int
+    _drop_until_key: bool
+    _dropped_frames: int
+    _audio_codec_id: Optional[int]
+
+    _muxer: Optional[MIoTMediaMuxer]
+    _file: Optional[Any]
+    _segment: Optional[MIoTCameraRecordSegment]
+    _segments: List[MIoTCameraRecordSegment]
+
+    def __init__(
+        self,
+        did: str,
+        channel: int,
+        record_path: str,
+        segment_duration: int = 60,
+        record_format: MIoTCameraRecordFormat = MIoTCameraRecordFormat.MP4,
+        buffer_size: int = 1024 * 1024,
+        maxlen: int = 1000,
+    ) -> None:
+        super().__init__(name=f"miot_record_{did}_{channel}", daemon=True)
+        if segment_duration <= 0:
+            raise MIoTMediaDecoderError(f"invalid segment duration, {segment_duration}")
+        self._did = did
+        self._channel = channel
+        self._record_path = os.path.join(record_path, did)
+        self._segment_duration = segment_duration * 1000
+        self._record_format = MIoTCameraRecordFormat(record_format)
+        self._buffer_size = buffer_size
+
+        self._running = False
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._maxlen = maxlen
+        self._drop_until_key = False
+        self._dropped_frames = 0
+        self._audio_codec_id = None
+
+        self._muxer = None
+        self._file = None
+        self._segment = None
+        self._segments = []
+
+    @property
+    def segments(self) -> List[MIoTCameraRecordSegment]:
+        """Closed segments."""
+        return list(self._segments)
+
+    @property
+    def dropped_frames(self) -> int:
+        """Frames dropped when the writer falls behind."""
+        return self._dropped_frames
+
+    def push_video_frame(self, frame_data: MIoTCameraFrame) -> None:
+        with self._cond:
+            if frame_data.frame_type == MIoTCameraFrameType.FRAME_I:
+                self._drop_until_key = False
+            if self._drop_until_key or len(self._queue) >= self._maxlen:
+                # Skip to the next I frame, P frames without reference are useless
+                self._drop_until_key = True
+                self._dropped_frames += 1
+                return
+            self._queue.append(frame_data)
+            self._cond.notify()
+
+    def push_audio_frame(self, frame_data: MIoTCameraFrame) -> None:
+        with self._cond:
+            if len(self._queue) >= self._maxlen:
+                self._dropped_frames += 1
+                return
+            self._queue.append(frame_data)
+            self._cond.notify()
+
+    def run(self) -> None:
+        """Start the recorder."""
+        self._running = True
+        while True:
+            with self._cond:
+                if self._running and not self._queue:
+                    self._cond.wait(timeout=0.5)
+                frames: List[MIoTCameraFrame] = list(self._queue)
+                self._queue.clear()
+                running: bool = self._running
+            for frame_data in frames:
+                try:
+                    self.__write(frame_data)
+                except Exception as e:  # pylint: disable=broad-except
+                    _LOGGER.error("record frame error, %s, %s", self._did, e)
+                    self.__close_segment()
+            if not running:
+                break
+        self.__close_segment()
+
+    def stop(self) -> None:
+        """Stop the recorder, the queued frames are written and the segment is closed."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self.is_alive():
+            self.join()
+
+    def __write(self, frame_data: MIoTCameraFrame) -> None:
+        if frame_data.codec_id not in (MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265):
+            self._audio_codec_id = frame_data.codec_id
+            if self._muxer:
+                self._muxer.mux(frame_data)
+            return
+        if frame_data.frame_type == MIoTCameraFrameType.FRAME_I and (
+            not self._muxer or frame_data.timestamp - self._muxer.start_ts >= self._segment_duration
+        ):
+            self.__close_segment()
+            self.__open_segment(frame_data)
+        if self._muxer:
+            self._muxer.mux(frame_data)
+
+    def __open_segment(self, key_frame: MIoTCameraFrame) -> None:
+        channel_path: str = os.path.join(self._record_path, str(self._channel))
+        os.makedirs(channel_path, exist_ok=True)
+        create_ts: int = int(time.time())
+        ext: str = "mp4" if self._record_format == MIoTCameraRecordFormat.MP4 else "mkv"
+        path: str = os.path.join(
+            channel_path, f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(create_ts))}_{key_frame.sequence}.{ext}"
+        )
+        # Buffered file writes, the container only sees a file object
+        self._file = open(path, "wb", buffering=self._buffer_size)  # pylint: disable=consider-using-with
+        try:
+            self._muxer = MIoTMediaMuxer(
+                file=self._file,
+                key_frame=key_frame,
+                record_format=self._record_format,
+                audio_codec_id=self._audio_codec_id,
+            )
+        except Exception:
+            self._file.close()
+            self._file = None
+            os.remove(path)
+            raise
+        self._segment = MIoTCameraRecordSegment(
+            did=self._did,
+            channel=self._channel,
+            path=path,
+            create_ts=create_ts,
+            start_ts=key_frame.timestamp,
+            end_ts=key_frame.timestamp,
+        )
+        # _LOGGER.info("record segment open, %s", path)
+
+    def __close_segment(self) -> None:
+        muxer, file, segment = self._muxer, self._file, self._segment
+        self._muxer, self._file, self._segment = None, None, None
+        if not muxer or not file or not segment:
+            return
+        try:
+            muxer.close()
+        finally:
+            file.close()
+        segment.end_ts = muxer.end_ts
+        segment.frame_count = muxer.frame_count
+        segment.size = os.path.getsize(segment.path)
+        self._segments.append(segment)
+        with self._index_lock:
+            with open(os.path.join(self._record_path, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(segment.model_dump_json() + "\n")
+        # _LOGGER.info("record segment closed, %s", segment.path)
+
+
+class MIoTMediaPreRollBuffer:
+    """Keep the last GOPs of a channel in encoded form, bounded by duration and bytes.
+    Frames are forwarded to the attached listeners, so a clip can continue with live frames.
+    """
+
+    _duration: int
+    _max_bytes: int
+    _lock: threading.Lock
+    _gops: deque[List[MIoTCameraFrame]]
+    _bytes: int
+    _listeners: List[Callable[[MIoTCameraFrame], None]]
+
+    def __init__(self, duration: int = 10, max_bytes: int = 16 * 1024 * 1024) -> None:
+        """duration: second."""
+        self._duration = duration * 1000
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._gops = deque()
+        self._bytes = 0
+        self._listeners = []
+
+    @property
+    def size(self) -> int:
+        """Buffered bytes."""
+        return self._bytes
+
+    def push(self, frame_data: MIoTCameraFrame) -> None:
+        """Push a video or audio frame."""
+        with self._lock:
+            if frame_data.frame_type == MIoTCameraFrameType.FRAME_I:
+                self._gops.append([])
+            if self._gops:
+                self._gops[-1].append(frame_data)
+                self._bytes += len(frame_data.data)
+                self.__evict(frame_data.timestamp)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(frame_data)
+
+    def attach(
+        self, listener: Callable[[MIoTCameraFrame], None], before: int
+    ) -> Tuple[List[MIoTCameraFrame], Optional[int]]:
+        """Attach a listener, return the buffered frames from the last GOP starting at least
+        before ms ahead of the newest frame, and the newest timestamp.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if not self._gops:
+                return [], None
+            newest_ts: int = self._gops[-1][-1].timestamp
+            start: int = 0
+            for index, gop in enumerate(self._gops):
+                if gop[0].timestamp <= newest_ts - before:
+                    start = index
+            return [frame for gop in itertools.islice(self._gops, start, None) for frame in gop], newest_ts
+
+    def detach(self, listener: Callable[[MIoTCameraFrame], None]) -> None:
+        """Detach a listener."""
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._gops.clear()
+            self._bytes = 0
+
+    def __evict(self, newest_ts: int) -> None:
+        # Keep at least the current GOP, drop the oldest one if the next still covers the duration
+        while len(self._gops) > 1 and (
+            self._bytes > self._max_bytes or self._gops[1][0].timestamp <= newest_ts - self._duration
+        ):
+            self._bytes -= sum(len(frame.data) for frame in self._gops.popleft())
+
+
+class MIoTMediaClipExporter(threading.Thread):
+    """Remux a pre-roll snapshot and the following live frames into a mp4 clip."""
+
+    _path: str
+    _frames: deque[MIoTCameraFrame]
+    _cond: threading.Condition
+    _end_ts: Optional[int]
+    _after: int
+    _timeout: float
+    _done_callback: Optional[Callable[[Optional[str], Optional[Exception]], None]]
+    _audio_codec_id: Optional[int]
+    _muxer: Optional[MIoTMediaMuxer]
+
+    def __init__(
+        self,
+        path: str,
+        after: int,
+        timeout: float = 10,
+        done_callback: Optional[Callable[[Optional[str], Optional[Exception]], None]] = None,
+    ) -> None:
+        """after: ms after the trigger, timeout: second to wait for live frames beyond after."""
+        super().__init__(name="miot_clip_export", daemon=True)
+        self._path = path
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._end_ts = None
+        self._after = after
+        self._timeout = timeout
+        self._done_callback = done_callback
+        self._audio_codec_id = None
+        self._muxer = None
+
+    def push_frame(self, frame_data: MIoTCameraFrame) -> None:
+        with self._cond:
+            self._frames.append(frame_data)
+            self._cond.notify()
+
+    def start_export(self, frames: List[MIoTCameraFrame], trigger_ts: Optional[int]) -> None:
+        """Start export with the pre-roll frames, live frames pushed afterwards follow them."""
+        with self._cond:
+            self._frames.extendleft(reversed(frames))
+            # The audio stream is only added when the pre-roll carries audio
+            self._audio_codec_id = next(
+                (
+                    frame.codec_id
+                    for frame in frames
+                    if frame.codec_id not in (MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265)
+                ),
+                None,
+            )
+            if trigger_ts is not None:
+                self._end_ts = trigger_ts + self._after
+        self.start()
+
+    def run(self) -> None:
+        error: Optional[Exception] = None
+        try:
+            with open(self._path, "wb") as f:
+                try:
+                    self.__export(f)
+                finally:
+                    if self._muxer:
+                        self._muxer.close()
+            if self._muxer is None:
+                os.remove(self._path)
+                raise MIoTMediaDecoderError("no key frame for clip")
+        except Exception as e:  # pylint: disable=broad-except
+            _LOGGER.error("export clip error, %s, %s", self._path, e)
+            error = e
+        if self._done_callback:
+            self._done_callback(None if error else self._path, error)
+
+    def __export(self, f: Any) -> None:
+        deadline: float = time.monotonic() + self._after / 1000 + self._timeout
+        while True:
+            with self._cond:
+                if not self._frames:
+                    self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+                if not self._frames:
+                    # Stream stalled, keep what we have
+                    break
+                frame_data = self._frames.popleft()
+            is_video: bool = frame_data.codec_id in (MIoTCameraCodec.VIDEO_H264, MIoTCameraCodec.VIDEO_H265)
+            if self._muxer is None:
+                if not is_video or frame_data.frame_type != MIoTCameraFrameType.FRAME_I:
+                    continue
+                if self._end_ts is None:
+                    # Empty pre-roll, the clip starts from the first live I frame
+                    self._end_ts = frame_data.timestamp + self._after
+                self._muxer = MIoTMediaMuxer(file=f, key_frame=frame_data, audio_codec_id=self._audio_codec_id)
+            if self._end_ts is not None and frame_data.timestamp > self._end_ts:
+                if is_video:
+                    break
+                # Audio may run ahead of the video, the clip ends with the video
+                continue
+            self._muxer.mux(frame_data)
+
+
+class MIoTMediaSnapshot:
+    """Keep the latest GOP of a channel encoded and decode it only on request.
+    The decoded picture is cached until the next frame arrives, repeated requests decode
+    only the frames pushed since the last one.
+    """
+
+    _lock: threading.Lock
+    _decode_lock: threading.Lock
+    _gop: List[MIoTCameraFrame]
+    # Increased with every I frame
+    _gop_id: int
+
+    _decoder_options: Optional[MIoTCameraDecoderOptions]
+    _codec: Optional[CodecContext]
+    _decoded_gop_id: int
+    _decoded_count: int
+    _frame: Optional[VideoFrame]
+    # key: (format, max_size)
+    _cache: Dict[Tuple[str, Optional[int]], bytes | np.ndarray]
+
+    def __init__(self, decoder_options: Optional[MIoTCameraDecoderOptions] = None) -> None:
+        self._lock = threading.Lock()
+        self._decode_lock = threading.Lock()
+        self._gop = []
+        self._gop_id = 0
+
+        self._decoder_options = decoder_options
+        self._codec = None
+        self._decoded_gop_id = 0
+        self._decoded_count = 0
+        self._frame = None
+        self._cache = {}
+
+    def push(self, frame_data: MIoTCameraFrame) -> None:
+        """Push a video frame, no decode here."""
+        with self._lock:
+            if frame_data.frame_type == MIoTCameraFrameType.FRAME_I:
+                self._gop = [frame_data]
+                self._gop_id += 1
+            elif self._gop:
+                self._gop.append(frame_data)
+
+    def get(
+        self,
+        image_format: MIoTCameraImageFormat | MIoTCameraPixelFormat = MIoTCameraImageFormat.JPEG,
+        max_size: Optional[int] = None,
+    ) -> Optional[bytes | np.ndarray]:
+        """Decode the newest frame, encoded as image_format or converted to a numpy frame.
+        max_size limits the longest edge, keep the aspect ratio.
+        """
+        with self._decode_lock:
+            with self._lock:
+                gop_id: int = self._gop_id
+                frames: List[MIoTCameraFrame] = list(self._gop)
+            if not frames:
+                return None
+            if gop_id != self._decoded_gop_id:
+                # New GOP, decode from its I frame
+                if self._codec:
+                    self._codec.flush_buffers()
+                self._decoded_gop_id = gop_id
+                self._decoded_count = 0
+                self._frame = None
+            if self._decoded_count != len(frames):
+                self._cache.clear()
+                self.__decode(frames[self._decoded_count :])
+                self._decoded_count = len(frames)
+            if self._frame is None:
+                return None
+            key: Tuple[str, Optional[int]] = (image_format.value, max_size)
+            if key not in self._cache:
+                self._cache[key] = self.__convert(self._frame, image_format, max_size)
+            return self._cache[key]
+
+    def close(self) -> None:
+        with self._decode_lock:
+            self._codec = None
+            self._frame = None
+            self._cache.clear()
+        with self._lock:
+            self._gop = []
+
+    def __decode(self, frames: List[MIoTCameraFrame]) -> None:
+        if not self._codec:
+            self._codec = _create_video_codec(frames[0].codec_id, self._decoder_options)
+        for frame_data in frames:
+            decoded: List[VideoFrame] = self._codec.decode(Packet(frame_data.data))  # type: ignore
+            if decoded:
+                self._frame = decoded[-1]
+
+    def __convert(
+        self,
+        frame: VideoFrame,
+        image_format: MIoTCameraImageFormat | MIoTCameraPixelFormat,
+        max_size: Optional[int],
+    ) -> bytes | np.ndarray:
+        if max_size and max(frame.width, frame.height) > max_size:
+            scale: float = max_size / max(frame.width, frame.height)
+            # Even sizes for yuv420p
+            frame = frame.reformat(
+                width=max(2, int(frame.width * scale) & ~1), height=max(2, int(frame.height * scale) & ~1)
+            )
+        if isinstance(image_format, MIoTCameraPixelFormat):
+            return frame.to_ndarray(format=image_format.value)
+        buf: BytesIO = BytesIO()
+        _MIOT_IMAGE_ENCODERS[image_format].encode(frame.reformat(format="rgb24"), 90, buf)
+        return buf.getvalue()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2025 Xiaomi Corporation
+# This software may be used and distributed according to the terms of the Xiaomi Miloco License Agreement.
+"""
+MIoT Callback Dispatcher.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Optional, Tuple
+
+from miloco_sdk.utils.error import MIoTCameraError
+from miloco_sdk.utils.types import MIoTCameraQueuePolicy
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class MIoTCallbackDispatcher:
+    """Hand callbacks from worker threads over to the event loop in batches.
+    Producers append to a deque, the loop is woken at most once per batch and a single
+    drain task runs the callbacks in order, coroutines are awaited in place, so they MUST NOT wait.
+    Beyond max_pending queued callbacks the oldest ones are dropped.
+    """
+
+    _main_loop: asyncio.AbstractEventLoop
+    _max_pending: int
+    # format: callback, args
+    _pending: deque[Tuple[Callable[..., Any], Tuple]]
+    # A wake up is in flight
+    _scheduled: bool
+    _event: Optional[asyncio.Event]
+    _task: Optional[asyncio.Task]
+    _wakeups: int
+    _dispatched: int
+    _dropped: int
+
+    def __init__(self, main_loop: Optional[asyncio.AbstractEventLoop] = None, max_pending: int = 1000) -> None:
+        if max_pending <= 0:
+            raise MIoTCameraError(f"invalid max pending, {max_pending}")
+        self._main_loop = main_loop or asyncio.get_event_loop()
+        self._max_pending = max_pending
+        self._pending = deque()
+        self._scheduled = False
+        self._event = None
+        self._task = None
+        self._wakeups = 0
+        self._dispatched = 0
+        self._dropped = 0
+
+    @property
+    def wakeups(self) -> int:
+        """Event loop wake ups."""
+        return self._wakeups
+
+    @property
+    def dispatched(self) -> int:
+        """Dispatched callbacks."""
+        return self._dispatched
+
+    @property
+    def pending(self) -> int:
+        """Callbacks waiting for the drain task."""
+        return len(self._pending)
+
+    @property
+    def dropped(self) -> int:
+        """Callbacks dropped beyond max_pending."""
+        return self._dropped
+
+    def start(self) -> None:
+        """Start the drain task, MUST be called in the event loop."""
+        if self._task:
+            return
+        self._event = asyncio.Event()
+        if self._pending:
+            self._event.set()
+        self._task = self._main_loop.create_task(self.__drain_loop())
+
+    async def stop_async(self) -> None:
+        """Stop the drain task, pending callbacks are dropped."""
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._pending.clear()
+        self._scheduled = False
+
+    def dispatch(self, callback: Callable[..., Any], *args: Any) -> None:
+        """Queue a callback, thread safe."""
+        if len(self._pending) >= self._max_pending:
+            # The loop does not keep up, drop the oldest instead of growing without bound
+            try:
+                self._pending.popleft()
+                self._dropped += 1
+            except IndexError:
+                pass
+            # _LOGGER.info("dispatcher full, drop the oldest callback, %s", self._dropped)
+        self._pending.append((callback, args))
+        self._dispatched += 1
+        if not self._scheduled:
+            # Set before the wake up, the drain task clears it before draining
+            self._scheduled = True
+            self._wakeups += 1
+            self._main_loop.call_soon_threadsafe(self.__wakeup)
+
+    def __wakeup(self) -> None:
+        if self._event:
+            self._event.set()
+
+    async def __drain_loop(self) -> None:
+        while True:
+            await self._event.wait()  # type: ignore
+            self._event.clear()  # type: ignore
+            self._scheduled = False
+            while self._pending:
+                callback, args = self._pending.popleft()
+                try:
+                    result = callback(*args)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:  # pylint: disable=broad-except
+                    _LOGGER.error("dispatch callback error, %s, %s", callback, e)
+
+
+class MIoTSubscriberQueue:
+    """Bounded queue of a subscriber, its own consumer task awaits the callback for each item.
+    A slow subscriber only fills its own queue, the policy decides what is dropped.
+    Without callback the queue is pulled with get().
+    put_nowait never waits, a full BLOCK queue parks the items in its own backlog of maxsize,
+    they move in as the subscriber frees room, so only the subscriber itself waits for them.
+    """
+
+    _callback: Optional[Callable[..., Coroutine]]
+    _maxsize: int
+    _policy: MIoTCameraQueuePolicy
+    # format: args, is_key, enqueue time
+    _items: deque[Tuple[Tuple, bool, float]]
+    # BLOCK policy, items waiting for room, same format as _items
+    _backlog: deque[Tuple[Tuple, bool, float]]
+    _not_empty: asyncio.Event
+    _not_full: asyncio.Event
+    _task: Optional[asyncio.Task]
+    _closed: bool
+    _drop_until_key: bool
+    _delivered: int
+    _dropped: int
+    # BLOCK policy, items dropped beyond the backlog, included in _dropped
+    _overflowed: int
+
+    def __init__(
+        self,
+        callback: Optional[Callable[..., Coroutine]] = None,
+        maxsize: int = 30,
+        policy: MIoTCameraQueuePolicy = MIoTCameraQueuePolicy.DROP_OLDEST,
+    ) -> None:
+        if maxsize <= 0:
+            raise MIoTCameraError(f"invalid queue size, {maxsize}")
+        self._callback = callback
+        self._maxsize = maxsize
+        self._policy = MIoTCameraQueuePolicy(policy)
+        self._items = deque()
+        self._backlog = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._task = None
+        self._closed = False
+        self._drop_until_key = False
+        self._delivered = 0
+        self._dropped = 0
+        self._overflowed = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @property
+    def policy(self) -> MIoTCameraQueuePolicy:
+        return self._policy
+
+    @property
+    def pending(self) -> int:
+        """Queued items, the BLOCK backlog included."""
+        return len(self._items) + len(self._backlog)
+
+    @property
+    def lag(self) -> float:
+        """Age of the oldest queued item, second."""
+        return time.monotonic() - self._items[0][2] if self._items else 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def delivered(self) -> int:
+        return self._delivered
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def overflowed(self) -> int:
+        """BLOCK items dropped as the backlog was full, counted in dropped as well."""
+        return self._overflowed
+
+    def start(self) -> None:
+        """Start the consumer task, MUST be called in the event loop."""
+        if self._callback and not self._task:
+            self._task = asyncio.get_running_loop().create_task(self.__consume_loop())
+
+    def close(self) -> None:
+        """Cancel the consumer task, queued items are dropped."""
+        self._closed = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._items.clear()
+        self._backlog.clear()
+        # Release blocked producers and pullers
+        self._not_full.set()
+        self._not_empty.set()
+
+    async def put(self, args: Tuple, is_key: bool = True) -> None:
+        """Queue the callback args, is_key marks a frame that starts a GOP.
+        A BLOCK queue waits for room, for a producer feeding this queue alone.
+        """
+        if self._policy == MIoTCameraQueuePolicy.BLOCK:
+            while not self._closed and len(self._items) >= self._maxsize:
+                self._not_full.clear()
+                await self._not_full.wait()
+        self.put_nowait(args, is_key)
+
+    def put_nowait(self, args: Tuple, is_key: bool = True) -> None:
+        """Queue the callback args without waiting, is_key marks a frame that starts a GOP."""
+        if self._closed:
+            return
+        if self._drop_until_key:
+            if not is_key:
+                self._dropped += 1
+                return
+            self._drop_until_key = False
+        if self._policy == MIoTCameraQueuePolicy.BLOCK and (self._backlog or len(self._items) >= self._maxsize):
+            if len(self._backlog) >= self._maxsize:
+                # The backlog is full as well, the subscriber is too slow for the stream
+                self._dropped += 1
+                self._overflowed += 1
+                return
+            self._backlog.append((args, is_key, time.monotonic()))
+            return
+        while len(self._items) >= self._maxsize:
+            if self._policy == MIoTCameraQueuePolicy.DROP_NEWEST:
+                self._dropped += 1
+                return
+            elif self._policy == MIoTCameraQueuePolicy.KEYFRAME_PRESERVING:
+                if not self.__drop_head_gop(is_key):
+                    # Only the current GOP is queued, skip the rest of it
+                    self._drop_until_key = True
+                    self._dropped += 1
+                    return
+            else:
+                self._items.popleft()
+                self._dropped += 1
+        self._items.append((args, is_key, time.monotonic()))
+        self._not_empty.set()
+
+    async def get(self) -> Optional[Tuple]:
+        """Pull the oldest item, wait for one if the queue is empty, None once closed."""
+        while not self._items:
+            if self._closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        args: Tuple = self.__pop()
+        self._delivered += 1
+        return args
+
+    def __pop(self) -> Tuple:
+        """Pop the oldest item, the oldest BLOCK backlog item takes its room."""
+        args, _, _ = self._items.popleft()
+        if self._backlog:
+            self._items.append(self._backlog.popleft())
+        self._not_full.set()
+        return args
+
+    def __drop_head_gop(self, is_key: bool) -> bool:
+        """Drop the oldest GOP, keep the current one unless a new GOP is coming in."""
+        key_count: int = sum(1 for item in self._items if item[1])
+        if key_count < 2 and not is_key and self._items and self._items[0][1]:
+            return False
+        self._items.popleft()
+        self._dropped += 1
+        while self._items and not self._items[0][1]:
+            self._items.popleft()
+            self._dropped += 1
+        return True
+
+    async def __consume_loop(self) -> None:
+        while True:
+            if not self._items:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            args: Tuple = self.__pop()
+            try:
+                await self._callback(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # pylint: disable=broad-except
+                _LOGGER.error("subscriber callback error, %s, %s", self._callback, e)
+            self._delivered += 1
@@ -6,7 +6,7 @@ MIoT Type Definitions.
 """
 from datetime import datetime
 from enum import Enum, auto
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from pydantic import BaseModel, Field, field_validator
 
@@ -298,6 +298,252 @@ class MIoTCameraFrameType(int, Enum):
     FRAME_I = 1  # I frame
 
 
+class MIoTCameraDecodePolicy(str, Enum):
+    """MIoT Camera video decode policy."""
+
+    # Decode every frame
+    ALL = "all"
+    # Decode I frames only, the codec is flushed between them
+    KEYFRAMES_ONLY = "keyframes_only"
+    # Decode the GOP that covers the next frame interval, skip the rest of it
+    INTERVAL_ALIGNED = "interval_aligned"
+
+
+class MIoTCameraDecodeWorkerMode(str, Enum):
+    """MIoT Camera shared decode worker mode."""
+
+    THREAD = "thread"
+    # Decode in worker processes, decoded frames come back through shared memory
+    PROCESS = "process"
+
+
+class MIoTCameraDecodeThreadType(str, Enum):
+    """MIoT Camera video decoder threading."""
+
+    NONE = "none"
+    # Whole frames in parallel, adds thread_count frames of delay
+    FRAME = "frame"
+    # Slices of a frame in parallel, no delay, needs streams encoded with slices
+    SLICE = "slice"
+    AUTO = "auto"
+
+
+class MIoTCameraDecodeDiscard(str, Enum):
+    """MIoT Camera video decoder discard level, frames of the level and below are skipped."""
+
+    DEFAULT = "default"
+    # Frames not used as reference
+    NONREF = "nonref"
+    BIDIR = "bidir"
+    NONINTRA = "nonintra"
+    NONKEY = "nonkey"
+    ALL = "all"
+
+
+class MIoTCameraDecoderOptions(BaseModel):
+    """MIoT Camera video decoder options, None keeps the codec default."""
+
+    thread_type: Optional[MIoTCameraDecodeThreadType] = Field(default=None, description="Decode threading")
+    thread_count: Optional[int] = Field(default=None, description="Decode threads, 0 for the cpu count")
+    skip_frame: MIoTCameraDecodeDiscard = Field(
+        default=MIoTCameraDecodeDiscard.DEFAULT, description="Frames skipped by the decoder"
+    )
+    skip_loop_filter: MIoTCameraDecodeDiscard = Field(
+        default=MIoTCameraDecodeDiscard.DEFAULT, description="Frames decoded without deblocking, preview quality"
+    )
+    low_delay: bool = Field(default=False, description="Output frames without reorder delay")
+    fast: bool = Field(default=False, description="Speedups that are not spec compliant")
+    h264_decoder: Optional[str] = Field(default=None, description="H264 decoder name, default h264")
+    hevc_decoder: Optional[str] = Field(default=None, description="HEVC decoder name, default hevc")
+    flush_on_resync: bool = Field(
+        default=True, description="Flush the reference frames before the I frame resuming a sequence gap"
+    )
+
+
+class MIoTCameraPixelFormat(str, Enum):
+    """MIoT Camera decoded frame pixel format.
+    bgr24/rgb24 frames are (height, width, 3) uint8 arrays, gray frames (height, width).
+    yuv420p frames are planar I420 stacked in one (height * 3 / 2, width) uint8 array, width and height are even:
+        y = frame[:height]
+        u = frame[height : height * 5 // 4].reshape(height // 2, width // 2)
+        v = frame[height * 5 // 4 :].reshape(height // 2, width // 2)
+    """
+
+    BGR24 = "bgr24"
+    RGB24 = "rgb24"
+    GRAY = "gray"
+    # Planar I420, the Y plane rows followed by the U and V planes, shape (height * 3 / 2, width)
+    YUV420P = "yuv420p"
+
+
+class MIoTCameraQueuePolicy(str, Enum):
+    """MIoT Camera subscriber queue policy when the queue is full."""
+
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # Drop whole GOPs from the head, delta frames without reference are never delivered
+    KEYFRAME_PRESERVING = "keyframe_preserving"
+    # Lossless up to a backlog of another queue size, only this subscriber waits.
+    # Beyond 2 * queue size it drops the newest items, counted as overflowed in MIoTCameraSubscriberStats
+    BLOCK = "block"
+
+
+class MIoTCameraSubscriberStats(BaseModel):
+    """MIoT Camera Subscriber Stats."""
+
+    reg_key: str = Field(description="Register key, {kind}.{channel}")
+    reg_id: int = Field(description="Register id")
+    policy: MIoTCameraQueuePolicy = Field(description="Queue policy")
+    maxsize: int = Field(description="Queue size")
+    pending: int = Field(description="Queued items")
+    lag: int = Field(description="Age of the oldest queued item, ms")
+    delivered: int = Field(description="Delivered items")
+    dropped: int = Field(description="Dropped items")
+    overflowed: int = Field(default=0, description="BLOCK items dropped beyond the backlog, included in dropped")
+
+
+class MIoTCameraStreamKind(str, Enum):
+    """MIoT Camera frame stream kind."""
+
+    RAW_VIDEO = "raw_video"
+    RAW_AUDIO = "raw_audio"
+    # Decoded picture encoded as jpeg
+    JPEG = "jpeg"
+    # Decoded picture as numpy array in pix_fmt
+    NDARRAY = "ndarray"
+    PCM = "pcm"
+
+
+class MIoTCameraStreamFrame(NamedTuple):
+    """MIoT Camera Stream Frame, item of a frame stream.
+    data is bytes, or a numpy array for the ndarray kind, sequence is -1 for decoded kinds.
+    """
+
+    did: str
+    channel: int
+    timestamp: int
+    data: Any
+    sequence: int = -1
+
+
+class MIoTCameraStageStats(BaseModel):
+    """MIoT Camera Pipeline Stage Stats."""
+
+    stage: str = Field(description="Stage name, decode, encode or native.{function}")
+    channel: Optional[int] = Field(default=None, description="Camera channel, None for a shared stage")
+    count: int = Field(description="Handled items")
+    avg_latency: float = Field(description="Average handle time, ms")
+    max_latency: float = Field(description="Max handle time, ms")
+    avg_wait: float = Field(default=0, description="Average queue wait before the stage, ms")
+    pending: int = Field(default=0, description="Queued items")
+    dropped: int = Field(default=0, description="Dropped items")
+
+
+class MIoTCameraStreamStats(BaseModel):
+    """MIoT Camera Stream Health Stats of a channel, rolling window unless noted."""
+
+    channel: int = Field(description="Camera channel")
+    kind: MIoTCameraStreamKind = Field(description="Stream kind, raw_video or raw_audio")
+    window: float = Field(description="Window span, second")
+    frames: int = Field(description="Received frames")
+    fps: float = Field(description="Input frames per second")
+    bitrate: float = Field(description="Input bitrate, kbps")
+    key_interval: float = Field(default=0, description="Average camera time between I frames, ms")
+    seq_gaps: int = Field(default=0, description="Frames missing in the sequence, lost before the sdk")
+    seq_reorders: int = Field(default=0, description="Frames late or repeated in the sequence")
+    avg_latency: float = Field(description="Average camera timestamp to wall clock delay, ms")
+    max_latency: float = Field(description="Max camera timestamp to wall clock delay, ms")
+    ring_dropped: int = Field(default=0, description="Frames dropped by the decoder ring buffer, since start")
+    avg_decode: float = Field(default=0, description="Average decode time, ms, since start")
+    max_decode: float = Field(default=0, description="Max decode time, ms, since start")
+    callback_lag: float = Field(default=0, description="Age of the oldest item queued for a subscriber, ms")
+    total_frames: int = Field(description="Received frames, since start")
+    total_gaps: int = Field(description="Frames missing in the sequence, since start")
+    resyncs: int = Field(default=0, description="Decoder resyncs to the next I frame after a sequence gap, since start")
+
+
+class MIoTCameraFleetState(str, Enum):
+    """MIoT Camera Fleet member lifecycle state."""
+
+    # Waiting for a start slot
+    PENDING = "pending"
+    # Created and started, waiting for the first connect
+    STARTING = "starting"
+    CONNECTED = "connected"
+    # Lost or failed connection, the camera reconnects by itself when enabled
+    DISCONNECTED = "disconnected"
+    # Create or start error, or no connect result before the timeout
+    FAILED = "failed"
+    STOPPED = "stopped"
+
+
+class MIoTCameraFleetMember(BaseModel):
+    """MIoT Camera Fleet member."""
+
+    did: str = Field(description="Device id")
+    state: MIoTCameraFleetState = Field(default=MIoTCameraFleetState.PENDING, description="Lifecycle state")
+    quality: MIoTCameraVideoQuality = Field(default=MIoTCameraVideoQuality.LOW, description="Video quality")
+    error: Optional[str] = Field(default=None, description="Error of the failed state")
+    start_duration: int = Field(default=0, description="Start slot acquired to the first connect result, ms")
+    connects: int = Field(default=0, description="Connect count")
+    disconnects: int = Field(default=0, description="Disconnect count")
+    update_ts: int = Field(default=0, description="Last state change, second")
+
+
+class MIoTCameraAudioFormat(str, Enum):
+    """MIoT Camera decoded pcm sample format, packed."""
+
+    INT16 = "s16"
+    FLOAT32 = "flt"
+
+
+class MIoTCameraImageFormat(str, Enum):
+    """MIoT Camera encoded image format."""
+
+    JPEG = "jpeg"
+    PNG = "png"
+    WEBP = "webp"
+    # Packed rgb24 pixels without container
+    RAW = "raw"
+
+
+class MIoTCameraVariant(NamedTuple):
+    """MIoT Camera decoded output variant, subscribers of the same variant share one output per frame.
+    output is an encoded image format or a numpy pixel format, quality only applies to jpeg and webp,
+    max_width/max_height of 0 keep the decoded size.
+    """
+
+    output: MIoTCameraImageFormat | MIoTCameraPixelFormat = MIoTCameraImageFormat.JPEG
+    quality: int = 90
+    max_width: int = 0
+    max_height: int = 0
+
+    @classmethod
+    def create(
+        cls,
+        output: MIoTCameraImageFormat | MIoTCameraPixelFormat,
+        quality: int = 90,
+        max_width: int = 0,
+        max_height: int = 0,
+    ) -> "MIoTCameraVariant":
+        """Create a variant, the unused quality is cleared so that equal outputs share a variant."""
+        if output not in (MIoTCameraImageFormat.JPEG, MIoTCameraImageFormat.WEBP):
+            quality = 0
+        return cls(output=output, quality=quality, max_width=max(0, max_width), max_height=max(0, max_height))
+
+    def fit(self, width: int, height: int) -> Tuple[int, int]:
+        """Output size of a decoded picture, keep the aspect ratio and never upscale."""
+        scale: float = 1.0
+        if self.max_width and width > self.max_width:
+            scale = self.max_width / width
+        if self.max_height and height > self.max_height:
+            scale = min(scale, self.max_height / height)
+        if scale >= 1.0:
+            return width, height
+        # Even sizes for yuv420p
+        return max(2, int(width * scale) & ~1), max(2, int(height * scale) & ~1)
+
+
 class MIoTCameraFrameData(BaseModel):
     """MIoT Camera Frame."""
 
@@ -310,6 +556,46 @@ class MIoTCameraFrameData(BaseModel):
     data: bytes = Field(description="Frame data")
 
 
+class MIoTCameraFrame(NamedTuple):
+    """MIoT Camera Frame, lightweight record of the raw data hot path, no validation.
+    codec_id and frame_type are the raw values of MIoTCameraCodec and MIoTCameraFrameType,
+    data is a memoryview slice of a pooled slab on the camera path.
+    """
+
+    codec_id: int
+    length: int
+    timestamp: int
+    sequence: int
+    frame_type: int
+    channel: int
+    data: bytes | memoryview
+
+    def to_model(self) -> MIoTCameraFrameData:
+        """Build the validated pydantic model."""
+        return MIoTCameraFrameData(**self._replace(data=bytes(self.data))._asdict())
+
+
+class MIoTCameraRecordFormat(str, Enum):
+    """MIoT Camera record container format."""
+
+    # Fragmented mp4
+    MP4 = "mp4"
+    MKV = "mkv"
+
+
+class MIoTCameraRecordSegment(BaseModel):
+    """MIoT Camera Record Segment."""
+
+    did: str = Field(description="Device id")
+    channel: int = Field(description="Camera channel")
+    path: str = Field(description="Segment file path")
+    create_ts: int = Field(description="Segment create time, second")
+    start_ts: int = Field(description="Timestamp of the first frame")
+    end_ts: int = Field(description="Timestamp of the last frame")
+    frame_count: int = Field(default=0, description="Frame count, video and audio")
+    size: int = Field(default=0, description="Segment file size, byte")
+
+
 class MIoTCameraExtraItem(BaseModel):
     """MIoT Camera Extra Item."""
 
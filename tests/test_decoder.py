@@ -0,0 +1,711 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import ctypes
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from fractions import Fraction
+from io import BytesIO
+
+import av
+import numpy as np
+from av.audio.frame import AudioFrame
+from av.codec import CodecContext
+from av.video.frame import VideoFrame
+from PIL import Image
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from miloco_sdk.utils.decoder import (
+    MIoTAudioChunker,
+    MIoTImageEncoder,
+    MIoTMediaBufferPool,
+    MIoTMediaClipExporter,
+    MIoTMediaDecodeScheduler,
+    MIoTMediaDecoder,
+    MIoTMediaEncodePool,
+    MIoTMediaPreRollBuffer,
+    MIoTMediaRecorder,
+    MIoTMediaRingBuffer,
+    MIoTMediaSnapshot,
+    MIoTMediaStreamMeter,
+    MIoTRawImageEncoder,
+)
+from miloco_sdk.utils.error import MIoTMediaDecoderError
+from miloco_sdk.utils.types import (
+    MIoTCameraAudioFormat,
+    MIoTCameraCodec,
+    MIoTCameraDecodeDiscard,
+    MIoTCameraDecoderOptions,
+    MIoTCameraDecodePolicy,
+    MIoTCameraDecodeThreadType,
+    MIoTCameraDecodeWorkerMode,
+    MIoTCameraFrame,
+    MIoTCameraFrameType,
+    MIoTCameraImageFormat,
+    MIoTCameraPixelFormat,
+    MIoTCameraRecordFormat,
+    MIoTCameraStreamKind,
+    MIoTCameraVariant,
+)
+
+
+def gen_h264_frames(count=20, width=320, height=240, gop=10, channel=0):
+    """Encode a synthetic h264 stream and wrap it as camera frames."""
+    encoder = CodecContext.create("libx264", "w")
+    encoder.width = width
+    encoder.height = height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, 25)
+    encoder.gop_size = gop
+    encoder.max_b_frames = 0
+    encoder.options = {"tune": "zerolatency", "sc_threshold": "0"}
+    encoder.open()
+    packets = []
+    for i in range(count):
+        img = np.full((height, width, 3), (i * 8) % 255, dtype=np.uint8)
+        frame = VideoFrame.from_ndarray(img, format="rgb24").reformat(format="yuv420p")
+        frame.pts = i
+        packets.extend(encoder.encode(frame))
+    packets.extend(encoder.encode(None))
+    return [
+        MIoTCameraFrame(
+            codec_id=MIoTCameraCodec.VIDEO_H264,
+            length=len(bytes(pkt)),
+            timestamp=i * 40,
+            sequence=i,
+            frame_type=MIoTCameraFrameType.FRAME_I if pkt.is_keyframe else MIoTCameraFrameType.FRAME_P,
+            channel=channel,
+            data=bytes(pkt),
+        )
+        for i, pkt in enumerate(packets)
+    ]
+
+
+def make_frame(sequence, frame_type, channel=0):
+    return MIoTCameraFrame(
+        codec_id=MIoTCameraCodec.VIDEO_H264,
+        length=1,
+        timestamp=sequence * 40,
+        sequence=sequence,
+        frame_type=frame_type,
+        channel=channel,
+        data=b"\x00",
+    )
+
+
+class TestMIoTCameraFrame(unittest.TestCase):
+
+    def test_to_model(self):
+        frame_data = MIoTCameraFrame(4, 3, 40, 1, 1, 0, b"abc")
+        model = frame_data.to_model()
+        self.assertEqual(model.codec_id, MIoTCameraCodec.VIDEO_H264)
+        self.assertEqual(model.frame_type, MIoTCameraFrameType.FRAME_I)
+        self.assertEqual(model.data, b"abc")
+
+
+class TestMIoTMediaBufferPool(unittest.TestCase):
+
+    def test_slabs_are_reused(self):
+        pool = MIoTMediaBufferPool(min_slab_size=1024, max_slab_size=1024)
+        src = ctypes.create_string_buffer(bytes(range(200)), 200)
+        views = [pool.copy(src, 200) for _ in range(5)]
+        self.assertEqual(bytes(views[3]), bytes(range(200)))
+        # 5 packets in the first slab, the sixth starts a new one
+        views.append(pool.copy(src, 200))
+        self.assertEqual(pool.slab_count, 2)
+
+        # A live slice pins its slab, the second slab is recycled instead
+        kept = views[0]
+        views.clear()
+        gc.collect()
+        other = ctypes.create_string_buffer(200)
+        for _ in range(10):
+            pool.copy(other, 200)
+        self.assertEqual(pool.slab_count, 2)
+        self.assertEqual(bytes(kept), bytes(range(200)))
+        del kept
+        for _ in range(10):
+            pool.copy(other, 200)
+        self.assertEqual(pool.slab_count, 2)
+
+    def test_oversized_packet(self):
+        pool = MIoTMediaBufferPool(min_slab_size=1024, max_slab_size=1024)
+        src = ctypes.create_string_buffer(2048)
+        self.assertEqual(len(pool.copy(src, 2048)), 2048)
+        self.assertEqual(pool.slab_count, 0)
+
+
+class TestMIoTMediaRingBuffer(unittest.TestCase):
+
+    def drain(self, buffer):
+        frames = []
+        while buffer.video_len:
+            buffer.step(on_video_frame=frames.append, on_audio_frame=frames.append, timeout=0)
+        return [frame.sequence for frame in frames]
+
+    def test_overflow_drops_whole_gop(self):
+        buffer = MIoTMediaRingBuffer(maxlen=6)
+        for seq in range(9):
+            buffer.put_video(make_frame(seq, MIoTCameraFrameType.FRAME_I if seq % 3 == 0 else MIoTCameraFrameType.FRAME_P))
+
+        # The first GOP is dropped as a whole when the third I frame arrives
+        self.assertEqual(self.drain(buffer), [3, 4, 5, 6, 7, 8])
+        self.assertEqual(buffer.dropped_frames, 3)
+        self.assertEqual(buffer.dropped_gops, 1)
+
+    def test_drop_p_frames_until_next_key(self):
+        buffer = MIoTMediaRingBuffer(maxlen=3)
+        buffer.put_video(make_frame(0, MIoTCameraFrameType.FRAME_P))
+        for seq in range(1, 6):
+            buffer.put_video(make_frame(seq, MIoTCameraFrameType.FRAME_I if seq == 1 else MIoTCameraFrameType.FRAME_P))
+        self.assertEqual(self.drain(buffer), [1, 2, 3])
+        # The reference of the P frame 5 is gone, even with free space
+        buffer.put_video(make_frame(6, MIoTCameraFrameType.FRAME_P))
+        buffer.put_video(make_frame(7, MIoTCameraFrameType.FRAME_I))
+        self.assertEqual(self.drain(buffer), [7])
+        self.assertEqual(buffer.dropped_frames, 4)
+        self.assertEqual(buffer.dropped_gops, 1)
+
+
+class TestMIoTMediaStreamMeter(unittest.TestCase):
+
+    def test_sequence_and_latency(self):
+        meter = MIoTMediaStreamMeter(window=5)
+        now_ms = int(time.time() * 1000)
+        # Camera clock 100 ms behind, I frame every 4 frames of 40 ms, 5 and 6 lost, 4 arrives late
+        for seq in (0, 1, 2, 3, 7, 4, 8, 9):
+            meter.record(1000, now_ms - 100 + seq * 40, seq, seq % 4 == 0)
+        stats = meter.stats(0, MIoTCameraStreamKind.RAW_VIDEO)
+        self.assertEqual(stats.frames, 8)
+        self.assertEqual(stats.seq_gaps, 3)
+        self.assertEqual(stats.seq_reorders, 1)
+        self.assertEqual(stats.total_gaps, 3)
+        self.assertEqual(stats.key_interval, 160)
+        self.assertGreaterEqual(stats.max_latency, 100)
+        self.assertLess(stats.avg_latency, 100)
+
+        # A new connection restarts the sequence, the uint32 wrap is no gap
+        meter.reset_sequence()
+        meter.record(1000, now_ms, 0xFFFFFFFF, True)
+        meter.record(1000, now_ms, 0, False)
+        stats = meter.stats(0, MIoTCameraStreamKind.RAW_VIDEO)
+        self.assertEqual((stats.seq_gaps, stats.seq_reorders, stats.total_frames), (3, 1, 10))
+
+    def test_sequence_restart(self):
+        meter = MIoTMediaStreamMeter(window=5)
+        now_ms = int(time.time() * 1000)
+        for seq in range(1000, 1010):
+            meter.record(1000, now_ms, seq, False)
+        # The camera restarts the sequence without a reconnect, 2 lost after the restart
+        lost = [meter.record(1000, now_ms, seq, False) for seq in (0, 1, 4, 5)]
+        self.assertEqual(lost, [0, 0, 2, 0])
+        stats = meter.stats(0, MIoTCameraStreamKind.RAW_VIDEO)
+        self.assertEqual((stats.seq_gaps, stats.seq_reorders), (2, 0))
+
+        # A restart close to the last sequence shows up as a run of late frames
+        meter.reset_sequence()
+        meter.record(1000, now_ms, 20, False)
+        lost = [meter.record(1000, now_ms, seq, False) for seq in range(10, 20)]
+        self.assertEqual(lost, [0] * 10)
+        # Re-based at the 8th late frame, 20 and 21 lost
+        self.assertEqual(meter.record(1000, now_ms, 22, False), 2)
+        stats = meter.stats(0, MIoTCameraStreamKind.RAW_VIDEO)
+        self.assertEqual((stats.seq_gaps, stats.seq_reorders), (4, 7))
+
+
+class TestMIoTMediaDecoder(unittest.IsolatedAsyncioTestCase):
+
+    async def test_decode_frame_without_jpeg(self):
+        jpegs = []
+        frames = []
+
+        async def on_jpeg(variant, data, ts, channel):
+            jpegs.append(data)
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append((variant, frame))
+
+        decoder = MIoTMediaDecoder(frame_interval=0, video_callback=on_jpeg, frame_callback=on_frame)
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 0})
+        for frame_data in gen_h264_frames(count=5):
+            decoder._on_video_callback(frame_data)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(jpegs, [])
+        self.assertTrue(frames)
+        variant, frame = frames[0]
+        self.assertEqual(variant.output, MIoTCameraPixelFormat.GRAY)
+        self.assertEqual(frame.shape, (240, 320))
+
+    async def test_decode_frame_yuv420p(self):
+        frames = []
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append(frame)
+
+        decoder = MIoTMediaDecoder(frame_interval=0, video_callback=on_jpeg, frame_callback=on_frame)
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.YUV420P): 0})
+        for frame_data in gen_h264_frames(count=5, width=320, height=240):
+            decoder._on_video_callback(frame_data)
+        await asyncio.sleep(0.05)
+
+        self.assertTrue(frames)
+        # Planar I420 stacked, Y rows then the quarter size U and V planes
+        frame = frames[-1]
+        self.assertEqual(frame.shape, (360, 320))
+        self.assertEqual(frame.dtype, np.uint8)
+        y = frame[:240]
+        u = frame[240:300].reshape(120, 160)
+        v = frame[300:].reshape(120, 160)
+        self.assertEqual(y.shape, (240, 320))
+        # Gray pictures, neutral chroma
+        self.assertLess(np.abs(u.astype(np.int16) - 128).max(), 4)
+        self.assertLess(np.abs(v.astype(np.int16) - 128).max(), 4)
+        self.assertGreater(y.mean(), 16)
+
+    async def test_decoder_options(self):
+        frames = []
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append(ts)
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        options = MIoTCameraDecoderOptions(
+            thread_type=MIoTCameraDecodeThreadType.SLICE,
+            thread_count=2,
+            skip_loop_filter=MIoTCameraDecodeDiscard.ALL,
+            low_delay=True,
+        )
+        decoder = MIoTMediaDecoder(
+            frame_interval=0, video_callback=on_jpeg, frame_callback=on_frame, decoder_options=options
+        )
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 0})
+        for frame_data in gen_h264_frames(count=5):
+            decoder._on_video_callback(frame_data)
+        await asyncio.sleep(0.05)
+
+        codec = decoder._video_context._codec
+        self.assertEqual(codec.thread_type.name, "SLICE")
+        self.assertEqual(codec.thread_count, 2)
+        self.assertEqual(frames, [0, 40, 80, 120, 160])
+
+    async def test_variants(self):
+        outputs = []
+
+        async def on_output(variant, data, ts, channel):
+            outputs.append((variant, data, ts))
+
+        small_jpeg = MIoTCameraVariant.create(MIoTCameraImageFormat.JPEG, quality=60, max_width=160, max_height=160)
+        full_webp = MIoTCameraVariant.create(MIoTCameraImageFormat.WEBP)
+        small_gray = MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY, max_width=100)
+        decoder = MIoTMediaDecoder(frame_interval=0, video_callback=on_output, frame_callback=on_output)
+        # Frames are fed at once, a long interval yields the first frame only
+        decoder.update_outputs({small_jpeg: 0, full_webp: 60000, small_gray: 0})
+        for frame_data in gen_h264_frames(count=5):
+            decoder._on_video_callback(frame_data)
+        await asyncio.sleep(0.05)
+
+        counts = {variant: sum(1 for item in outputs if item[0] == variant) for variant in decoder._variants}
+        self.assertEqual(counts, {small_jpeg: 5, full_webp: 1, small_gray: 5})
+        images = {variant: data for variant, data, _ in outputs}
+        self.assertEqual(Image.open(BytesIO(images[small_jpeg])).size, (160, 120))
+        self.assertEqual(Image.open(BytesIO(images[full_webp])).format, "WEBP")
+        self.assertEqual(Image.open(BytesIO(images[full_webp])).size, (320, 240))
+        self.assertEqual(images[small_gray].shape, (74, 100))
+
+    async def test_decode_g711(self):
+        pcm = []
+
+        async def on_pcm(data, ts, channel):
+            pcm.append(data)
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        decoder = MIoTMediaDecoder(frame_interval=0, video_callback=on_jpeg, audio_callback=on_pcm, enable_audio=True)
+        for codec_id in (MIoTCameraCodec.AUDIO_G711A, MIoTCameraCodec.AUDIO_G711U):
+            pcm.clear()
+            decoder._audio_decoder = None
+            for seq in range(5):
+                decoder._on_audio_callback(
+                    MIoTCameraFrame(
+                        codec_id=codec_id,
+                        length=160,
+                        timestamp=seq * 20,
+                        sequence=seq,
+                        frame_type=MIoTCameraFrameType.FRAME_I,
+                        channel=0,
+                        data=bytes(range(160)),
+                    )
+                )
+            await asyncio.sleep(0.05)
+            # 20 ms chunks of 16 kHz s16, the resampler delay holds back the last one
+            self.assertEqual([len(data) for data in pcm], [640] * 4)
+
+    async def test_keyframes_only(self):
+        frames = []
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append(ts)
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        decoder = MIoTMediaDecoder(
+            frame_interval=0,
+            video_callback=on_jpeg,
+            frame_callback=on_frame,
+            decode_policy=MIoTCameraDecodePolicy.KEYFRAMES_ONLY,
+        )
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 0})
+        for frame_data in gen_h264_frames(count=20, gop=10):
+            decoder.push_video_frame(frame_data)
+        self.assertEqual(decoder._queue.video_len, 2)
+        for _ in range(2):
+            decoder._queue.step(on_video_frame=decoder._on_video_callback, on_audio_frame=None, timeout=0)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(frames, [0, 400])
+
+    async def test_interval_aligned(self):
+        frames = []
+        decoded = []
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append(ts)
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        decoder = MIoTMediaDecoder(
+            frame_interval=1000,
+            video_callback=on_jpeg,
+            frame_callback=on_frame,
+            decode_policy=MIoTCameraDecodePolicy.INTERVAL_ALIGNED,
+        )
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 1000})
+        decode = decoder._video_context.decode
+
+        def record_decode(**kwargs):
+            decoded.append(kwargs["data"])
+            return decode(**kwargs)
+
+        decoder._video_context.decode = record_decode
+        # 4 GOPs of 400 ms handled in one burst, the camera timing paces the decode
+        stream = gen_h264_frames(count=40, gop=10)
+        for frame_data in stream:
+            decoder._on_video_callback(frame_data)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(frames, [0, 1000])
+        # GOP 400-760 and 1200-1560 end before an output is due, GOP 800 stops after the 1000 ms output
+        expected = [frame_data.data for frame_data in stream[:10] + stream[20:26]]
+        self.assertEqual(decoded, expected)
+
+    async def test_resync_after_sequence_gap(self):
+        frames = []
+        resyncs = []
+
+        async def on_frame(variant, frame, ts, channel):
+            frames.append(ts)
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        async def on_resync(seq, lost, channel):
+            resyncs.append((seq, lost, channel))
+
+        decoder = MIoTMediaDecoder(
+            frame_interval=0, video_callback=on_jpeg, frame_callback=on_frame, resync_callback=on_resync
+        )
+        decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 0})
+        # Frames 3 and 4 are lost, 5 to 9 reference them, the raw data path finds the gap
+        meter = MIoTMediaStreamMeter()
+        for frame_data in gen_h264_frames(count=20, gop=10):
+            if frame_data.sequence in (3, 4):
+                continue
+            lost = meter.record(frame_data.length, frame_data.timestamp, frame_data.sequence, False)
+            if lost:
+                decoder.resync(frame_data.sequence, lost, frame_data.channel)
+            decoder.push_video_frame(frame_data)
+        self.assertEqual(decoder.resyncs, 1)
+        self.assertEqual(decoder.dropped_frames, 5)
+        resets = []
+        decode = decoder._video_context.decode
+
+        def record_decode(**kwargs):
+            resets.append(kwargs["reset"])
+            return decode(**kwargs)
+
+        decoder._video_context.decode = record_decode
+        while decoder._queue.video_len:
+            decoder._queue.step(on_video_frame=decoder._on_video_callback, on_audio_frame=None, timeout=0)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(resyncs, [(5, 2, 0)])
+        self.assertEqual(frames, [i * 40 for i in (0, 1, 2, *range(10, 20))])
+        # The codec is flushed before the I frame resuming the decode
+        self.assertEqual(resets, [False] * 3 + [True] + [False] * 9)
+
+
+class TestMIoTMediaEncodePool(unittest.IsolatedAsyncioTestCase):
+
+    async def test_encode_stage(self):
+        outputs = []
+
+        async def on_image(variant, data, ts, channel):
+            outputs.append((variant, data, ts))
+
+        pool = MIoTMediaEncodePool(worker_count=2, maxsize=32)
+        # Pluggable, webp outputs raw pixels here
+        pool.set_encoder(MIoTCameraImageFormat.WEBP, MIoTRawImageEncoder())
+        # An encoder without encode() is refused
+        with self.assertRaises(TypeError):
+            type("Incomplete", (MIoTImageEncoder,), {})()
+        with self.assertRaises(MIoTMediaDecoderError):
+            pool.set_encoder(MIoTCameraImageFormat.PNG, object())
+        pool.start()
+        jpeg = MIoTCameraVariant.create(MIoTCameraImageFormat.JPEG, quality=70)
+        raw = MIoTCameraVariant.create(MIoTCameraImageFormat.WEBP, max_width=160)
+        decoder = MIoTMediaDecoder(frame_interval=0, video_callback=on_image, encode_pool=pool)
+        decoder.update_outputs({jpeg: 0, raw: 0})
+        for frame_data in gen_h264_frames(count=10):
+            decoder._on_video_callback(frame_data)
+        for _ in range(100):
+            if len(outputs) == 20:
+                break
+            await asyncio.sleep(0.02)
+        stats = pool.stats()
+        decoder.stop()
+        pool.stop()
+
+        # Outputs of a decoder keep the frame order
+        self.assertEqual([ts for variant, _, ts in outputs if variant == jpeg], [i * 40 for i in range(10)])
+        images = {variant: data for variant, data, _ in outputs}
+        self.assertEqual(Image.open(BytesIO(images[jpeg])).size, (320, 240))
+        self.assertEqual(len(images[raw]), 160 * 120 * 3)
+        self.assertEqual(stats.stage, "encode")
+        self.assertEqual(stats.count, 10)
+        self.assertEqual(stats.dropped, 0)
+        self.assertEqual(decoder.decode_timer.stats("decode").count, 10)
+
+
+class TestMIoTAudioChunker(unittest.TestCase):
+
+    def test_fixed_chunks(self):
+        chunker = MIoTAudioChunker(
+            sample_rate=8000, layout="stereo", audio_format=MIoTCameraAudioFormat.FLOAT32, chunk_duration=100
+        )
+        chunks = []
+        for seq in range(30):
+            frame = AudioFrame.from_ndarray(np.full((1, 160), 1000, dtype=np.int16), format="s16", layout="mono")
+            frame.sample_rate = 8000
+            chunks.extend(chunker.push([frame], timestamp=seq * 20))
+        self.assertEqual(len(chunks), 6)
+        for index, (chunk, timestamp) in enumerate(chunks):
+            self.assertEqual(chunk.shape, (800, 2))
+            self.assertEqual(chunk.dtype, np.float32)
+            self.assertTrue(abs(timestamp - index * 100) <= 2)
+        # Mono is upmixed to both channels
+        self.assertTrue(np.array_equal(chunks[-1][0][:, 0], chunks[-1][0][:, 1]))
+        self.assertTrue((chunks[-1][0] > 0).all())
+
+
+class TestMIoTMediaDecodeScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def test_shared_workers(self):
+        await self.run_shared_workers(MIoTCameraDecodeWorkerMode.THREAD)
+
+    async def test_shared_worker_processes(self):
+        await self.run_shared_workers(MIoTCameraDecodeWorkerMode.PROCESS)
+
+    async def run_shared_workers(self, worker_mode):
+        scheduler = MIoTMediaDecodeScheduler(worker_count=2, worker_mode=worker_mode, shm_slot_size=1024 * 1024)
+        scheduler.start()
+        frames = {channel: [] for channel in range(3)}
+
+        async def on_jpeg(variant, data, ts, channel):
+            pass
+
+        async def on_frame(variant, frame, ts, channel):
+            self.assertEqual(frame.shape, (240, 320))
+            frames[channel].append(ts)
+
+        decoders = []
+        for channel in range(3):
+            decoder = MIoTMediaDecoder(
+                frame_interval=0, video_callback=on_jpeg, frame_callback=on_frame, scheduler=scheduler
+            )
+            decoder.update_outputs({MIoTCameraVariant.create(MIoTCameraPixelFormat.GRAY): 0})
+            decoder.start()
+            decoders.append(decoder)
+        for channel, decoder in enumerate(decoders):
+            for frame_data in gen_h264_frames(count=10, channel=channel):
+                decoder.push_video_frame(frame_data)
+        for _ in range(100):
+            if all(len(item) == 10 for item in frames.values()):
+                break
+            await asyncio.sleep(0.05)
+        for decoder in decoders:
+            decoder.stop()
+        scheduler.stop()
+
+        self.assertFalse(decoders[0].is_alive())
+        for channel in range(3):
+            self.assertEqual(frames[channel], [i * 40 for i in range(10)])
+
+
+class TestMIoTMediaRecorder(unittest.TestCase):
+
+    def test_segments(self):
+        for record_format in MIoTCameraRecordFormat:
+            with tempfile.TemporaryDirectory() as record_path:
+                recorder = MIoTMediaRecorder(
+                    did="123", channel=0, record_path=record_path, segment_duration=1, record_format=record_format
+                )
+                recorder.start()
+                frames = gen_h264_frames(count=60, gop=10)
+                # Leading P frames are skipped until the first I frame
+                for frame_data in frames[5:]:
+                    recorder.push_video_frame(frame_data)
+                recorder.stop()
+
+                segments = recorder.segments
+                self.assertEqual([segment.start_ts for segment in segments], [400, 1600])
+                self.assertEqual([segment.frame_count for segment in segments], [30, 20])
+                with open(os.path.join(record_path, "123", "index.jsonl"), encoding="utf-8") as f:
+                    self.assertEqual([json.loads(line)["path"] for line in f], [segment.path for segment in segments])
+                with av.open(segments[0].path) as container:
+                    self.assertEqual(sum(1 for _ in container.decode(video=0)), 30)
+
+
+class TestMIoTMediaPreRollBuffer(unittest.TestCase):
+
+    def test_bounded_by_duration_and_bytes(self):
+        frames = gen_h264_frames(count=60, gop=10)
+        buffer = MIoTMediaPreRollBuffer(duration=1)
+        for frame_data in frames:
+            buffer.push(frame_data)
+        snapshot, newest_ts = buffer.attach(lambda frame_data: None, before=0)
+        self.assertEqual(newest_ts, 2360)
+        self.assertEqual(snapshot[0].timestamp, 2000)
+        # The oldest GOP still covering the duration is kept
+        snapshot, _ = buffer.attach(lambda frame_data: None, before=1000)
+        self.assertEqual(snapshot[0].timestamp, 1200)
+
+        buffer = MIoTMediaPreRollBuffer(duration=60, max_bytes=sum(len(f.data) for f in frames[:15]))
+        for frame_data in frames:
+            buffer.push(frame_data)
+        self.assertLessEqual(buffer.size, sum(len(f.data) for f in frames[:15]))
+        snapshot, _ = buffer.attach(lambda frame_data: None, before=60000)
+        # Whole GOPs are dropped from the head
+        self.assertEqual(snapshot[0].frame_type, MIoTCameraFrameType.FRAME_I)
+        self.assertGreater(snapshot[0].timestamp, 0)
+
+    def test_export_clip(self):
+        frames = gen_h264_frames(count=60, gop=10)
+        buffer = MIoTMediaPreRollBuffer(duration=2)
+        for frame_data in frames[:30]:
+            buffer.push(frame_data)
+        results = []
+        with tempfile.TemporaryDirectory() as clip_path:
+            path = os.path.join(clip_path, "clip.mp4")
+            exporter = MIoTMediaClipExporter(
+                path=path, after=400, done_callback=lambda result, error: results.append((result, error))
+            )
+            snapshot, trigger_ts = buffer.attach(exporter.push_frame, before=400)
+            exporter.start_export(snapshot, trigger_ts)
+            # Live frames after the trigger
+            for frame_data in frames[30:]:
+                buffer.push(frame_data)
+            exporter.join(timeout=10)
+            buffer.detach(exporter.push_frame)
+
+            self.assertEqual(results, [(path, None)])
+            with av.open(path) as container:
+                # 800 ms of pre-roll from the GOP at 400, the trigger at 1160 and 400 ms after
+                self.assertEqual(sum(1 for _ in container.decode(video=0)), 30)
+
+    def test_export_clip_audio_ahead(self):
+        frames = gen_h264_frames(count=30, gop=10)
+
+        def audio_frame(ts):
+            return MIoTCameraFrame(
+                codec_id=MIoTCameraCodec.AUDIO_G711A,
+                length=160,
+                timestamp=ts,
+                sequence=0,
+                frame_type=MIoTCameraFrameType.FRAME_I,
+                channel=0,
+                data=bytes(160),
+            )
+
+        results = []
+        with tempfile.TemporaryDirectory() as clip_path:
+            path = os.path.join(clip_path, "clip.mp4")
+            exporter = MIoTMediaClipExporter(
+                path=path, after=400, done_callback=lambda result, error: results.append((result, error))
+            )
+            # The trigger at 360, the clip ends at 760
+            exporter.start_export([audio_frame(0)] + frames[:10], 360)
+            # Audio arriving ahead of the video does not end the clip
+            exporter.push_frame(audio_frame(900))
+            for frame_data in frames[10:]:
+                exporter.push_frame(frame_data)
+            exporter.join(timeout=10)
+
+            self.assertEqual(results, [(path, None)])
+            with av.open(path) as container:
+                self.assertEqual(sum(1 for _ in container.decode(video=0)), 20)
+
+
+class TestMIoTMediaSnapshot(unittest.TestCase):
+
+    def test_lazy_decode_and_cache(self):
+        frames = gen_h264_frames(count=15, gop=10)
+        snapshot = MIoTMediaSnapshot()
+        self.assertIsNone(snapshot.get())
+        for frame_data in frames[:12]:
+            snapshot.push(frame_data)
+        # Only the latest GOP is kept, nothing is decoded until asked
+        self.assertEqual(len(snapshot._gop), 2)
+        self.assertEqual(snapshot._decoded_count, 0)
+
+        image = snapshot.get(MIoTCameraPixelFormat.GRAY)
+        # The newest frame, filled with (11 * 8) % 255
+        self.assertEqual(image.shape, (240, 320))
+        self.assertTrue(abs(int(image.mean()) - 88) <= 2)
+        self.assertIs(snapshot.get(MIoTCameraPixelFormat.GRAY), image)
+
+        snapshot.push(frames[12])
+        jpeg = snapshot.get(MIoTCameraImageFormat.JPEG, max_size=160)
+        self.assertEqual(snapshot._decoded_count, 3)
+        with Image.open(BytesIO(jpeg)) as img:
+            self.assertEqual(img.size, (160, 120))
+
+    def test_decoder_options(self):
+        options = MIoTCameraDecoderOptions(thread_type=MIoTCameraDecodeThreadType.SLICE, thread_count=2)
+        snapshot = MIoTMediaSnapshot(options)
+        for frame_data in gen_h264_frames(count=3, gop=10):
+            snapshot.push(frame_data)
+        self.assertIsNotNone(snapshot.get(MIoTCameraPixelFormat.GRAY))
+        self.assertEqual(snapshot._codec.thread_count, 2)
+        self.assertEqual(snapshot._codec.thread_type.name, "SLICE")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from miloco_sdk.utils.dispatcher import MIoTCallbackDispatcher, MIoTSubscriberQueue
+from miloco_sdk.utils.types import MIoTCameraQueuePolicy
+
+
+class TestMIoTCallbackDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def test_batched_dispatch(self):
+        dispatcher = MIoTCallbackDispatcher()
+        dispatcher.start()
+        received = []
+
+        async def on_frame(seq):
+            received.append(seq)
+
+        def produce():
+            for seq in range(1000):
+                dispatcher.dispatch(on_frame, seq)
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        thread.join()
+        for _ in range(100):
+            if len(received) == 1000:
+                break
+            await asyncio.sleep(0.01)
+        await dispatcher.stop_async()
+
+        self.assertEqual(received, list(range(1000)))
+        self.assertEqual(dispatcher.dispatched, 1000)
+        # Frames queued while a wake up is in flight share it
+        self.assertLess(dispatcher.wakeups, 1000)
+
+    async def test_callback_error(self):
+        dispatcher = MIoTCallbackDispatcher()
+        dispatcher.start()
+        received = []
+
+        def on_error():
+            raise ValueError("error")
+
+        dispatcher.dispatch(on_error)
+        dispatcher.dispatch(received.append, 1)
+        await asyncio.sleep(0.01)
+        await dispatcher.stop_async()
+        self.assertEqual(received, [1])
+
+    async def test_bounded_pending(self):
+        dispatcher = MIoTCallbackDispatcher(max_pending=10)
+        received = []
+        for seq in range(25):
+            dispatcher.dispatch(received.append, seq)
+        self.assertEqual(dispatcher.pending, 10)
+        dispatcher.start()
+        await asyncio.sleep(0.01)
+        await dispatcher.stop_async()
+        # The oldest callbacks are dropped
+        self.assertEqual(received, list(range(15, 25)))
+        self.assertEqual(dispatcher.dropped, 15)
+
+
+class TestMIoTSubscriberQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def run_slow_subscriber(self, policy, frames, maxsize=4):
+        received = []
+        release = asyncio.Event()
+
+        async def on_frame(seq):
+            await release.wait()
+            received.append(seq)
+
+        queue = MIoTSubscriberQueue(callback=on_frame, maxsize=maxsize, policy=policy)
+        queue.start()
+        # The first frame is taken by the consumer and blocks on release
+        await queue.put((frames[0][0],), frames[0][1])
+        await asyncio.sleep(0)
+        for seq, is_key in frames[1:]:
+            await queue.put((seq,), is_key)
+        self.assertLessEqual(queue.pending, maxsize)
+        release.set()
+        for _ in range(100):
+            if not queue.pending:
+                break
+            await asyncio.sleep(0.01)
+        queue.close()
+        return received, queue
+
+    async def test_drop_oldest(self):
+        received, queue = await self.run_slow_subscriber(
+            MIoTCameraQueuePolicy.DROP_OLDEST, [(seq, True) for seq in range(10)]
+        )
+        self.assertEqual(received, [0, 6, 7, 8, 9])
+        self.assertEqual(queue.dropped, 5)
+        self.assertEqual(queue.delivered, 5)
+
+    async def test_drop_newest(self):
+        received, queue = await self.run_slow_subscriber(
+            MIoTCameraQueuePolicy.DROP_NEWEST, [(seq, True) for seq in range(10)]
+        )
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+        self.assertEqual(queue.dropped, 5)
+
+    async def test_keyframe_preserving(self):
+        # GOPs of 3 frames, I frames at 0, 3, 6, 9
+        frames = [(seq, seq % 3 == 0) for seq in range(12)]
+        received, queue = await self.run_slow_subscriber(MIoTCameraQueuePolicy.KEYFRAME_PRESERVING, frames)
+        # Whole GOPs are dropped from the head, delivery resumes on an I frame
+        self.assertEqual(received, [0, 9, 10, 11])
+        self.assertEqual(queue.dropped, 8)
+
+    async def test_block(self):
+        received = []
+
+        async def on_frame(seq):
+            await asyncio.sleep(0.001)
+            received.append(seq)
+
+        queue = MIoTSubscriberQueue(callback=on_frame, maxsize=2, policy=MIoTCameraQueuePolicy.BLOCK)
+        queue.start()
+        for seq in range(10):
+            await queue.put((seq,))
+            self.assertLessEqual(queue.pending, 2)
+        for _ in range(100):
+            if len(received) == 10:
+                break
+            await asyncio.sleep(0.01)
+        queue.close()
+        self.assertEqual(received, list(range(10)))
+        self.assertEqual(queue.dropped, 0)
+
+    async def test_block_backlog(self):
+        received = []
+        release = asyncio.Event()
+
+        async def on_frame(seq):
+            await release.wait()
+            received.append(seq)
+
+        queue = MIoTSubscriberQueue(callback=on_frame, maxsize=2, policy=MIoTCameraQueuePolicy.BLOCK)
+        queue.start()
+        queue.put_nowait((0,))
+        await asyncio.sleep(0)
+        # Never waits, 2 queued, 2 in the backlog, the newest dropped beyond
+        for seq in range(1, 8):
+            queue.put_nowait((seq,))
+        self.assertEqual(queue.pending, 4)
+        self.assertEqual((queue.dropped, queue.overflowed), (3, 3))
+        release.set()
+        for _ in range(100):
+            if not queue.pending:
+                break
+            await asyncio.sleep(0.01)
+        queue.close()
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+
+    async def test_pull(self):
+        queue = MIoTSubscriberQueue(maxsize=3, policy=MIoTCameraQueuePolicy.DROP_OLDEST)
+        queue.start()
+        for seq in range(5):
+            await queue.put((seq,))
+        self.assertEqual([await queue.get() for _ in range(3)], [(2,), (3,), (4,)])
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(queue.delivered, 3)
+
+        getter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        await queue.put((5,))
+        self.assertEqual(await getter, (5,))
+
+        # Closing wakes a waiting puller, nothing is queued afterwards
+        getter = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        queue.close()
+        self.assertIsNone(await getter)
+        await queue.put((6,))
+        self.assertEqual(queue.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from test_decoder import gen_h264_frames
+from test_replay import make_camera_info
+
+from miloco_sdk.plugin.miot.camera import MIoTCamera
+from miloco_sdk.plugin.miot.fleet import MIoTCameraFleet
+from miloco_sdk.plugin.miot.replay import MIoTCameraReplayLib, MIoTCameraReplaySource
+from miloco_sdk.utils.types import MIoTCameraFleetState, MIoTCameraVideoQuality
+
+
+class CountingReplayLib(MIoTCameraReplayLib):
+    """Replay lib recording the peak of concurrent connects."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.connecting = 0
+        self.peak = 0
+
+    def miot_camera_start(self, c_instance, config):
+        with self.lock:
+            self.connecting += 1
+            self.peak = max(self.peak, self.connecting)
+        try:
+            return super().miot_camera_start(c_instance, config)
+        finally:
+            with self.lock:
+                self.connecting -= 1
+
+
+class TestMIoTCameraFleet(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrency_limited_start(self):
+        source = MIoTCameraReplaySource(gen_h264_frames(count=10, gop=5))
+        dids = [str(index) for index in range(12)]
+        # The last camera has no stream and never connects
+        lib = CountingReplayLib({did: source for did in dids[:-1]}, connect_delay=0.1)
+        miot_camera = MIoTCamera(cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0)
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        fleet = MIoTCameraFleet(miot_camera, max_concurrency=4, start_jitter=0.02)
+        created = []
+
+        async def on_created(camera):
+            created.append(camera.camera_info.did)
+
+        start = time.monotonic()
+        members = await fleet.start_async(
+            [make_camera_info(did) for did in dids],
+            qualities={"0": MIoTCameraVideoQuality.HIGH},
+            on_created=on_created,
+            enable_reconnect=True,
+        )
+        elapsed = time.monotonic() - start
+        self.assertLessEqual(lib.peak, 4)
+        # 12 connects of 0.1 s, 4 at a time
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(sorted(created), sorted(dids))
+        self.assertEqual(members["0"].quality, MIoTCameraVideoQuality.HIGH)
+        for did in dids[:-1]:
+            self.assertEqual(members[did].state, MIoTCameraFleetState.CONNECTED)
+            self.assertEqual(members[did].connects, 1)
+        self.assertEqual(members[dids[-1]].state, MIoTCameraFleetState.DISCONNECTED)
+
+        lib.disconnect("1")
+        await fleet.stop_async(["2"])
+        # Status changes are handed over by the dispatcher
+        for _ in range(50):
+            if fleet.members["1"].state == MIoTCameraFleetState.DISCONNECTED:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(fleet.members["1"].disconnects, 1)
+        self.assertEqual(fleet.members["2"].state, MIoTCameraFleetState.STOPPED)
+        self.assertNotIn("2", miot_camera.camera_map)
+        await fleet.stop_async()
+        self.assertEqual(miot_camera.camera_map, {})
+
+    async def test_native_executor_bound(self):
+        source = MIoTCameraReplaySource(gen_h264_frames(count=10, gop=5))
+        dids = [str(index) for index in range(6)]
+        lib = CountingReplayLib({did: source for did in dids}, connect_delay=0.05)
+        miot_camera = MIoTCamera(
+            cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0, native_workers=2
+        )
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        fleet = MIoTCameraFleet(miot_camera, max_concurrency=6, start_jitter=0)
+        members = await fleet.start_async([make_camera_info(did) for did in dids])
+        self.assertEqual(lib.peak, 2)
+        for did in dids:
+            self.assertEqual(members[did].state, MIoTCameraFleetState.CONNECTED)
+
+        stats = {item.stage: item for item in await miot_camera.get_pipeline_stats_async("0")}
+        start_stats = stats["native.miot_camera_start"]
+        self.assertEqual(start_stats.count, 6)
+        self.assertEqual(start_stats.pending, 0)
+        # 3 rounds of 2 connects of 50 ms, waits of 0, 50 and 100 ms
+        self.assertGreater(start_stats.avg_wait, 30)
+        self.assertGreater(start_stats.avg_latency, 40)
+        self.assertEqual(miot_camera.native_executor.pending, 0)
+        self.assertEqual(miot_camera.native_executor.active, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
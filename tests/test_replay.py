@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+cur_path = os.path.abspath(__file__)
+parent = os.path.dirname
+sys.path.insert(0, parent(parent(cur_path)))
+
+from test_decoder import gen_h264_frames
+
+from miloco_sdk.plugin.miot.camera import MIoTCamera, MIoTCameraReconnectLimiter, format_prometheus_stats
+from miloco_sdk.plugin.miot.replay import MIoTCameraReplayLib, MIoTCameraReplaySource, dump_frames, load_frames
+from miloco_sdk.utils.types import MIoTCameraQueuePolicy, MIoTCameraStatus, MIoTCameraStreamKind
+
+
+def make_camera_info(did):
+    return {
+        "did": did,
+        "name": f"camera {did}",
+        "uid": "1",
+        "urn": "urn:miot-spec-v2:device:camera:0000A01C:test:1",
+        "model": "test.camera.v1",
+        "manufacturer": "test",
+        "connect_type": 0,
+        "pid": 0,
+        "token": "",
+        "online": True,
+        "voice_ctrl": 0,
+        "order_time": 0,
+        "channel_count": 1,
+        "camera_status": MIoTCameraStatus.DISCONNECTED,
+    }
+
+
+class TestMIoTCameraReplaySource(unittest.TestCase):
+
+    def test_frame_file(self):
+        frames = gen_h264_frames(count=10, gop=5)
+        with tempfile.TemporaryDirectory() as path:
+            dump_frames(os.path.join(path, "camera.miot"), frames)
+            loaded = load_frames(os.path.join(path, "camera.miot"))
+        self.assertEqual(frames, loaded)
+
+        source = MIoTCameraReplaySource(loaded)
+        self.assertEqual(source.duration, 400)
+        # The second loop keeps the sequences and the timing increasing
+        frame, buf, offset = source.get(12)
+        self.assertEqual(frame.sequence, 12)
+        self.assertEqual(offset, 480)
+        self.assertEqual(bytes(buf), frames[2].data)
+
+
+class TestMIoTCameraReplayLib(unittest.IsolatedAsyncioTestCase):
+
+    async def test_replay_cameras(self):
+        lib = MIoTCameraReplayLib(MIoTCameraReplaySource(gen_h264_frames(count=20, gop=10)), connect_delay=0.01)
+        miot_camera = MIoTCamera(cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0)
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        statuses = {}
+        raw = {}
+        jpegs = {}
+
+        async def on_status(did, status):
+            statuses.setdefault(did, []).append(status)
+
+        async def on_raw_video(did, data, ts, seq, channel):
+            raw.setdefault(did, []).append(seq)
+
+        async def on_jpeg(did, data, ts, channel):
+            jpegs[did] = jpegs.get(did, 0) + 1
+
+        for did in ("1", "2", "3"):
+            camera = await miot_camera.create_camera_async(make_camera_info(did), frame_interval=200)
+            await camera.register_status_changed_async(on_status)
+            await camera.register_raw_video_async(on_raw_video)
+            await camera.register_decode_jpg_async(on_jpeg)
+            await camera.start_async()
+        await asyncio.sleep(1.2)
+        self.assertEqual(await miot_camera.camera_map["1"].get_status_async(), MIoTCameraStatus.CONNECTED)
+
+        lib.disconnect("1")
+        await asyncio.sleep(0.1)
+        for did in ("1", "2", "3"):
+            self.assertEqual(statuses[did][:2], [MIoTCameraStatus.CONNECTING, MIoTCameraStatus.CONNECTED])
+            # 25 fps, the first loop of 20 frames is done
+            self.assertGreater(len(raw[did]), 20)
+            self.assertEqual(raw[did], list(range(len(raw[did]))))
+            self.assertGreater(jpegs[did], 3)
+        self.assertEqual(statuses["1"][-1], MIoTCameraStatus.DISCONNECTED)
+        self.assertEqual(statuses["2"][-1], MIoTCameraStatus.CONNECTED)
+
+    async def test_stream_stats(self):
+        frames = gen_h264_frames(count=20, gop=10)
+        # Frame 15 is lost in every loop
+        lib = MIoTCameraReplayLib(MIoTCameraReplaySource(frames[:15] + frames[16:]), connect_delay=0.01)
+        miot_camera = MIoTCamera(cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0)
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        camera = await miot_camera.create_camera_async(make_camera_info("1"), frame_interval=200)
+
+        async def on_jpeg(did, data, ts, channel):
+            pass
+
+        async def on_resync(did, seq, lost, channel):
+            resyncs.append((did, seq % 20, lost))
+
+        resyncs = []
+        await miot_camera.register_resync_async("1", on_resync)
+        # An event callback does not consume the stream
+        self.assertFalse(camera.has_subscribers)
+        await camera.register_decode_jpg_async(on_jpeg)
+        await camera.start_async()
+        await asyncio.sleep(1.5)
+        stats = await miot_camera.get_stats_async("1")
+        self.assertEqual(len(stats), 1)
+        video = stats[0]
+        self.assertEqual(video.kind, MIoTCameraStreamKind.RAW_VIDEO)
+        # 25 fps less the lost frame
+        self.assertGreater(video.fps, 18)
+        self.assertLess(video.fps, 30)
+        self.assertGreater(video.bitrate, 0)
+        self.assertGreaterEqual(video.seq_gaps, 1)
+        self.assertEqual(video.seq_reorders, 0)
+        self.assertAlmostEqual(video.key_interval, 400, delta=20)
+        self.assertLess(video.avg_latency, 200)
+        self.assertGreater(video.avg_decode, 0)
+        # The P frames after the lost one wait for the next loop
+        self.assertEqual(resyncs[0], ("1", 16, 1))
+        self.assertEqual(video.resyncs, len(resyncs))
+
+        text = await miot_camera.get_prometheus_stats_async()
+        self.assertIn("# TYPE miot_camera_stream_frames_total counter", text)
+        self.assertIn('miot_camera_stream_seq_gaps_total{did="1",channel="0",kind="raw_video"} ', text)
+        self.assertIn('did="a\\"b"', format_prometheus_stats({'a"b': stats}))
+
+    async def test_no_resync_after_resubscribe(self):
+        lib = MIoTCameraReplayLib(MIoTCameraReplaySource(gen_h264_frames(count=20, gop=10)), connect_delay=0.01)
+        miot_camera = MIoTCamera(cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0)
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        camera = await miot_camera.create_camera_async(make_camera_info("1"), frame_interval=100)
+        resyncs = []
+        jpegs = []
+
+        async def on_resync(did, seq, lost, channel):
+            resyncs.append((seq, lost))
+
+        async def on_jpeg(did, data, ts, channel):
+            jpegs.append(ts)
+
+        async def on_raw_video(did, data, ts, seq, channel):
+            pass
+
+        await camera.register_resync_async(on_resync)
+        # Keeps the raw data flowing while the decoder is not fed
+        await camera.register_raw_video_async(on_raw_video)
+        await camera.register_decode_jpg_async(on_jpeg)
+        await camera.start_async()
+        await asyncio.sleep(0.5)
+        await camera.unregister_decode_jpg_async()
+        await asyncio.sleep(0.5)
+        received = len(jpegs)
+        await camera.register_decode_jpg_async(on_jpeg)
+        await asyncio.sleep(0.5)
+
+        # The frames skipped while nobody decodes are no loss
+        self.assertGreater(len(jpegs), received)
+        self.assertEqual(resyncs, [])
+        video = camera.get_stats()[0]
+        self.assertEqual((video.seq_gaps, video.resyncs), (0, 0))
+
+    async def test_block_subscriber_does_not_stall_others(self):
+        lib = MIoTCameraReplayLib(MIoTCameraReplaySource(gen_h264_frames(count=20, gop=10)), connect_delay=0.01)
+        miot_camera = MIoTCamera(cloud_server="cn", access_token="token", lib_miot_camera=lib, encode_workers=0)
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        camera = await miot_camera.create_camera_async(make_camera_info("1"), frame_interval=100)
+        slow = []
+        jpegs = []
+
+        async def on_raw_video(did, data, ts, seq, channel):
+            await asyncio.sleep(0.5)
+            slow.append(seq)
+
+        async def on_jpeg(did, data, ts, channel):
+            jpegs.append(ts)
+
+        await camera.register_raw_video_async(on_raw_video, queue_size=2, queue_policy=MIoTCameraQueuePolicy.BLOCK)
+        await camera.register_decode_jpg_async(on_jpeg)
+        await camera.start_async()
+        await asyncio.sleep(1.5)
+        # 10 fps of jpeg while the raw subscriber takes 0.5 s a frame
+        self.assertGreater(len(jpegs), 8)
+        self.assertLessEqual(len(slow), 3)
+        self.assertEqual(slow, sorted(slow))
+        self.assertLess(camera._dispatcher.pending, 10)
+        raw_stats = [item for item in camera.get_subscriber_stats() if item.reg_key == "raw_video.0"][0]
+        self.assertLessEqual(raw_stats.pending, 4)
+        self.assertGreater(raw_stats.overflowed, 0)
+        self.assertGreaterEqual(raw_stats.dropped, raw_stats.overflowed)
+
+
+class TestMIoTCameraReconnect(unittest.IsolatedAsyncioTestCase):
+
+    async def test_limiter_priority(self):
+        limiter = MIoTCameraReconnectLimiter(rate=20, burst=1)
+        order = []
+
+        async def reconnect(name, priority):
+            await limiter.acquire_async(priority=priority)
+            order.append((name, time.monotonic()))
+
+        await reconnect("first", 0)
+        await asyncio.gather(reconnect("idle", 0), reconnect("subscribed", 1), reconnect("idle2", 0))
+        self.assertEqual([name for name, _ in order], ["first", "subscribed", "idle", "idle2"])
+        # One token each 50 ms
+        self.assertGreater(order[-1][1] - order[0][1], 0.12)
+
+        task = asyncio.create_task(reconnect("cancelled", 0))
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(limiter.waiting, 0)
+
+    async def test_reconnect_storm(self):
+        lib = MIoTCameraReplayLib(MIoTCameraReplaySource(gen_h264_frames(count=10, gop=5)), connect_delay=0.01)
+        miot_camera = MIoTCamera(
+            cloud_server="cn",
+            access_token="token",
+            lib_miot_camera=lib,
+            encode_workers=0,
+            reconnect_rate=5,
+            reconnect_burst=1,
+        )
+        self.addAsyncCleanup(miot_camera.deinit_async)
+        dids = [str(index) for index in range(6)]
+        subscribed = set(dids[3:])
+        reconnected = []
+
+        async def on_status(did, status):
+            if status == MIoTCameraStatus.CONNECTED:
+                reconnected.append(did)
+
+        async def on_raw_video(did, data, ts, seq, channel):
+            pass
+
+        # Backoff ceiling of the first retry 0.1 s, the successful start resets the backoff
+        patcher = mock.patch("miloco_sdk.plugin.miot.camera.CAMERA_RECONNECT_TIME_MIN", 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for did in dids:
+            camera = await miot_camera.create_camera_async(make_camera_info(did))
+            if did in subscribed:
+                await camera.register_raw_video_async(on_raw_video)
+            await camera.start_async(enable_reconnect=True)
+        await asyncio.sleep(0.2)
+        for did in dids:
+            await miot_camera.camera_map[did].register_status_changed_async(on_status)
+
+        for did in dids:
+            lib.disconnect(did)
+        for _ in range(40):
+            if len(reconnected) == len(dids):
+                break
+            await asyncio.sleep(0.05)
+        self.assertEqual(sorted(reconnected), dids)
+        # A token each 200 ms, the first retry may take the burst token, the subscribed cameras come next
+        self.assertTrue(subscribed.issubset(reconnected[:4]))
+
+
+if __name__ == "__main__":
+    unittest.main()